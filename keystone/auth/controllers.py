@@ -374,11 +374,56 @@ class Auth(controller.V3Controller):
             del token_data['token']['catalog']
         return render_token_data_response(token_id, token_data)
 
+    @controller.protected()
+    def validate_tokens(self, context, token_ids=None):
+        """Validate a batch of tokens.
+
+        Returns, in the order of the given token ids, whether each token is
+        valid and, for the valid tokens, when they expire and their scope.
+
+        """
+        if (not isinstance(token_ids, list) or
+                len(token_ids) > CONF.token.max_batch_size):
+            raise exception.ValidationError(attribute='token_ids',
+                                            target='request')
+        for token_id in token_ids:
+            if (not isinstance(token_id, basestring) or
+                    len(token_id) > CONF.max_token_size):
+                raise exception.ValidationError(attribute='token_ids',
+                                                target='request')
+
+        tokens = self.token_provider_api.validate_tokens(token_ids)
+        body = {'tokens': [render_token_validity(token_id, token_data)
+                           for token_id, token_data in zip(token_ids,
+                                                           tokens)]}
+        # NOTE: nothing is created, do not answer 201 as V3 POSTs do.
+        return wsgi.render_response(body=body, status=(200, 'OK'))
+
     @controller.protected()
     def revocation_list(self, context, auth=None):
         return self.token_controllers_ref.revocation_list(context, auth)
 
 
+def render_token_validity(token_id, token_data):
+    """Summarize the validity, expiry and scope of a V2 or V3 token."""
+    if token_data is None:
+        return {'id': token_id, 'valid': False}
+
+    validity = {'id': token_id, 'valid': True}
+    if 'token' in token_data:
+        token_data = token_data['token']
+        validity['expires_at'] = token_data['expires_at']
+        for scope in ('project', 'domain', 'OS-TRUST:trust'):
+            if scope in token_data:
+                validity[scope] = token_data[scope]
+    else:
+        token_data = token_data['access']['token']
+        validity['expires_at'] = token_data['expires']
+        if 'tenant' in token_data:
+            validity['project'] = token_data['tenant']
+    return validity
+
+
 #FIXME(gyee): not sure if it belongs here or keystone.common. Park it here
 # for now.
 def render_token_data_response(token_id, token_data, created=False):
@@ -25,6 +25,12 @@ class Catalog(kvs.Base, catalog.Driver):
     def get_catalog(self, user_id, tenant_id, metadata=None):
         return self.db.get('catalog-%s-%s' % (tenant_id, user_id))
 
+    def get_catalog_version(self):
+        return self.db.setdefault('catalog_version', 0)
+
+    def _bump_version(self):
+        self.db['catalog_version'] = self.get_catalog_version() + 1
+
     # service crud
 
     def create_service(self, service_id, service):
@@ -32,6 +38,7 @@ class Catalog(kvs.Base, catalog.Driver):
         service_list = set(self.db.get('service_list', []))
         service_list.add(service_id)
         self.db.set('service_list', list(service_list))
+        self._bump_version()
         return service
 
     def list_services(self):
@@ -42,6 +49,7 @@ class Catalog(kvs.Base, catalog.Driver):
 
     def update_service(self, service_id, service):
         self.db.set('service-%s' % service_id, service)
+        self._bump_version()
         return service
 
     def delete_service(self, service_id):
@@ -54,6 +62,7 @@ class Catalog(kvs.Base, catalog.Driver):
         service_list = set(self.db.get('service_list', []))
         service_list.remove(service_id)
         self.db.set('service_list', list(service_list))
+        self._bump_version()
 
     # endpoint crud
 
@@ -63,6 +72,7 @@ class Catalog(kvs.Base, catalog.Driver):
         endpoint_list = set(self.db.get('endpoint_list', []))
         endpoint_list.add(endpoint_id)
         self.db.set('endpoint_list', list(endpoint_list))
+        self._bump_version()
         return endpoint
 
     def list_endpoints(self):
@@ -73,6 +83,7 @@ class Catalog(kvs.Base, catalog.Driver):
 
     def update_endpoint(self, endpoint_id, endpoint):
         self.db.set('endpoint-%s' % endpoint_id, endpoint)
+        self._bump_version()
         return endpoint
 
     def delete_endpoint(self, endpoint_id):
@@ -80,6 +91,7 @@ class Catalog(kvs.Base, catalog.Driver):
         endpoint_list = set(self.db.get('endpoint_list', []))
         endpoint_list.remove(endpoint_id)
         self.db.set('endpoint_list', list(endpoint_list))
+        self._bump_version()
 
     # Private interface
     def _create_catalog(self, user_id, tenant_id, data):
@@ -25,6 +25,8 @@ from keystone import exception
 
 CONF = config.CONF
 
+CATALOG_SEQUENCE = 'catalog'
+
 
 class Service(sql.ModelBase, sql.DictBase):
     __tablename__ = 'service'
@@ -54,6 +56,15 @@ class Catalog(sql.Base, catalog.Driver):
     def db_sync(self, version=None):
         migration.db_sync(version=version)
 
+    # NOTE: the version of the catalog is a sequence moved forward within the
+    # transaction of every change.
+    def get_catalog_version(self):
+        session = self.get_session()
+        return sql.get_sequence_value(session, CATALOG_SEQUENCE)
+
+    def _bump_version(self, session):
+        sql.next_sequence_value(session, CATALOG_SEQUENCE)
+
     # Services
     def list_services(self):
         session = self.get_session()
@@ -76,6 +87,7 @@ class Catalog(sql.Base, catalog.Driver):
             ref = self._get_service(session, service_id)
             session.query(Endpoint).filter_by(service_id=service_id).delete()
             session.delete(ref)
+            self._bump_version(session)
             session.flush()
 
     def create_service(self, service_id, service_ref):
@@ -83,6 +95,7 @@ class Catalog(sql.Base, catalog.Driver):
         with session.begin():
             service = Service.from_dict(service_ref)
             session.add(service)
+            self._bump_version(session)
             session.flush()
         return service.to_dict()
 
@@ -97,6 +110,7 @@ class Catalog(sql.Base, catalog.Driver):
                 if attr != 'id':
                     setattr(ref, attr, getattr(new_service, attr))
             ref.extra = new_service.extra
+            self._bump_version(session)
             session.flush()
         return ref.to_dict()
 
@@ -107,6 +121,7 @@ class Catalog(sql.Base, catalog.Driver):
         new_endpoint = Endpoint.from_dict(endpoint_ref)
         with session.begin():
             session.add(new_endpoint)
+            self._bump_version(session)
             session.flush()
         return new_endpoint.to_dict()
 
@@ -115,6 +130,7 @@ class Catalog(sql.Base, catalog.Driver):
         with session.begin():
             ref = self._get_endpoint(session, endpoint_id)
             session.delete(ref)
+            self._bump_version(session)
             session.flush()
 
     def _get_endpoint(self, session, endpoint_id):
@@ -143,6 +159,7 @@ class Catalog(sql.Base, catalog.Driver):
                 if attr != 'id':
                     setattr(ref, attr, getattr(new_endpoint, attr))
             ref.extra = new_endpoint.extra
+            self._bump_version(session)
             session.flush()
         return ref.to_dict()
 
@@ -19,6 +19,7 @@ import uuid
 
 from keystone.common import controller
 from keystone.common import dependency
+from keystone.common import wsgi
 from keystone import exception
 
 
@@ -142,13 +143,17 @@ class ServiceV3(controller.V3Controller):
 
     @controller.filterprotected('type')
     def list_services(self, context, filters):
-        refs = self.catalog_api.list_services()
-        return ServiceV3.wrap_collection(context, refs, filters)
+        return wsgi.render_conditional_response(
+            context, self.catalog_api.get_catalog_version(),
+            lambda: ServiceV3.wrap_collection(
+                context, self.catalog_api.list_services(), filters))
 
     @controller.protected()
     def get_service(self, context, service_id):
-        ref = self.catalog_api.get_service(service_id)
-        return ServiceV3.wrap_member(context, ref)
+        return wsgi.render_conditional_response(
+            context, self.catalog_api.get_catalog_version(),
+            lambda: ServiceV3.wrap_member(
+                context, self.catalog_api.get_service(service_id)))
 
     @controller.protected()
     def update_service(self, context, service_id, service):
@@ -194,13 +199,17 @@ class EndpointV3(controller.V3Controller):
 
     @controller.filterprotected('interface', 'service_id')
     def list_endpoints(self, context, filters):
-        refs = self.catalog_api.list_endpoints()
-        return EndpointV3.wrap_collection(context, refs, filters)
+        return wsgi.render_conditional_response(
+            context, self.catalog_api.get_catalog_version(),
+            lambda: EndpointV3.wrap_collection(
+                context, self.catalog_api.list_endpoints(), filters))
 
     @controller.protected()
     def get_endpoint(self, context, endpoint_id):
-        ref = self.catalog_api.get_endpoint(endpoint_id)
-        return EndpointV3.wrap_member(context, ref)
+        return wsgi.render_conditional_response(
+            context, self.catalog_api.get_catalog_version(),
+            lambda: EndpointV3.wrap_member(
+                context, self.catalog_api.get_endpoint(endpoint_id)))
 
     @controller.protected()
     def update_endpoint(self, context, endpoint_id, endpoint):
@@ -68,6 +68,18 @@ class Manager(manager.Manager):
     def __init__(self):
         super(Manager, self).__init__(CONF.catalog.driver)
 
+    def get_catalog_version(self):
+        """Returns the version of the catalog, or None when the backend
+        keeps none.
+
+        The version is read from the backend on every call rather than
+        cached, so that all the processes agree on it.
+        """
+        try:
+            return self.driver.get_catalog_version()
+        except exception.NotImplemented:
+            return None
+
     def get_service(self, service_id):
         try:
             return self.driver.get_service(service_id)
@@ -261,3 +273,14 @@ class Driver(object):
 
         """
         raise exception.NotImplemented()
+
+    def get_catalog_version(self):
+        """Returns the version of the catalog, which changes whenever a
+        service or an endpoint is created, updated or deleted.
+
+        :returns: the version, the same in every process sharing the backend
+        :raises: keystone.exception.NotImplemented when the backend keeps no
+                 version
+
+        """
+        raise exception.NotImplemented()
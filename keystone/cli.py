@@ -16,6 +16,8 @@
 
 from __future__ import absolute_import
 
+import datetime
+import gzip
 import os
 
 from migrate import exceptions
@@ -29,6 +31,7 @@ from keystone.common import utils
 from keystone import config
 from keystone import contrib
 from keystone.openstack.common import importutils
+from keystone import quota
 from keystone import token
 
 CONF = config.CONF
@@ -183,17 +186,84 @@ class TokenFlush(BaseApp):
     name = 'token_flush'
 
     @classmethod
-    def main(cls):
+    def add_argument_parser(cls, subparsers):
+        parser = super(TokenFlush, cls).add_argument_parser(subparsers)
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help=('Number of expired tokens deleted at '
+                                  'once. Defaults to the flush_batch_size '
+                                  'option of the [token] section, 0 deletes '
+                                  'all of them at once.'))
+        return parser
+
+    @staticmethod
+    def main():
+        def progress(flushed):
+            print(_('Flushed %d expired tokens...') % flushed)
+
+        token_manager = token.Manager()
+        flushed = token_manager.driver.flush_expired_tokens(
+            CONF.command.batch_size, progress)
+        print(_('Flushed %d expired tokens.') % flushed)
+
+
+class TokenPartition(BaseApp):
+    """Create the token partitions covering the token lifetime."""
+
+    name = 'token_partition'
+
+    @staticmethod
+    def main():
         token_manager = token.Manager()
-        token_manager.driver.flush_expired_tokens()
+        for name in token_manager.driver.create_partitions():
+            print(_('Created token partition %s.') % name)
+
+
+class QuotaHistoryArchive(BaseApp):
+    """Move old quota history records to a compressed file."""
+
+    name = 'quota_history_archive'
+
+    @classmethod
+    def add_argument_parser(cls, subparsers):
+        parser = super(QuotaHistoryArchive,
+                       cls).add_argument_parser(subparsers)
+        parser.add_argument('--days', type=int, default=90,
+                            help=('Archive the quota history records older '
+                                  'than this number of days.'))
+        parser.add_argument('--output', required=True,
+                            help=('Path of the gzip compressed file the '
+                                  'records are written to, one JSON object '
+                                  'per line.'))
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help=('Number of records read and deleted at '
+                                  'once. Defaults to the '
+                                  'history_archive_batch_size option of the '
+                                  '[quota] section.'))
+        return parser
+
+    @staticmethod
+    def main():
+        before = (datetime.datetime.now() -
+                  datetime.timedelta(days=CONF.command.days))
+        quota_manager = quota.Manager()
+        stream = gzip.open(CONF.command.output, 'ab')
+        try:
+            archived = quota_manager.archive_quota_history(
+                stream, before, CONF.command.batch_size)
+        finally:
+            stream.close()
+        print(_('Archived %(count)d quota history records to %(output)s.') %
+              {'count': archived, 'output': CONF.command.output})
 
 
 CMDS = [
     DbSync,
     DbVersion,
     PKISetup,
+    QuotaHistoryArchive,
     SSLSetup,
     TokenFlush,
+    TokenPartition,
 ]
 
 
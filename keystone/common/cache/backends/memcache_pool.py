@@ -0,0 +1,33 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+from dogpile.cache.backends import memcached
+
+from keystone.common.cache import memcache_pool
+
+
+class PooledMemcachedBackend(memcached.MemcachedBackend):
+    """Memcached backend checking its clients out of a shared pool.
+
+    ``dogpile.cache.memcached`` keeps a client per thread, that is per green
+    thread under eventlet. This backend bounds the clients to the pool of the
+    ``url`` servers instead, which is shared with the memcache token driver
+    when they use the same servers.
+    """
+
+    @property
+    def client(self):
+        return memcache_pool.get_client(self.url)
@@ -17,6 +17,7 @@
 """Keystone Caching Layer Implementation."""
 
 import dogpile.cache
+from dogpile.cache import api
 from dogpile.cache import proxy
 from dogpile.cache import util
 
@@ -36,6 +37,11 @@ dogpile.cache.register_backend(
     'keystone.common.cache.backends.noop',
     'NoopCacheBackend')
 
+dogpile.cache.register_backend(
+    'keystone.common.cache.memcache_pool',
+    'keystone.common.cache.backends.memcache_pool',
+    'PooledMemcachedBackend')
+
 
 class DebugProxy(proxy.ProxyBackend):
     """Extra Logging ProxyBackend."""
@@ -197,6 +203,50 @@ def function_key_generator(namespace, fn, to_str=key_generate_to_str):
     return util.function_key_generator(namespace, fn, to_str=to_str)
 
 
+def cache_on_arguments(region, namespace=None, expiration_time=None,
+                       should_cache_fn=None):
+    """Build a caching decorator for the given region.
+
+    The decorator behaves as the region's ``cache_on_arguments`` decorator
+    and adds a ``get_multi`` method to the decorated function. ``get_multi``
+    takes a list of argument tuples, the way the decorated function is
+    called, and returns the cached results in one round trip to the cache
+    backend, with ``NO_VALUE`` for the results which are not cached. e.g.:
+
+        @cache.on_arguments(should_cache_fn=SHOULD_CACHE)
+        def function(self, arg):
+            ...
+
+        values = self.function.get_multi([(self, 'a'), (self, 'b')])
+
+    :param region: the dogpile.cache region to cache the results in
+    :returns: decorator
+    """
+    decorator = region.cache_on_arguments(namespace=namespace,
+                                          expiration_time=expiration_time,
+                                          should_cache_fn=should_cache_fn)
+
+    def wrap(fn):
+        decorated = decorator(fn)
+        key_generator = region.function_key_generator(namespace, fn)
+
+        def get_multi(args_list):
+            keys = [key_generator(*args) for args in args_list]
+            if not keys:
+                return []
+            return region.get_multi(keys, expiration_time=expiration_time)
+
+        decorated.get_multi = get_multi
+        return decorated
+    return wrap
+
+
+def on_arguments(namespace=None, expiration_time=None, should_cache_fn=None):
+    return cache_on_arguments(REGION, namespace=namespace,
+                              expiration_time=expiration_time,
+                              should_cache_fn=should_cache_fn)
+
+
 REGION = dogpile.cache.make_region(
     function_key_generator=function_key_generator)
-on_arguments = REGION.cache_on_arguments
+NO_VALUE = api.NO_VALUE
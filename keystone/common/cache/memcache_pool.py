@@ -0,0 +1,190 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Bounded pool of memcache clients shared by the memcache consumers.
+
+The memcache client library for python is not thread safe, its compare and
+set state is kept per client. Each operation checks a client out of the pool
+and returns it once done, so that at most ``[memcache] pool_maxsize`` clients
+are connected per process whatever the number of green threads, and a client
+is never used by two green threads at once.
+
+"""
+
+from __future__ import absolute_import
+import collections
+import contextlib
+import threading
+import time
+
+import memcache
+
+from keystone import config
+from keystone import exception
+from keystone.openstack.common import log as logging
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(object):
+    """Bounded pool of connections, created when first needed.
+
+    Keeps the pool-wait metrics returned by stats().
+    """
+
+    def __init__(self, maxsize, get_timeout):
+        self.maxsize = maxsize
+        self.get_timeout = get_timeout
+        self._free = collections.deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {'created': 0,
+                       'acquired': 0,
+                       'waited': 0,
+                       'wait_time': 0.0,
+                       'max_wait_time': 0.0,
+                       'timeouts': 0}
+
+    def _create_connection(self):
+        raise exception.NotImplemented()
+
+    def _get(self):
+        start = time.time()
+        create = False
+        blocked = False
+        with self._cond:
+            while not self._free and self._size >= self.maxsize:
+                blocked = True
+                remaining = self.get_timeout - (time.time() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    msg = _('Unable to get a connection from the pool '
+                            'within %(timeout)s seconds, %(size)d are '
+                            'in use.')
+                    raise exception.UnexpectedError(
+                        msg % {'timeout': self.get_timeout,
+                               'size': self._size})
+                self._cond.wait(remaining)
+
+            self._stats['acquired'] += 1
+            if self._free:
+                connection = self._free.pop()
+            else:
+                self._size += 1
+                self._stats['created'] += 1
+                create = True
+            if blocked:
+                waited = time.time() - start
+                self._stats['waited'] += 1
+                self._stats['wait_time'] += waited
+                self._stats['max_wait_time'] = max(
+                    self._stats['max_wait_time'], waited)
+                LOG.debug(_('Waited %(waited).3f seconds for a connection '
+                            'from the pool.'), {'waited': waited})
+
+        if create:
+            try:
+                connection = self._create_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return connection
+
+    def _put(self, connection):
+        with self._cond:
+            self._free.append(connection)
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Checks a connection out of the pool for the block."""
+        connection = self._get()
+        try:
+            yield connection
+        finally:
+            self._put(connection)
+
+    def stats(self):
+        """Returns the pool-wait metrics of the pool.
+
+        created, acquired, waited and timeouts count the connections created,
+        the check outs, the check outs which waited for a connection to be
+        returned and the ones which gave up; wait_time and max_wait_time are
+        in seconds. size and free are the current numbers of connections.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['free'] = len(self._free)
+        return stats
+
+
+class MemcacheClientPool(ConnectionPool):
+    def __init__(self, servers, maxsize, get_timeout):
+        super(MemcacheClientPool, self).__init__(maxsize, get_timeout)
+        self.servers = servers
+
+    def _create_connection(self):
+        return memcache.Client(self.servers, debug=0, cache_cas=True)
+
+
+class PooledClient(object):
+    """Memcache client checking a client out of a pool for each operation.
+
+    Operations which must run on the same client, such as gets() followed by
+    cas(), check one out with acquire() for their duration.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def __getattr__(self, name):
+        def operation(*args, **kwargs):
+            with self.pool.acquire() as client:
+                return getattr(client, name)(*args, **kwargs)
+        return operation
+
+
+def get_pool(servers):
+    """Returns the pool of memcache clients of the servers.
+
+    The pool is shared by every consumer of the same servers in the process.
+    """
+    key = tuple(servers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MemcacheClientPool(
+                list(servers),
+                maxsize=CONF.memcache.pool_maxsize,
+                get_timeout=CONF.memcache.pool_connection_get_timeout)
+            _pools[key] = pool
+        return pool
+
+
+def get_client(servers):
+    """Returns a client of the servers backed by their shared pool."""
+    return PooledClient(get_pool(servers))
@@ -14,7 +14,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import base64
+import collections
 import hashlib
+import os
+import threading
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.bindings.openssl import binding
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography import x509
+except ImportError:
+    x509 = None
 
 from keystone.common import environment
 from keystone.openstack.common import log as logging
@@ -23,9 +38,187 @@ from keystone.openstack.common import log as logging
 LOG = logging.getLogger(__name__)
 PKI_ANS1_PREFIX = 'MII'
 
+# DER encoded object identifiers of the signed CMS documents
+OID_SIGNED_DATA = '\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02'
+OID_DATA = '\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x07\x01'
+OID_SHA256 = '\x06\x09\x60\x86\x48\x01\x65\x03\x04\x02\x01'
+OID_RSA_ENCRYPTION = '\x06\x09\x2a\x86\x48\x86\xf7\x0d\x01\x01\x01'
+
+# number of verified documents remembered by each verification engine
+VERIFIED_CACHE_SIZE = 1000
+
+# functions of the OpenSSL binding of cryptography the verification engine
+# calls, later releases of cryptography no longer expose all of them
+BINDING_FUNCTIONS = ('X509_STORE_new', 'X509_STORE_free',
+                     'X509_STORE_load_locations', 'sk_X509_new_null',
+                     'sk_X509_num', 'sk_X509_value', 'sk_X509_push',
+                     'sk_X509_free', 'X509_free', 'PEM_read_bio_X509',
+                     'BIO_new', 'BIO_new_mem_buf', 'BIO_s_mem', 'BIO_free',
+                     'BIO_ctrl_pending', 'BIO_read', 'd2i_PKCS7_bio',
+                     'PKCS7_verify', 'PKCS7_free', 'ERR_get_error',
+                     'ERR_error_string_n', 'ERR_clear_error')
+
+
+class VerificationEngine(object):
+    """Verifies CMS documents in process, like ``openssl cms -verify``.
+
+    The signing certificates and the CA store are loaded once. The contents
+    of the most recently verified documents are remembered, keyed by the
+    hash of the document, so that a token seen again is not verified again.
+
+    :raises: ValueError if the certificates cannot be loaded or the
+             binding lacks a function.
+    """
+
+    def __init__(self, signing_cert_file_name, ca_file_name,
+                 cache_size=VERIFIED_CACHE_SIZE):
+        self._binding = binding.Binding()
+        ffi, lib = self._binding.ffi, self._binding.lib
+        missing = [name for name in BINDING_FUNCTIONS
+                   if not hasattr(lib, name)]
+        if missing:
+            raise ValueError('The OpenSSL binding lacks %s' %
+                             ', '.join(missing))
+
+        self.store = ffi.gc(lib.X509_STORE_new(), lib.X509_STORE_free)
+        if not lib.X509_STORE_load_locations(self.store, ca_file_name,
+                                             ffi.NULL):
+            raise ValueError(self._openssl_error())
+
+        def free_certs(certs):
+            for i in range(lib.sk_X509_num(certs)):
+                lib.X509_free(lib.sk_X509_value(certs, i))
+            lib.sk_X509_free(certs)
+
+        self.certs = ffi.gc(lib.sk_X509_new_null(), free_certs)
+        with open(signing_cert_file_name) as f:
+            pem = f.read()
+        bio = ffi.gc(lib.BIO_new_mem_buf(pem, len(pem)), lib.BIO_free)
+        while True:
+            cert = lib.PEM_read_bio_X509(bio, ffi.NULL, ffi.NULL, ffi.NULL)
+            if cert == ffi.NULL:
+                break
+            lib.sk_X509_push(self.certs, cert)
+        # reading past the last certificate leaves an error behind
+        lib.ERR_clear_error()
+        if not lib.sk_X509_num(self.certs):
+            raise ValueError('No certificate in %s' % signing_cert_file_name)
+
+        self.cache_size = cache_size
+        self._verified = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _openssl_error(self):
+        ffi, lib = self._binding.ffi, self._binding.lib
+        errors = []
+        buf = ffi.new('char[]', 256)
+        code = lib.ERR_get_error()
+        while code:
+            lib.ERR_error_string_n(code, buf, len(buf))
+            errors.append(ffi.string(buf))
+            code = lib.ERR_get_error()
+        return '\n'.join(errors)
+
+    def verify(self, der):
+        """Verifies a DER encoded CMS document, returning its content.
+
+        :raises: ValueError if the document cannot be verified
+        """
+        # NOTE: a cache hit is not verified again, the key must not collide.
+        digest = hashlib.sha256(der).digest()
+        with self._lock:
+            content = self._verified.pop(digest, None)
+            if content is not None:
+                self._verified[digest] = content
+                return content
+
+        ffi, lib = self._binding.ffi, self._binding.lib
+        bio = ffi.gc(lib.BIO_new_mem_buf(der, len(der)), lib.BIO_free)
+        p7 = lib.d2i_PKCS7_bio(bio, ffi.NULL)
+        if p7 == ffi.NULL:
+            raise ValueError(self._openssl_error())
+        p7 = ffi.gc(p7, lib.PKCS7_free)
+        out = ffi.gc(lib.BIO_new(lib.BIO_s_mem()), lib.BIO_free)
+        if lib.PKCS7_verify(p7, self.certs, self.store, ffi.NULL, out,
+                            0) != 1:
+            raise ValueError(self._openssl_error())
+        length = lib.BIO_ctrl_pending(out)
+        buf = ffi.new('char[]', length)
+        content = ffi.buffer(buf, lib.BIO_read(out, buf, length))[:]
+
+        with self._lock:
+            self._verified[digest] = content
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return content
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _get_engine(engine_class, *file_names):
+    """Returns the engine of a class loaded from the given files.
+
+    Engines are kept as long as the files are not modified, so that a
+    rotated certificate or key is picked up by the next call.
+
+    :returns: the engine, or None when no crypto binding is available,
+              the binding lacks a function the engine needs or the files
+              cannot be loaded by the engine.
+    """
+    if x509 is None:
+        return None
+    try:
+        mtimes = tuple(os.path.getmtime(name) for name in file_names)
+    except OSError:
+        return None
+
+    key = (engine_class, file_names)
+    with _engines_lock:
+        engine_mtimes, engine = _engines.get(key, (None, None))
+        if engine_mtimes != mtimes:
+            try:
+                engine = engine_class(*file_names)
+            except (AttributeError, IOError, ValueError) as e:
+                LOG.warning(_('Unable to load the %(engine)s, falling back '
+                              'to openssl: %(error)s'),
+                            {'engine': engine_class.__name__, 'error': e})
+                engine = None
+            _engines[key] = (mtimes, engine)
+        return engine
+
+
+def get_verification_engine(signing_cert_file_name, ca_file_name):
+    """Returns the in process verification engine of the certificates."""
+    return _get_engine(VerificationEngine, signing_cert_file_name,
+                       ca_file_name)
+
 
 def cms_verify(formatted, signing_cert_file_name, ca_file_name):
-    """Verifies the signature of the contents IAW CMS syntax."""
+    """Verifies the signature of the contents IAW CMS syntax.
+
+    The signature is verified in process when a crypto binding is
+    available, and by forking openssl otherwise. Either way a failed
+    verification raises CalledProcessError.
+    """
+    engine = get_verification_engine(signing_cert_file_name, ca_file_name)
+    if engine is None:
+        return _openssl_verify(formatted, signing_cert_file_name,
+                               ca_file_name)
+
+    try:
+        lines = formatted.strip().splitlines()
+        der = base64.b64decode(''.join(lines[1:-1]))
+        return engine.verify(der)
+    except (TypeError, ValueError) as e:
+        LOG.error(_('Verify error: %s') % e)
+        raise environment.subprocess.CalledProcessError(1, "openssl",
+                                                        output=str(e))
+
+
+def _openssl_verify(formatted, signing_cert_file_name, ca_file_name):
+    """Uses OpenSSL to verify a document."""
     process = environment.subprocess.Popen(["openssl", "cms", "-verify",
                                             "-certfile",
                                             signing_cert_file_name,
@@ -47,21 +240,11 @@ def cms_verify(formatted, signing_cert_file_name, ca_file_name):
 
 def token_to_cms(signed_text):
     copy_of_text = signed_text.replace('-', '/')
-
-    formatted = "-----BEGIN CMS-----\n"
     line_length = 64
-    while len(copy_of_text) > 0:
-        if (len(copy_of_text) > line_length):
-            formatted += copy_of_text[:line_length]
-            copy_of_text = copy_of_text[line_length:]
-        else:
-            formatted += copy_of_text
-            copy_of_text = ""
-        formatted += "\n"
-
-    formatted += "-----END CMS-----\n"
-
-    return formatted
+    lines = [copy_of_text[i:i + line_length]
+             for i in range(0, len(copy_of_text), line_length)]
+    return "-----BEGIN CMS-----\n%s-----END CMS-----\n" % (
+        ''.join(line + "\n" for line in lines))
 
 
 def verify_token(token, signing_cert_file_name, ca_file_name):
@@ -113,14 +296,127 @@ def is_ans1_token(token):
     return token[:3] == PKI_ANS1_PREFIX
 
 
+def _der(tag, content):
+    """Encodes a DER element of the given tag and content."""
+    length = len(content)
+    if length < 0x80:
+        return chr(tag) + chr(length) + content
+    octets = ''
+    while length:
+        octets = chr(length & 0xff) + octets
+        length >>= 8
+    return chr(tag) + chr(0x80 | len(octets)) + octets + content
+
+
+def _der_integer(value):
+    octets = ''
+    while True:
+        octets = chr(value & 0xff) + octets
+        value >>= 8
+        if not value:
+            break
+    if ord(octets[0]) & 0x80:
+        octets = '\x00' + octets
+    return _der(0x02, octets)
+
+
+def _der_sequence(*elements):
+    return _der(0x30, ''.join(elements))
+
+
+def _der_set(*elements):
+    return _der(0x31, ''.join(elements))
+
+
+def _der_explicit(content):
+    return _der(0xa0, content)
+
+
+class SigningEngine(object):
+    """Signs documents in process with a certificate and key loaded once.
+
+    The documents are byte for byte the ones produced by ``openssl cms
+    -sign -md sha256 -nosmimecap -nodetach -nocerts -noattr``: a SignedData
+    holding the document and a single RSA SignerInfo, identified by the
+    issuer and serial number of the signing certificate.
+
+    :raises: ValueError if the key is not an RSA key matching the
+             certificate, IOError if the files cannot be read.
+    """
+
+    def __init__(self, signing_cert_file_name, signing_key_file_name):
+        backend = default_backend()
+        with open(signing_cert_file_name) as f:
+            cert = x509.load_pem_x509_certificate(f.read(), backend)
+        with open(signing_key_file_name) as f:
+            self.key = serialization.load_pem_private_key(f.read(), None,
+                                                          backend)
+        if not isinstance(self.key, rsa.RSAPrivateKey):
+            raise ValueError('Only RSA signing keys are supported')
+        if (cert.public_key().public_numbers() !=
+                self.key.public_key().public_numbers()):
+            raise ValueError('The signing key does not match the '
+                             'certificate')
+
+        self.digest_algorithm = _der_sequence(OID_SHA256)
+        self.signer_id = _der_sequence(cert.issuer.public_bytes(backend),
+                                       _der_integer(cert.serial_number))
+
+    def sign(self, text):
+        """Signs text, returning the PEM encoded CMS document."""
+        signature = self.key.sign(text, padding.PKCS1v15(), hashes.SHA256())
+        signer_info = _der_sequence(
+            _der_integer(1),
+            self.signer_id,
+            self.digest_algorithm,
+            _der_sequence(OID_RSA_ENCRYPTION, _der(0x05, '')),
+            _der(0x04, signature))
+        signed_data = _der_sequence(
+            _der_integer(1),
+            _der_set(self.digest_algorithm),
+            _der_sequence(OID_DATA, _der_explicit(_der(0x04, text))),
+            _der_set(signer_info))
+        encoded = base64.b64encode(_der_sequence(OID_SIGNED_DATA,
+                                                 _der_explicit(signed_data)))
+
+        formatted = "-----BEGIN CMS-----\n"
+        for i in range(0, len(encoded), 64):
+            formatted += encoded[i:i + 64] + "\n"
+        formatted += "-----END CMS-----\n"
+        return formatted
+
+
+def get_signing_engine(signing_cert_file_name, signing_key_file_name):
+    """Returns the in process signing engine of a certificate and key."""
+    return _get_engine(SigningEngine, signing_cert_file_name,
+                       signing_key_file_name)
+
+
 def cms_sign_text(text, signing_cert_file_name, signing_key_file_name):
-    """Uses OpenSSL to sign a document
+    """Signs a document
     Produces a Base64 encoding of a DER formatted CMS Document
     http://en.wikipedia.org/wiki/Cryptographic_Message_Syntax
+
+    The document is signed in process when a crypto binding is available,
+    in the native thread pool of the environment so that the signature
+    does not block other requests, and by forking openssl otherwise.
     """
+    engine = get_signing_engine(signing_cert_file_name,
+                                signing_key_file_name)
+    # NOTE: openssl canonicalizes the line endings of the documents it signs,
+    # leave those to openssl rather than replicating its rules.
+    if engine is None or '\n' in text or '\r' in text:
+        return _openssl_sign_text(text, signing_cert_file_name,
+                                  signing_key_file_name)
+    return environment.tpool_execute(engine.sign, text)
+
+
+def _openssl_sign_text(text, signing_cert_file_name, signing_key_file_name):
+    """Uses OpenSSL to sign a document."""
     process = environment.subprocess.Popen(["openssl", "cms", "-sign",
                                             "-signer", signing_cert_file_name,
                                             "-inkey", signing_key_file_name,
+                                            "-md", "sha256",
                                             "-outform", "PEM",
                                             "-nosmimecap", "-nodetach",
                                             "-nocerts", "-noattr"],
@@ -71,6 +71,14 @@ FILE_OPTIONS = {
                    default='keystone.token.backends.sql.Token'),
         cfg.BoolOpt('caching', default=True),
         cfg.IntOpt('revocation_cache_time', default=3600),
+        cfg.IntOpt('revocation_sign_interval', default=0),
+        cfg.IntOpt('negative_cache_time', default=5),
+        cfg.IntOpt('negative_cache_size', default=10000),
+        cfg.IntOpt('max_batch_size', default=100),
+        cfg.IntOpt('flush_interval', default=0),
+        cfg.IntOpt('flush_batch_size', default=1000),
+        cfg.FloatOpt('flush_batch_interval', default=0.1),
+        cfg.IntOpt('partition_interval', default=3600),
         cfg.IntOpt('cache_time', default=None)],
     'cache': [
         cfg.StrOpt('config_prefix', default='cache.keystone'),
@@ -118,6 +126,7 @@ FILE_OPTIONS = {
                    default="/etc/keystone/ssl/private/cakey.pem"),
         cfg.IntOpt('key_size', default=2048),
         cfg.IntOpt('valid_days', default=3650),
+        cfg.IntOpt('thread_pool_size', default=4),
         cfg.StrOpt('cert_subject',
                    default=('/C=US/ST=Unset/L=Unset/O=Unset/'
                             'CN=www.example.com'))],
@@ -255,7 +264,11 @@ FILE_OPTIONS = {
         cfg.StrOpt('config_file', default=None)],
     'memcache': [
         cfg.StrOpt('servers', default='localhost:11211'),
-        cfg.IntOpt('max_compare_and_set_retry', default=16)],
+        cfg.IntOpt('max_compare_and_set_retry', default=16),
+        cfg.IntOpt('user_index_interval', default=3600),
+        cfg.IntOpt('revocation_list_interval', default=3600),
+        cfg.IntOpt('pool_maxsize', default=10),
+        cfg.IntOpt('pool_connection_get_timeout', default=10)],
     'catalog': [
         cfg.StrOpt('template_file',
                    default='default_catalog.templates'),
@@ -264,7 +277,15 @@ FILE_OPTIONS = {
     'quota': [
         cfg.BoolOpt('enabled', default=True),
         cfg.StrOpt('driver',
-                   default='keystone.quota.backends.sql.Quotas')],
+                   default='keystone.quota.backends.sql.Quotas'),
+        cfg.BoolOpt('caching', default=True),
+        cfg.IntOpt('cache_time', default=None),
+        cfg.IntOpt('reservation_expire', default=86400),
+        cfg.IntOpt('usage_flush_interval', default=5),
+        cfg.IntOpt('usage_flush_threshold', default=100),
+        cfg.ListOpt('services', default=['nova', 'cinder', 'neutron']),
+        cfg.IntOpt('list_limit', default=100),
+        cfg.IntOpt('history_archive_batch_size', default=1000)],
     'nova': [
         cfg.IntOpt('instances', default=10),
         cfg.IntOpt('cores', default=20),
@@ -24,13 +24,14 @@ CONF = config.CONF
 LOG = logging.getLogger(__name__)
 
 
-__all__ = ['Server', 'httplib', 'subprocess']
+__all__ = ['Server', 'httplib', 'subprocess', 'tpool_execute']
 
 _configured = False
 
 Server = None
 httplib = None
 subprocess = None
+tpool_execute = None
 
 
 def configure_once(name):
@@ -59,8 +60,8 @@ def configure_once(name):
 
 
 @configure_once('eventlet')
-def use_eventlet(monkeypatch_thread=None):
-    global httplib, subprocess, Server
+def use_eventlet(monkeypatch_thread=None, thread_pool_size=None):
+    global httplib, subprocess, Server, tpool_execute
 
     # This must be set before the initial import of eventlet because if
     # dnspython is present in your environment then eventlet monkeypatches
@@ -70,6 +71,7 @@ def use_eventlet(monkeypatch_thread=None):
     import eventlet
     from eventlet.green import httplib as _httplib
     from eventlet.green import subprocess as _subprocess
+    from eventlet import tpool
     from keystone.common.environment import eventlet_server
 
     if monkeypatch_thread is None:
@@ -87,17 +89,28 @@ def use_eventlet(monkeypatch_thread=None):
                                   thread=monkeypatch_thread, time=True,
                                   psycopg=False, MySQLdb=False)
 
+    # CPU bound work, such as signing, runs in a pool of native threads so
+    # that it does not block the hub.
+    if thread_pool_size:
+        tpool.set_num_threads(thread_pool_size)
+
     Server = eventlet_server.Server
     httplib = _httplib
     subprocess = _subprocess
+    tpool_execute = tpool.execute
+
+
+def _execute(func, *args, **kwargs):
+    return func(*args, **kwargs)
 
 
 @configure_once('stdlib')
 def use_stdlib():
-    global httplib, subprocess
+    global httplib, subprocess, tpool_execute
 
     import httplib as _httplib
     import subprocess as _subprocess
 
     httplib = _httplib
     subprocess = _subprocess
+    tpool_execute = _execute
@@ -57,6 +57,15 @@ Boolean = sql.Boolean
 Integer = sql.Integer
 Text = sql.Text
 UniqueConstraint = sql.UniqueConstraint
+MetaData = sql.MetaData
+Table = sql.Table
+ProgrammingError = sql.exc.ProgrammingError
+func = sql.func
+bindparam = sql.bindparam
+case = sql.case
+literal = sql.literal
+select = sql.select
+union_all = sql.union_all
 relationship = sql.orm.relationship
 joinedload = sql.orm.joinedload
 
@@ -186,6 +195,59 @@ class DictBase(models.ModelBase):
         return getattr(self, key)
 
 
+class SequenceModel(ModelBase):
+    __tablename__ = 'sequence'
+    name = Column(String(64), primary_key=True)
+    value = Column(Integer, nullable=False)
+
+
+def next_sequence_values(session, name, count=1):
+    """Reserves the next count values of a named sequence.
+
+    Must be called within the transaction which writes the values. The
+    update of the sequence row locks it until that transaction ends, so
+    concurrent writers are handed out increasing values in the order they
+    commit, which makes the values usable as markers of the rows written
+    since a previous read, unlike timestamps. Writers of several rows reserve
+    their values at once, taking the lock a single time.
+
+    :returns: the first of the reserved values
+
+    """
+    # NOTE: core statements, so that the pending changes of the session are
+    # not flushed one at a time ahead of them.
+    table = SequenceModel.__table__
+    updated = session.execute(
+        table.update()
+        .where(table.c.name == name)
+        .values(value=table.c.value + count)).rowcount
+    if not updated:
+        # NOTE: the migrations create the rows of the sequences in use,
+        # tables created from the models start without them.
+        session.execute(table.insert().values(name=name, value=count))
+        return 1
+    value = session.execute(
+        sql.select([table.c.value]).where(table.c.name == name)).scalar()
+    return value - count + 1
+
+
+def get_sequence_value(session, name):
+    """Returns the last value handed out by a named sequence, 0 if none."""
+    table = SequenceModel.__table__
+    value = session.execute(
+        sql.select([table.c.value]).where(table.c.name == name)).scalar()
+    return value or 0
+
+
+def next_sequence_value(session, name):
+    """Returns the next value of a named sequence.
+
+    See next_sequence_values.
+
+    """
+    return next_sequence_values(session, name)
+
+
 def mysql_on_checkout(dbapi_conn, connection_rec, connection_proxy):
     """Ensures that MySQL connections checked out of the pool are alive.
 
@@ -0,0 +1,151 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+# NOTE: the keys the quota driver used to store the quota scope under in the
+# child_field_data key/value table, mapped to the new quota columns.
+CHILD_KEY_COLUMNS = {'domain-id': 'domain_id',
+                     'region': 'region'}
+
+
+def _literal(value):
+    return sql.literal_column("'%s'" % value, type_=sql.String)
+
+
+def _insert_from_select(migrate_engine, table, columns, select):
+    """Copies the rows of a select into a table within the database.
+
+    SQLAlchemy 0.7 has no INSERT ... SELECT construct, the select must not
+    have bound parameters.
+    """
+    preparer = migrate_engine.dialect.identifier_preparer
+    migrate_engine.execute('INSERT INTO %s (%s) %s' % (
+        preparer.format_table(table),
+        ', '.join(preparer.quote_identifier(column) for column in columns),
+        select.compile(bind=migrate_engine)))
+
+
+def _service_of(migrate_engine, resource):
+    """Returns the service part of <service>.<resource> names."""
+    if migrate_engine.name == 'mysql':
+        return sql.func.substring_index(resource, '.', 1)
+    if migrate_engine.name == 'postgresql':
+        return sql.func.split_part(resource, '.', 1)
+    dot = sql.func.instr(resource, '.')
+    return sql.case([(dot > 0, sql.func.substr(resource, 1, dot - 1))],
+                    else_=resource)
+
+
+def migrate_child_data_to_columns(meta, migrate_engine):
+    quota_table = sql.Table('quota', meta, autoload=True)
+    child_table = sql.Table('child_field_data', meta, autoload=True)
+    parent_table = sql.Table('parent_field_data', meta, autoload=True)
+
+    values = {'service': _service_of(migrate_engine, quota_table.c.resource)}
+    for key, column in CHILD_KEY_COLUMNS.iteritems():
+        values[column] = (
+            sql.select([sql.func.max(child_table.c.value)])
+            .where(child_table.c.quota_id == quota_table.c.id)
+            .where(child_table.c.key == _literal(key))
+            .as_scalar())
+    migrate_engine.execute(quota_table.update().values(values))
+
+    # NOTE: the parent data of a quota was written to the child table by
+    # mistake, keep it where the driver expects to find it.
+    _insert_from_select(
+        migrate_engine, parent_table, ['id', 'quota_id', 'key', 'value'],
+        sql.select([child_table.c.id, child_table.c.quota_id,
+                    child_table.c.key, child_table.c.value])
+        .where(~child_table.c.key.in_(
+            [_literal(key) for key in CHILD_KEY_COLUMNS])))
+
+
+def migrate_columns_to_child_data(meta, migrate_engine):
+    quota_table = sql.Table('quota', meta, autoload=True)
+    child_table = sql.Table('child_field_data', meta, autoload=True)
+    parent_table = sql.Table('parent_field_data', meta, autoload=True)
+    columns = ['id', 'quota_id', 'key', 'value']
+
+    for key, column in CHILD_KEY_COLUMNS.iteritems():
+        _insert_from_select(
+            migrate_engine, child_table, columns,
+            sql.select([quota_table.c.id + _literal('-' + key),
+                        quota_table.c.id, _literal(key),
+                        quota_table.c[column]])
+            .where(quota_table.c[column] != None))  # noqa
+
+    # NOTE: the driver of this version reads and writes the parent data in
+    # the child table.
+    _insert_from_select(
+        migrate_engine, child_table, columns,
+        sql.select([parent_table.c.id, parent_table.c.quota_id,
+                    parent_table.c.key, parent_table.c.value]))
+    migrate_engine.execute(parent_table.delete())
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    quota_table.create_column(sql.Column('domain_id', sql.String(64)))
+    quota_table.create_column(sql.Column('region', sql.String(255)))
+    quota_table.create_column(sql.Column('service', sql.String(255)))
+    migrate_child_data_to_columns(meta, migrate_engine)
+
+    # NOTE: reload the table so the index is built against the new columns.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    quota_table = sql.Table('quota', meta, autoload=True)
+    idx = sql.Index('ix_quota_domain_id_region_service',
+                    quota_table.c.domain_id, quota_table.c.region,
+                    quota_table.c.service, quota_table.c.closed_at)
+    idx.create(migrate_engine)
+
+    child_table = sql.Table('child_field_data', meta, autoload=True)
+    child_table.drop()
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    child_table = sql.Table(
+        'child_field_data',
+        meta,
+        sql.Column('id', sql.String(64), primary_key=True),
+        sql.Column('quota_id', sql.String(64), sql.ForeignKey('quota.id'),
+                   nullable=False),
+        sql.Column('key', sql.Text, nullable=False),
+        sql.Column('value', sql.Text, nullable=False))
+    child_table.create(migrate_engine, checkfirst=True)
+    migrate_columns_to_child_data(meta, migrate_engine)
+
+    idx = sql.Index('ix_quota_domain_id_region_service',
+                    quota_table.c.domain_id, quota_table.c.region,
+                    quota_table.c.service, quota_table.c.closed_at)
+    idx.drop(migrate_engine)
+
+    # NOTE: reload the table so the dropped index is not part of it anymore.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    quota_table = sql.Table('quota', meta, autoload=True)
+    quota_table.drop_column('service')
+    quota_table.drop_column('region')
+    quota_table.drop_column('domain_id')
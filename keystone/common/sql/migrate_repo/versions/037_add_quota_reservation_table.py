@@ -0,0 +1,57 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    reservation_table = sql.Table(
+        'quota_reservation',
+        meta,
+        sql.Column('id', sql.String(64), primary_key=True),
+        sql.Column('reservation_id', sql.String(64), nullable=False),
+        sql.Column('quota_id', sql.String(64), sql.ForeignKey('quota.id'),
+                   nullable=False),
+        sql.Column('delta', sql.Integer, nullable=False),
+        sql.Column('created_at', sql.DateTime, nullable=False),
+        sql.Column('expires_at', sql.DateTime, nullable=False))
+    reservation_table.create(migrate_engine, checkfirst=True)
+
+    sql.Index('ix_quota_reservation_reservation_id',
+              reservation_table.c.reservation_id).create(migrate_engine)
+    sql.Index('ix_quota_reservation_quota_id_expires_at',
+              reservation_table.c.quota_id,
+              reservation_table.c.expires_at).create(migrate_engine)
+
+    # NOTE: available was written as -1 and never maintained, start tracking
+    # it from the current ceilings.
+    update = quota_table.update().where(quota_table.c.available == -1)
+    migrate_engine.execute(update.values(available=quota_table.c.ceiling))
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    reservation_table = sql.Table('quota_reservation', meta, autoload=True)
+    reservation_table.drop()
+
+    migrate_engine.execute(quota_table.update().values(available=-1))
@@ -0,0 +1,39 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    idx = sql.Index('ix_quota_region_domain_id',
+                    quota_table.c.region, quota_table.c.domain_id,
+                    quota_table.c.closed_at)
+    idx.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    quota_table = sql.Table('quota', meta, autoload=True)
+    idx = sql.Index('ix_quota_region_domain_id',
+                    quota_table.c.region, quota_table.c.domain_id,
+                    quota_table.c.closed_at)
+    idx.drop(migrate_engine)
@@ -0,0 +1,48 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    token_table = sql.Table('token', meta, autoload=True)
+    token_table.create_column(sql.Column('revoked_at', sql.DateTime(),
+                                         nullable=True))
+
+    # NOTE: reload the table so the index is built against the new column.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    token_table = sql.Table('token', meta, autoload=True)
+    idx = sql.Index('ix_token_revoked_at', token_table.c.revoked_at)
+    idx.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    token_table = sql.Table('token', meta, autoload=True)
+    idx = sql.Index('ix_token_revoked_at', token_table.c.revoked_at)
+    idx.drop(migrate_engine)
+
+    # NOTE: reload the table so the dropped index is not part of it anymore.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    token_table = sql.Table('token', meta, autoload=True)
+    token_table.drop_column('revoked_at')
@@ -0,0 +1,93 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import json
+
+import sqlalchemy as sql
+
+
+def _token_scope(extra):
+    """Returns the tenant id and OAuth consumer id of a token."""
+    tenant_id = None
+    consumer_id = None
+    tenant = extra.get('tenant')
+    if tenant:
+        tenant_id = tenant.get('id')
+    try:
+        oauth = extra['token_data']['token'].get('OS-OAUTH1')
+    except (KeyError, TypeError, AttributeError):
+        oauth = None
+    if oauth:
+        consumer_id = oauth.get('consumer_id')
+    return tenant_id, consumer_id
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    token_table = sql.Table('token', meta, autoload=True)
+    token_table.create_column(sql.Column('tenant_id', sql.String(64),
+                                         nullable=True))
+    token_table.create_column(sql.Column('consumer_id', sql.String(64),
+                                         nullable=True))
+
+    # NOTE: reload the table so the indexes are built against the new
+    # columns.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    token_table = sql.Table('token', meta, autoload=True)
+    sql.Index('ix_token_user_id_tenant_id', token_table.c.user_id,
+              token_table.c.tenant_id, token_table.c.valid,
+              token_table.c.expires).create(migrate_engine)
+    sql.Index('ix_token_user_id_consumer_id', token_table.c.user_id,
+              token_table.c.consumer_id, token_table.c.valid,
+              token_table.c.expires).create(migrate_engine)
+
+    # Only the live tokens are ever listed or revoked, the expired ones are
+    # left to token_flush.
+    query = sql.select([token_table.c.id, token_table.c.extra])
+    query = query.where(token_table.c.expires > datetime.datetime.utcnow())
+    query = query.where(token_table.c.valid == True)  # noqa
+    for token_id, extra in migrate_engine.execute(query).fetchall():
+        tenant_id, consumer_id = _token_scope(json.loads(extra or '{}'))
+        if tenant_id is None and consumer_id is None:
+            continue
+        migrate_engine.execute(
+            token_table.update().where(token_table.c.id == token_id).values(
+                tenant_id=tenant_id, consumer_id=consumer_id))
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    token_table = sql.Table('token', meta, autoload=True)
+    sql.Index('ix_token_user_id_tenant_id', token_table.c.user_id,
+              token_table.c.tenant_id, token_table.c.valid,
+              token_table.c.expires).drop(migrate_engine)
+    sql.Index('ix_token_user_id_consumer_id', token_table.c.user_id,
+              token_table.c.consumer_id, token_table.c.valid,
+              token_table.c.expires).drop(migrate_engine)
+
+    # NOTE: reload the table so the dropped indexes are not part of it
+    # anymore.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    token_table = sql.Table('token', meta, autoload=True)
+    token_table.drop_column('consumer_id')
+    token_table.drop_column('tenant_id')
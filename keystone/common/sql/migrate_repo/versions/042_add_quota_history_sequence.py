@@ -0,0 +1,95 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import sqlalchemy as sql
+
+
+def _number_history(migrate_engine):
+    """Numbers the existing changes in the order they were listed so far,
+    (updated_at, id), in a single statement.
+    """
+    if migrate_engine.name == 'mysql':
+        connection = migrate_engine.connect()
+        try:
+            connection.execute('SET @seq := 0')
+            connection.execute('UPDATE h_quota SET seq = (@seq := @seq + 1) '
+                               'ORDER BY updated_at, id')
+        finally:
+            connection.close()
+    elif migrate_engine.name == 'postgresql':
+        migrate_engine.execute(
+            'UPDATE h_quota SET seq = numbered.seq FROM '
+            '(SELECT id, row_number() OVER (ORDER BY updated_at, id) AS seq '
+            'FROM h_quota) AS numbered WHERE h_quota.id = numbered.id')
+    else:
+        migrate_engine.execute(
+            'UPDATE h_quota SET seq = '
+            '(SELECT count(*) FROM h_quota AS earlier '
+            'WHERE earlier.updated_at < h_quota.updated_at '
+            'OR (earlier.updated_at = h_quota.updated_at '
+            'AND earlier.id <= h_quota.id))')
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    sequence_table = sql.Table(
+        'sequence',
+        meta,
+        sql.Column('name', sql.String(64), primary_key=True),
+        sql.Column('value', sql.Integer, nullable=False))
+    sequence_table.create(migrate_engine, checkfirst=True)
+
+    history_table = sql.Table('h_quota', meta, autoload=True)
+    history_table.create_column(sql.Column('seq', sql.Integer,
+                                           nullable=True))
+
+    # NOTE: reload the table so the indexes are built against the new
+    # column.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    history_table = sql.Table('h_quota', meta, autoload=True)
+
+    _number_history(migrate_engine)
+    seq = migrate_engine.execute(
+        sql.select([sql.func.max(history_table.c.seq)])).scalar()
+    migrate_engine.execute(
+        sequence_table.insert().values(name='h_quota', value=seq or 0))
+
+    sql.Index('ix_h_quota_updated_at',
+              history_table.c.updated_at).create(migrate_engine)
+    sql.Index('ix_h_quota_seq', history_table.c.seq).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+
+    history_table = sql.Table('h_quota', meta, autoload=True)
+    sql.Index('ix_h_quota_updated_at',
+              history_table.c.updated_at).drop(migrate_engine)
+    sql.Index('ix_h_quota_seq', history_table.c.seq).drop(migrate_engine)
+
+    # NOTE: reload the table so the dropped indexes are not part of it
+    # anymore.
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    history_table = sql.Table('h_quota', meta, autoload=True)
+    history_table.drop_column('seq')
+
+    sequence_table = sql.Table('sequence', meta, autoload=True)
+    sequence_table.drop(migrate_engine)
@@ -0,0 +1,92 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import datetime
+import re
+
+import sqlalchemy as sql
+
+
+# NOTE: the tables of keystone.token.backends.sql_partitioned mirror the
+# token table.
+PARTITION_NAME_RE = re.compile(r'^token_\d{12}$')
+
+
+def _token_tables(migrate_engine):
+    return ['token'] + [name for name in migrate_engine.table_names()
+                        if PARTITION_NAME_RE.match(name)]
+
+
+def upgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    sequence_table = sql.Table('sequence', meta, autoload=True)
+
+    # Number the unexpired revocations in the order of their time, the
+    # expired ones are not listed anymore.
+    revocations = []
+    token_tables = {}
+    for name in _token_tables(migrate_engine):
+        token_table = sql.Table(name, meta, autoload=True)
+        token_table.create_column(sql.Column('revocation_seq', sql.Integer,
+                                             nullable=True))
+
+        # NOTE: reload the table so the index is built against the new
+        # column.
+        table_meta = sql.MetaData()
+        table_meta.bind = migrate_engine
+        token_table = sql.Table(name, table_meta, autoload=True)
+        sql.Index('ix_%s_revocation_seq' % name,
+                  token_table.c.revocation_seq).create(migrate_engine)
+        token_tables[name] = token_table
+
+        query = sql.select([token_table.c.id, token_table.c.revoked_at])
+        query = query.where(token_table.c.expires >
+                            datetime.datetime.utcnow())
+        query = query.where(token_table.c.valid == False)  # noqa
+        for token_id, revoked_at in migrate_engine.execute(query).fetchall():
+            revocations.append((revoked_at or datetime.datetime.min,
+                                token_id, name))
+
+    seq = 0
+    for revoked_at, token_id, name in sorted(revocations):
+        seq += 1
+        token_table = token_tables[name]
+        migrate_engine.execute(
+            token_table.update().where(token_table.c.id == token_id).values(
+                revocation_seq=seq))
+    migrate_engine.execute(
+        sequence_table.insert().values(name='token_revocation', value=seq))
+
+
+def downgrade(migrate_engine):
+    meta = sql.MetaData()
+    meta.bind = migrate_engine
+    sequence_table = sql.Table('sequence', meta, autoload=True)
+    migrate_engine.execute(sequence_table.delete().where(
+        sequence_table.c.name == 'token_revocation'))
+
+    for name in _token_tables(migrate_engine):
+        token_table = sql.Table(name, meta, autoload=True)
+        sql.Index('ix_%s_revocation_seq' % name,
+                  token_table.c.revocation_seq).drop(migrate_engine)
+
+        # NOTE: reload the table so the dropped index is not part of it
+        # anymore.
+        table_meta = sql.MetaData()
+        table_meta.bind = migrate_engine
+        token_table = sql.Table(name, table_meta, autoload=True)
+        token_table.drop_column('revocation_seq')
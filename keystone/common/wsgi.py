@@ -20,6 +20,7 @@
 
 """Utility methods for working with WSGI servers."""
 
+import hashlib
 import re
 
 import routes.middleware
@@ -563,10 +564,12 @@ class ExtensionRouter(Router):
         return _factory
 
 
-def render_response(body=None, status=None, headers=None):
+def render_response(body=None, status=None, headers=None, etag=None):
     """Forms a WSGI response."""
     headers = headers or []
     headers.append(('Vary', 'X-Auth-Token'))
+    if etag is not None:
+        headers.append(('ETag', '"%s"' % etag))
 
     if body is None:
         body = ''
@@ -581,6 +584,39 @@ def render_response(body=None, status=None, headers=None):
                           headerlist=headers)
 
 
+def render_conditional_response(context, version, build_body, variant=None):
+    """Forms a WSGI response for a read, honouring If-None-Match.
+
+    The strong ETag of the response is derived from the version stamp of the
+    entity being read, the request path, the requested content type and the
+    variant of the representation, which defaults to the query string. When
+    the request carries a matching If-None-Match, a 304 is returned without
+    calling build_body, so that neither the backend nor the serializer are
+    hit.
+
+    :param version: version stamp of the entity, which must change whenever
+                    the entity changes, or None when the backend keeps none,
+                    in which case the response carries no ETag
+    :param build_body: callable returning the body of the response
+    """
+    if version is None:
+        return render_response(body=build_body())
+
+    if variant is None:
+        variant = sorted(context['query_string'].iteritems())
+    etag = hashlib.sha1('%s:%s:%s:%r' % (
+        version, context['path'], context['headers'].get('Accept'),
+        variant)).hexdigest()
+
+    if_none_match = context['headers'].get('If-None-Match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        if '*' in tags or '"%s"' % etag in tags:
+            return render_response(status=(304, 'Not Modified'), etag=etag)
+
+    return render_response(body=build_body(), etag=etag)
+
+
 def render_exception(error, user_locale=None):
     """Forms a WSGI response based on the current error."""
     body = {'error': {
@@ -200,6 +200,15 @@ class VersionNotFound(NotFound):
     message_format = _("Could not find version, %(version)s.")
 
 
+class QuotaNotFound(NotFound):
+    message_format = _("Could not find quota, %(resource)s.")
+
+
+class QuotaReservationNotFound(NotFound):
+    message_format = _("Could not find quota reservation,"
+                       " %(reservation_id)s.")
+
+
 class Conflict(Error):
     message_format = _("Conflict occurred attempting to store %(type)s."
                        " %(details)s")
@@ -213,6 +222,12 @@ class RequestTooLarge(Error):
     title = 'Request is too large.'
 
 
+class QuotaExceeded(Error):
+    message_format = _("Quota exceeded for resource %(resource)s.")
+    code = 413
+    title = 'Quota exceeded'
+
+
 class UnexpectedError(Error):
     message_format = _("An unexpected error prevented the server"
                        " from fulfilling your request. %(exception)s")
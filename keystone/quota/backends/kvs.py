@@ -0,0 +1,334 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""
+An in memory implementation of the quotas API.
+only to be used for testing purposes and single node deployments
+"""
+import copy
+import datetime
+import uuid
+
+from keystone.common import kvs
+from keystone import exception
+from keystone.openstack.common import timeutils
+from keystone.quota import core
+
+
+class Quotas(kvs.Base, core.Driver):
+    """Quotas are stored under ``quota-<id>`` and indexed by domain, region
+    and service under ``quota_scope-<domain>-<region>-<service>`` as a
+    dictionary of quota ids keyed by resource name. Only open quotas are
+    indexed, closed quotas are kept along with their history.
+    """
+
+    def _get_scope(self, domain_id, region_name, service):
+        return self.db.get('quota_scope-%s-%s-%s' % (domain_id, region_name,
+                                                     service), {})
+
+    def _set_scope(self, domain_id, region_name, service, scope):
+        self.db.set('quota_scope-%s-%s-%s' % (domain_id, region_name,
+                                              service), scope)
+
+    def _get_region_domains(self, region_name):
+        # domain id -> list of services with open quotas in the region
+        return self.db.get('quota_region-%s' % region_name, {})
+
+    def _index_region_domain(self, domain_id, region_name, service):
+        domains = self._get_region_domains(region_name)
+        scope = self._get_scope(domain_id, region_name, service)
+        services = [s for s in domains.get(domain_id, []) if s != service]
+        if scope:
+            services.append(service)
+        if services:
+            domains[domain_id] = services
+        else:
+            domains.pop(domain_id, None)
+        self.db.set('quota_region-%s' % region_name, domains)
+
+    def get_domain_quota_version(self, domain_id, region_name):
+        return self.db.setdefault(
+            'quota_version-%s-%s' % (domain_id, region_name), 0)
+
+    def _bump_version(self, domain_id, region_name):
+        self.db['quota_version-%s-%s' % (domain_id, region_name)] = (
+            self.get_domain_quota_version(domain_id, region_name) + 1)
+
+    def _get_quota(self, quota_id):
+        return copy.deepcopy(self.db.get('quota-%s' % quota_id))
+
+    def _get_open_quotas(self, domain_id, region_name, services):
+        quotas = {}
+        for service in services:
+            scope = self._get_scope(domain_id, region_name, service)
+            for resource_name, quota_id in scope.iteritems():
+                quotas[resource_name] = self._get_quota(quota_id)
+        return quotas
+
+    def _add_history(self, quota_ref, remark, created_by):
+        key = 'quota_history-%s-%s' % (quota_ref['domain_id'],
+                                       quota_ref['region'])
+        history = self.db.get(key, [])
+        history.append({'id': uuid.uuid4().hex,
+                        'quota_id': quota_ref['id'],
+                        'resource': quota_ref['resource'],
+                        'updated_at': datetime.datetime.now(),
+                        'updated_by': str(created_by),
+                        'remark': remark})
+        self.db.set(key, history)
+
+    def set_domain_quota(self, resource_name, ceiling, domain_id, region_name,
+                         parent_data, created_by):
+        return self.set_domain_quotas({resource_name: ceiling}, domain_id,
+                                      region_name, parent_data, created_by)
+
+    def set_domain_quotas(self, quotas, domain_id, region_name, parent_data,
+                          created_by):
+        services = set(name.split('.')[0] for name in quotas)
+        existing = self._get_open_quotas(domain_id, region_name, services)
+        for quota_ref in existing.itervalues():
+            for key, value in quota_ref['parent'].iteritems():
+                if parent_data.get(key) != value:
+                    raise exception.ForbiddenAction(
+                        action='update quota of another parent')
+
+        for resource_name, ceiling in quotas.iteritems():
+            quota_ref = existing.get(resource_name)
+            if quota_ref is not None:
+                remark = "ceiling: %s -> %s." % (quota_ref['ceiling'],
+                                                 ceiling)
+                if ceiling < 0:
+                    quota_ref['available'] = -1
+                elif quota_ref['ceiling'] < 0:
+                    quota_ref['available'] = ceiling
+                else:
+                    quota_ref['available'] += ceiling - quota_ref['ceiling']
+                quota_ref['ceiling'] = ceiling
+                self._add_history(quota_ref, remark, created_by)
+            else:
+                service = resource_name.split('.')[0]
+                quota_ref = {'id': uuid.uuid4().hex,
+                             'resource': resource_name,
+                             'service': service,
+                             'ceiling': ceiling,
+                             'available': ceiling,
+                             'created_at': datetime.datetime.now(),
+                             'created_by': str(created_by),
+                             'closed_at': None,
+                             'closed_by': None,
+                             'domain_id': domain_id,
+                             'region': region_name,
+                             'parent': dict(parent_data)}
+                scope = self._get_scope(domain_id, region_name, service)
+                scope[resource_name] = quota_ref['id']
+                self._set_scope(domain_id, region_name, service, scope)
+                self._index_region_domain(domain_id, region_name, service)
+            self.db.set('quota-%s' % quota_ref['id'], quota_ref)
+        self._bump_version(domain_id, region_name)
+
+    def delete_domain_quota(self, service_list, domain_id, region_name,
+                            deleted_by):
+        now = datetime.datetime.now()
+        for service in service_list:
+            scope = self._get_scope(domain_id, region_name, service)
+            for quota_id in scope.itervalues():
+                quota_ref = self._get_quota(quota_id)
+                quota_ref['closed_at'] = now
+                quota_ref['closed_by'] = str(deleted_by)
+                self.db.set('quota-%s' % quota_id, quota_ref)
+            self._set_scope(domain_id, region_name, service, {})
+            self._index_region_domain(domain_id, region_name, service)
+        self._bump_version(domain_id, region_name)
+
+    def get_domain_quota_by_services(self, service_list, domain_id,
+                                     region_name):
+        services_quotas = {}
+        for service in service_list:
+            scope = self._get_scope(domain_id, region_name, service)
+            if not scope:
+                continue
+            resources_quotas = services_quotas.setdefault(str(service), {})
+            for resource_name, quota_id in scope.iteritems():
+                quota_ref = self.db.get('quota-%s' % quota_id)
+                resources_quotas[str(resource_name.split('.')[1])] = (
+                    quota_ref['ceiling'])
+        return services_quotas
+
+    def list_region_quotas(self, region_name, services=None, limit=None,
+                           marker=None):
+        domains = self._get_region_domains(region_name)
+        domains_quotas = []
+        for domain_id in sorted(domains):
+            if marker is not None and domain_id <= marker:
+                continue
+            domain_services = domains[domain_id]
+            if services:
+                domain_services = [s for s in domain_services
+                                   if s in services]
+                if not domain_services:
+                    continue
+            domains_quotas.append({
+                'domain_id': domain_id,
+                'region': region_name,
+                'quotas': self.get_domain_quota_by_services(
+                    domain_services, domain_id, region_name)})
+            if limit is not None and len(domains_quotas) >= limit:
+                break
+        return domains_quotas
+
+    def list_domain_quota_history(self, domain_id, region_name, limit=None,
+                                  marker=None):
+        history = self.db.get('quota_history-%s-%s' % (domain_id,
+                                                       region_name), [])
+        # most recent first, entries are appended in chronological order
+        history.reverse()
+        if marker is not None:
+            ids = [change['id'] for change in history]
+            if marker not in ids:
+                raise exception.ValidationError(attribute='marker',
+                                                target='query')
+            history = history[ids.index(marker) + 1:]
+        if limit is not None:
+            history = history[:limit]
+        return copy.deepcopy(history)
+
+    def list_quota_history_before(self, before, limit):
+        history = []
+        for key, value in self.db.items():
+            if key.startswith('quota_history-'):
+                history.extend(change for change in value
+                               if change['updated_at'] < before)
+        history.sort(key=lambda change: (change['updated_at'], change['id']))
+        return copy.deepcopy(history[:limit])
+
+    def delete_quota_history(self, history_ids):
+        history_ids = set(history_ids)
+        for key, value in self.db.items():
+            if key.startswith('quota_history-'):
+                self.db.set(key, [change for change in value
+                                  if change['id'] not in history_ids])
+
+    def _get_reservation_ids(self, domain_id, region_name):
+        return self.db.get('quota_reservations-%s-%s' % (domain_id,
+                                                         region_name), [])
+
+    def _set_reservation_ids(self, domain_id, region_name, reservation_ids):
+        self.db.set('quota_reservations-%s-%s' % (domain_id, region_name),
+                    reservation_ids)
+
+    def _adjust_available(self, quota_id, delta):
+        """Takes delta out of the available capacity of a quota.
+
+        :returns: whether the capacity could be taken
+        """
+        try:
+            quota_ref = self._get_quota(quota_id)
+        except exception.NotFound:
+            return False
+        if quota_ref['ceiling'] < 0:
+            return True
+        if delta > 0 and quota_ref['available'] < delta:
+            return False
+        quota_ref['available'] -= delta
+        self.db.set('quota-%s' % quota_id, quota_ref)
+        return True
+
+    def _release_reservation(self, reservation, committed):
+        """Deletes a reservation and settles the capacity it holds, as the
+        SQL driver does.
+        """
+        self.db.delete('quota_reservation-%s' % reservation['id'])
+        reservation_ids = self._get_reservation_ids(reservation['domain_id'],
+                                                    reservation['region'])
+        reservation_ids.remove(reservation['id'])
+        self._set_reservation_ids(reservation['domain_id'],
+                                  reservation['region'], reservation_ids)
+        for resource_name, quota_id, delta in reservation['deltas']:
+            if (delta < 0) == committed:
+                self._adjust_available(quota_id, -abs(delta))
+
+    def _reclaim_expired_reservations(self, domain_id, region_name):
+        now = timeutils.utcnow()
+        for reservation_id in self._get_reservation_ids(domain_id,
+                                                        region_name):
+            reservation = self.db.get('quota_reservation-%s' %
+                                      reservation_id)
+            if reservation['expires_at'] < now:
+                self._release_reservation(reservation, committed=False)
+
+    def reserve_domain_quota(self, deltas, domain_id, region_name,
+                             expires_at):
+        services = set(name.split('.')[0] for name in deltas)
+        quotas = self._get_open_quotas(domain_id, region_name, services)
+        for resource_name in deltas:
+            if resource_name not in quotas:
+                raise exception.QuotaNotFound(resource=resource_name)
+
+        self._reclaim_expired_reservations(domain_id, region_name)
+
+        # Check every delta before taking any capacity, so that a failed
+        # reservation leaves the quotas untouched.
+        quotas = self._get_open_quotas(domain_id, region_name, services)
+        for resource_name, delta in deltas.iteritems():
+            quota_ref = quotas[resource_name]
+            if (delta > 0 and quota_ref['ceiling'] >= 0 and
+                    quota_ref['available'] < delta):
+                raise exception.QuotaExceeded(resource=resource_name)
+
+        reservation = {'id': uuid.uuid4().hex,
+                       'domain_id': domain_id,
+                       'region': region_name,
+                       'expires_at': expires_at,
+                       'deltas': []}
+        for resource_name, delta in deltas.iteritems():
+            quota_id = quotas[resource_name]['id']
+            # NOTE: releases are only applied on commit, like the SQL driver
+            # does.
+            if delta > 0:
+                self._adjust_available(quota_id, delta)
+            reservation['deltas'].append((resource_name, quota_id, delta))
+        self.db.set('quota_reservation-%s' % reservation['id'], reservation)
+        reservation_ids = self._get_reservation_ids(domain_id, region_name)
+        reservation_ids.append(reservation['id'])
+        self._set_reservation_ids(domain_id, region_name, reservation_ids)
+
+        return {'id': reservation['id'],
+                'domain_id': domain_id,
+                'region': region_name,
+                'resources': deltas,
+                'expires_at': expires_at}
+
+    def _get_reservation(self, reservation_id, domain_id):
+        try:
+            reservation = self.db.get('quota_reservation-%s' %
+                                      reservation_id)
+        except exception.NotFound:
+            reservation = None
+        if reservation is None or reservation['domain_id'] != domain_id:
+            raise exception.QuotaReservationNotFound(
+                reservation_id=reservation_id)
+        return reservation
+
+    def commit_domain_quota_reservation(self, reservation_id, domain_id):
+        reservation = self._get_reservation(reservation_id, domain_id)
+        if reservation['expires_at'] < timeutils.utcnow():
+            self._release_reservation(reservation, committed=False)
+            raise exception.QuotaReservationNotFound(
+                reservation_id=reservation_id)
+        self._release_reservation(reservation, committed=True)
+
+    def rollback_domain_quota_reservation(self, reservation_id, domain_id):
+        reservation = self._get_reservation(reservation_id, domain_id)
+        self._release_reservation(reservation, committed=False)
@@ -14,17 +14,23 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import datetime
-from sqlalchemy import and_
-from sqlalchemy import or_
-import sqlalchemy.sql.expression as expression
+import hashlib
 import uuid
 
 import keystone.common.sql as sql
 from keystone import exception
+from keystone.openstack.common.db.sqlalchemy import utils as db_utils
+from keystone.openstack.common import timeutils
 from keystone.quota import core
 
 
+# NOTE: paginate_query reads the sort keys of the marker as attributes, the
+# client-facing marker of a region listing is the last domain-id of a page.
+DomainMarker = collections.namedtuple('DomainMarker', ['domain_id'])
+
+
 class QuotasModel(sql.ModelBase):
     __tablename__ = 'quota'
     id = sql.Column(sql.String(64), primary_key=True)
@@ -35,24 +41,27 @@ class QuotasModel(sql.ModelBase):
     created_by = sql.Column(sql.String(255), nullable=False)
     closed_at = sql.Column(sql.DateTime, nullable=True)
     closed_by = sql.Column(sql.String(255), nullable=True)
+    domain_id = sql.Column(sql.String(64), nullable=True)
+    region = sql.Column(sql.String(255), nullable=True)
+    service = sql.Column(sql.String(255), nullable=True)
+    __table_args__ = (
+        sql.Index('ix_quota_domain_id_region_service',
+                  'domain_id', 'region', 'service', 'closed_at'),
+        sql.Index('ix_quota_region_domain_id',
+                  'region', 'domain_id', 'closed_at'),
+    )
 
     def __init__(self, uuid, resource, ceiling, available, created_at,
-                 created_by):
+                 created_by, domain_id=None, region=None):
         self.id = uuid
         self.resource = resource
         self.ceiling = ceiling
         self.available = available
         self.created_at = created_at
         self.created_by = created_by
-
-
-class ChildFieldDataModel(sql.ModelBase):
-    __tablename__ = 'child_field_data'
-    id = sql.Column(sql.String(64), primary_key=True)
-    quota_id = sql.Column(sql.String(64), sql.ForeignKey('quota.id'),
-                          nullable=False)
-    key = sql.Column(sql.Text, nullable=False)
-    value = sql.Column(sql.Text, nullable=False)
+        self.domain_id = domain_id
+        self.region = region
+        self.service = resource.split('.')[0]
 
 
 class ParentFieldDataModel(sql.ModelBase):
@@ -72,98 +81,63 @@ class HistoryQuotasModel(sql.ModelBase):
     updated_at = sql.Column(sql.DateTime, nullable=False)
     updated_by = sql.Column(sql.Text, nullable=False)
     remark = sql.Column(sql.Text, nullable=False)
+    # NOTE: orders the changes, updated_at is not precise enough to.
+    seq = sql.Column(sql.Integer, nullable=True)
+    __table_args__ = (
+        sql.Index('ix_h_quota_quota_id_updated_at', 'quota_id', 'updated_at'),
+        sql.Index('ix_h_quota_updated_at', 'updated_at'),
+        sql.Index('ix_h_quota_seq', 'seq'),
+    )
+
+    def to_dict(self):
+        return {'id': self.id,
+                'quota_id': self.quota_id,
+                'updated_at': self.updated_at,
+                'updated_by': self.updated_by,
+                'remark': self.remark}
+
+
+class ReservationModel(sql.ModelBase):
+    __tablename__ = 'quota_reservation'
+    id = sql.Column(sql.String(64), primary_key=True)
+    reservation_id = sql.Column(sql.String(64), nullable=False)
+    quota_id = sql.Column(sql.String(64), sql.ForeignKey('quota.id'),
+                          nullable=False)
+    delta = sql.Column(sql.Integer, nullable=False)
+    created_at = sql.Column(sql.DateTime, nullable=False)
+    expires_at = sql.Column(sql.DateTime, nullable=False)
+    __table_args__ = (
+        sql.Index('ix_quota_reservation_reservation_id', 'reservation_id'),
+        sql.Index('ix_quota_reservation_quota_id_expires_at',
+                  'quota_id', 'expires_at'),
+    )
 
 
 class Quotas(sql.Base, core.Driver):
     def db_sync(self, version=None):
         sql.migration.db_sync(version=version)
 
-    def __get_quota_ids_for_child(self, child_data, services, session,
-                                  resource=None, get_only_query=False):
-
-            key_value_match = []
-            for key, value in child_data.iteritems():
-                key_value_match.append(expression.
-                                       and_(ChildFieldDataModel.key == key,
-                                            ChildFieldDataModel.value ==
-                                            value))
-            resource_match = []
-            if (resource is None):
-                for service in services:
-                    resource_match.append(QuotasModel.resource.like
-                                          (service + ".%"))
-            else:
-                resource_match.append(QuotasModel.resource ==
-                                      (str(services[0]) + "." + resource))
-
-            subquery = (session.query(ChildFieldDataModel.quota_id)
-                .filter(and_(ChildFieldDataModel.quota_id == QuotasModel.id))
-                .filter(or_(*resource_match))
-                .filter(or_(*key_value_match))
-                .filter(QuotasModel.closed_at == None)
-                .group_by(ChildFieldDataModel.quota_id)) # flake8: noqa
-
-            query = (session.query(ChildFieldDataModel.quota_id)
-                .filter(ChildFieldDataModel.quota_id.in_(subquery))
-                .group_by(ChildFieldDataModel.quota_id))
-
-            if get_only_query:
-                return query
-
-            rows = query.all()
-            quota_ids = []
-            for row in rows:
-                quota_ids.append(str(row.quota_id))
-            return quota_ids
-
-    def set_quota(self, resource_name, ceiling, child_data, parent_data,
-                  created_by):
-        service, resource = resource_name.split('.')
+    def _filter_domain_quotas(self, query, domain_id, region_name, services):
+        """Restricts a query to the open quotas of a domain in a region.
 
+        The filter matches the ix_quota_domain_id_region_service index.
+        """
+        return (query
+            .filter(QuotasModel.domain_id == domain_id)
+            .filter(QuotasModel.region == region_name)
+            .filter(QuotasModel.service.in_(services))
+            .filter(QuotasModel.closed_at == None))  # flake8: noqa
+
+    def _version_sequence(self, domain_id, region_name):
+        # NOTE: the names of the sequences are too short to hold the domain-id
+        # and the region.
+        return 'quota-%s' % hashlib.sha1(
+            '%s\0%s' % (domain_id, region_name)).hexdigest()
+
+    def get_domain_quota_version(self, domain_id, region_name):
         session = self.get_session()
-        with session.begin():
-            # First check whether quota for the child iexists
-            quota_ids = self.__get_quota_ids_for_child(child_data, [service],
-                                                       session, resource)
-            if (len(quota_ids) != 0):  # record for quota exist
-                parents = (session.query(ParentFieldDataModel.key,
-                                        ParentFieldDataModel.value)
-                    .filter(ParentFieldDataModel.quota_id == quota_ids[0])
-                    .all())
-                for parent in parents:
-                    if (parent.key in parent_data) and (parent_data[parent.key]
-                                                        == parent.value):
-                            continue
-                    else:
-                        raise exception.ForbiddenAction()
-                result = (session.query(QuotasModel.ceiling)
-                    .filter(QuotasModel.id == quota_ids[0]).one())
-
-                (session.query(QuotasModel)
-                    .filter(QuotasModel.id == quota_ids[0])
-                    .update({"ceiling": ceiling}))
-
-                remark = "ceiling: %s -> %s." % (result.ceiling, ceiling)
-                self.__add_history(session, quota_ids[0], remark, created_by)
-            else:
-                ref = QuotasModel(str(uuid.uuid4()),
-                                  resource=resource_name,
-                                  ceiling=ceiling,
-                                  available=-1,
-                                  created_at=datetime.datetime.now(),
-                                  created_by=str(created_by))
-                session.add(ref)
-                session.flush()
-                self.__add_child(session, ref.id, child_data)
-                self.__add_child(session, ref.id, parent_data)
-
-    def __add_child(self, session, quota_id, child):
-        for key, value in child.iteritems():
-            ref = ChildFieldDataModel(id=str(uuid.uuid4()),
-                                      quota_id=quota_id,
-                                      key=key, value=value)
-            session.add(ref)
-        session.flush
+        return sql.get_sequence_value(
+            session, self._version_sequence(domain_id, region_name))
 
     def __add_parent(self, session, quota_id, parent):
         for key, value in parent.iteritems():
@@ -171,71 +145,119 @@ class Quotas(sql.Base, core.Driver):
                                        quota_id=quota_id,
                                        key=key, value=value)
             session.add(ref)
-        session.flush()
-
-    def __add_history(self, session, quota_id, remark, created_by):
-        ref = HistoryQuotasModel(id=str(uuid.uuid4()),
-                                 quota_id=quota_id, remark=remark,
-                                 updated_at=datetime.datetime.now(),
-                                 updated_by=str(created_by))
-        session.add(ref)
-        session.flush()
 
-    def get_quota_by_services(self, services, child_data):
-        """Gets the quota applicable to the specified child
-        for all the resources in the given services
+    def __add_history(self, session, history):
+        """Adds the ceiling changes of a transaction, numbered in order.
 
-        :param service_list: list of services
-        :param child: details of the entity for which quota is requested.
-                      It should be a dictionary
+        :param history: list of (quota_id, remark, created_by) tuples
         """
-        session = self.get_session()
-        with session.begin():
-            quota_ids = self.__get_quota_ids_for_child(child_data, services,
-                                                       session, None, True)
-            quotas = (session.query(QuotasModel.resource, QuotasModel.ceiling)
-                .filter(QuotasModel.id.in_(quota_ids))
-                .order_by(QuotasModel.resource).all())
-            services.sort()
-            services_quotas = {}
-            for service in services:
-                resources_quotas = {}
-                for quota in quotas:
-                    service_name, resource_name = quota.resource.split('.')
-                    if (str(service_name) == service):
-                        resources_quotas[str(resource_name)] = quota.ceiling
-                if len(resources_quotas) != 0:
-                    services_quotas[service] = resources_quotas
-        return services_quotas
+        if not history:
+            return
+        seq = sql.next_sequence_values(session, 'h_quota', len(history))
+        now = datetime.datetime.now()
+        session.execute(HistoryQuotasModel.__table__.insert(), [
+            {'id': str(uuid.uuid4()), 'quota_id': quota_id,
+             'remark': remark, 'updated_at': now,
+             'updated_by': str(created_by), 'seq': seq + i}
+            for i, (quota_id, remark, created_by) in enumerate(history)])
+
+    def __update_ceilings(self, session, updates):
+        """Updates the ceilings of existing quotas in a single statement.
+
+        The available capacity is shifted by the change of the ceiling as a
+        SQL expression, so that reservations made concurrently are not lost,
+        unless it is set outright (new_available is not null).
+
+        :param updates: list of dictionaries of the quota_id, new_ceiling,
+                        new_available and shift of each quota
+        """
+        if not updates:
+            return
+        table = QuotasModel.__table__
+        new_available = sql.bindparam('new_available', type_=sql.Integer)
+        statement = (table.update()
+            .where(table.c.id == sql.bindparam('quota_id'))
+            .values(ceiling=sql.bindparam('new_ceiling'),
+                    available=sql.case(
+                        [(new_available != None, new_available)],
+                        else_=table.c.available + sql.bindparam(
+                            'shift', type_=sql.Integer))))
+        session.execute(statement, updates)
+
+    def set_domain_quota(self, resource_name, ceiling, domain_id, region_name,
+                         parent_data, created_by):
+        return self.set_domain_quotas({resource_name: ceiling}, domain_id,
+                                      region_name, parent_data, created_by)
 
-    def delete_quota(self, services, child, deleted_by):
-        """Deletes the quota applicable to the specified child
-        for all the resources in the mentioned services
+    def set_domain_quotas(self, quotas, domain_id, region_name, parent_data,
+                          created_by):
+        """Updates the domain quotas applicable to the specified region
+        for all the given resources within a single transaction.
 
-        :param service_list: list of services
-        :param child: details of the entity for which quota is to be deleted.
-                      It should be a dictionary
+        :param quotas: dictionary of ceilings keyed by resource name in the
+                       format <service-name>.<resource-name>
+        :param domain_id: domain-id of the domain
+                          for which quota is to be updated
+        :param region_name: name of the region with the mentioned domain-id
+                            for which quota is to be updated
         """
+        services = list(set(name.split('.')[0] for name in quotas))
+
         session = self.get_session()
         with session.begin():
-            quota_ids = self.__get_quota_ids_for_child(child, services,
-                                                       session, None, False)
-            for quota_id in quota_ids:
-                (session.query(QuotasModel)
-                    .filter(QuotasModel.id == str(quota_id))
-                    .update({"closed_at": datetime.datetime.now(),
-                           "closed_by": str(deleted_by)}))
+            # Resolve every existing quota of the domain in a single query
+            query = self._filter_domain_quotas(session.query(QuotasModel),
+                                               domain_id, region_name,
+                                               services)
+            existing = {}
+            for ref in query.all():
+                existing[ref.resource] = ref
+
+            if existing:
+                parents = (session.query(ParentFieldDataModel.key,
+                                         ParentFieldDataModel.value)
+                    .filter(ParentFieldDataModel.quota_id.in_(
+                        [ref.id for ref in existing.values()]))
+                    .all())
+                for parent in parents:
+                    if (parent.key not in parent_data) or (
+                            parent_data[parent.key] != parent.value):
+                        raise exception.ForbiddenAction(
+                            action='update quota of another parent')
+
+            updates = []
+            history = []
+            for resource_name, ceiling in quotas.iteritems():
+                ref = existing.get(resource_name)
+                if ref is not None:  # record for quota exist
+                    remark = "ceiling: %s -> %s." % (ref.ceiling, ceiling)
+                    update = {'quota_id': ref.id, 'new_ceiling': ceiling,
+                              'new_available': None, 'shift': 0}
+                    if ceiling < 0:
+                        update['new_available'] = -1
+                    elif ref.ceiling < 0:
+                        update['new_available'] = ceiling
+                    else:
+                        update['shift'] = ceiling - ref.ceiling
+                    updates.append(update)
+                    history.append((ref.id, remark, created_by))
+                else:
+                    ref = QuotasModel(str(uuid.uuid4()),
+                                      resource=resource_name,
+                                      ceiling=ceiling,
+                                      available=ceiling,
+                                      created_at=datetime.datetime.now(),
+                                      created_by=str(created_by),
+                                      domain_id=domain_id,
+                                      region=region_name)
+                    session.add(ref)
+                    self.__add_parent(session, ref.id, parent_data)
+            self.__update_ceilings(session, updates)
+            self.__add_history(session, history)
+            sql.next_sequence_value(
+                session, self._version_sequence(domain_id, region_name))
             session.flush()
 
-    def set_domain_quota(self, resource_name, ceiling, domain_id, region_name,
-                         parent_data, created_by):
-        child_data = {}
-        child_data["domain-id"] = domain_id
-        child_data["region"] = region_name
-
-        return self.set_quota(resource_name, ceiling, child_data, parent_data,
-                              created_by)
-
     def delete_domain_quota(self, service_list, domain_id, region_name,
                             deleted_by):
         """Deletes the domain quota applicable to the specified region
@@ -248,10 +270,17 @@ class Quotas(sql.Base, core.Driver):
         :param region_name: name of the region with the mentioned domain-id
                             for which quota is to be deleted
         """
-        child_data = {}
-        child_data["domain-id"] = domain_id
-        child_data["region"] = region_name
-        return self.delete_quota(service_list, child_data, deleted_by)
+        session = self.get_session()
+        with session.begin():
+            query = self._filter_domain_quotas(session.query(QuotasModel),
+                                               domain_id, region_name,
+                                               service_list)
+            query.update({"closed_at": datetime.datetime.now(),
+                          "closed_by": str(deleted_by)},
+                         synchronize_session=False)
+            sql.next_sequence_value(
+                session, self._version_sequence(domain_id, region_name))
+            session.flush()
 
     def get_domain_quota_by_services(self, service_list, domain_id,
                                      region_name):
@@ -265,7 +294,242 @@ class Quotas(sql.Base, core.Driver):
         :param region_name: name of the region with the mentioned domain-id
                             for which quota is to be obtained
         """
-        child_data = {}
-        child_data["domain-id"] = domain_id
-        child_data["region"] = region_name
-        return self.get_quota_by_services(service_list, child_data)
+        session = self.get_session()
+        query = session.query(QuotasModel.service, QuotasModel.resource,
+                              QuotasModel.ceiling)
+        query = self._filter_domain_quotas(query, domain_id, region_name,
+                                           service_list)
+        services_quotas = {}
+        for quota in query.all():
+            resource_name = quota.resource.split('.')[1]
+            resources_quotas = services_quotas.setdefault(str(quota.service),
+                                                          {})
+            resources_quotas[str(resource_name)] = quota.ceiling
+        return services_quotas
+
+    def list_region_quotas(self, region_name, services=None, limit=None,
+                           marker=None):
+        """Lists the quotas of every domain in the specified region.
+
+        The domains are paged with a keyset on their domain-id and all the
+        ceilings of a page are fetched within a single query.
+
+        :param region_name: name of the region to list the quotas of
+        :param services: optional list of services to restrict the listing to
+        :param limit: maximum number of domains to return
+        :param marker: domain-id of the last domain of the previous page
+        """
+        session = self.get_session()
+
+        def _filter(query):
+            query = (query
+                .filter(QuotasModel.region == region_name)
+                .filter(QuotasModel.closed_at == None))  # flake8: noqa
+            if services:
+                query = query.filter(QuotasModel.service.in_(services))
+            return query
+
+        domains = _filter(session.query(QuotasModel.domain_id)).distinct()
+        if marker is not None:
+            marker = DomainMarker(domain_id=marker)
+        domains = db_utils.paginate_query(domains, QuotasModel, limit,
+                                          ['domain_id'], marker=marker)
+        page = domains.subquery()
+
+        query = session.query(QuotasModel.domain_id, QuotasModel.service,
+                              QuotasModel.resource, QuotasModel.ceiling)
+        query = (_filter(query)
+            .join(page, QuotasModel.domain_id == page.c.domain_id)
+            .order_by(QuotasModel.domain_id))
+
+        domains_quotas = []
+        for quota in query.all():
+            if (not domains_quotas or
+                    domains_quotas[-1]['domain_id'] != quota.domain_id):
+                domains_quotas.append({'domain_id': quota.domain_id,
+                                       'region': region_name,
+                                       'quotas': {}})
+            resource_name = quota.resource.split('.')[1]
+            services_quotas = domains_quotas[-1]['quotas']
+            resources_quotas = services_quotas.setdefault(str(quota.service),
+                                                          {})
+            resources_quotas[str(resource_name)] = quota.ceiling
+        return domains_quotas
+
+    def list_domain_quota_history(self, domain_id, region_name, limit=None,
+                                  marker=None):
+        """Lists the ceiling changes of the quotas of a domain in a region,
+        most recent first.
+
+        :param domain_id: domain-id of the domain
+                          for which the history is to be listed
+        :param region_name: name of the region with the mentioned domain-id
+                            for which the history is to be listed
+        :param limit: maximum number of changes to return
+        :param marker: id of the last change of the previous page
+        """
+        session = self.get_session()
+        marker_ref = None
+        if marker is not None:
+            marker_ref = session.query(HistoryQuotasModel).get(marker)
+            if marker_ref is None:
+                raise exception.ValidationError(attribute='marker',
+                                                target='query')
+
+        query = (session.query(HistoryQuotasModel, QuotasModel.resource)
+            .join(QuotasModel, QuotasModel.id == HistoryQuotasModel.quota_id)
+            .filter(QuotasModel.domain_id == domain_id)
+            .filter(QuotasModel.region == region_name))
+        query = db_utils.paginate_query(query, HistoryQuotasModel, limit,
+                                        ['seq'],
+                                        marker=marker_ref, sort_dir='desc')
+        history = []
+        for ref, resource_name in query.all():
+            change = ref.to_dict()
+            change['resource'] = resource_name
+            history.append(change)
+        return history
+
+    def list_quota_history_before(self, before, limit):
+        """Lists the oldest ceiling changes made before a point in time."""
+        session = self.get_session()
+        query = (session.query(HistoryQuotasModel)
+            .filter(HistoryQuotasModel.updated_at < before)
+            .order_by(HistoryQuotasModel.seq)
+            .limit(limit))
+        return [ref.to_dict() for ref in query.all()]
+
+    def delete_quota_history(self, history_ids):
+        session = self.get_session()
+        with session.begin():
+            (session.query(HistoryQuotasModel)
+                .filter(HistoryQuotasModel.id.in_(history_ids))
+                .delete(synchronize_session=False))
+
+    def _adjust_available(self, session, quota_id, delta):
+        """Atomically takes delta out of the available capacity of a quota.
+
+        The update only applies while enough capacity is left, which makes it
+        a compare-and-swap on the row; quotas with an unlimited ceiling are
+        never decremented.
+
+        :returns: whether the capacity could be taken
+        """
+        query = (session.query(QuotasModel)
+            .filter(QuotasModel.id == quota_id)
+            .filter(QuotasModel.ceiling >= 0))
+        if delta > 0:
+            query = query.filter(QuotasModel.available >= delta)
+        updated = query.update(
+            {'available': QuotasModel.available - delta},
+            synchronize_session=False)
+        if updated:
+            return True
+        # Either the capacity is exhausted or the ceiling is unlimited
+        return not (session.query(QuotasModel.id)
+            .filter(QuotasModel.id == quota_id)
+            .filter(QuotasModel.ceiling >= 0).count())
+
+    def _release_reservation(self, session, ref, committed):
+        """Deletes a reservation row and settles the capacity it holds.
+
+        Capacity taken at reservation time is given back unless the
+        reservation is committed, while releases (negative deltas) only free
+        capacity once committed.
+
+        Deleting by primary key and checking the row count guarantees that a
+        reservation is only ever settled once, even when it is reclaimed,
+        committed or rolled back concurrently.
+
+        :returns: whether this call settled the reservation
+        """
+        deleted = (session.query(ReservationModel)
+            .filter(ReservationModel.id == ref.id)
+            .delete(synchronize_session=False))
+        if not deleted:
+            return False
+        if (ref.delta < 0) == committed:
+            self._adjust_available(session, ref.quota_id, -abs(ref.delta))
+        return True
+
+    def _reclaim_expired_reservations(self, session, quota_ids):
+        now = timeutils.utcnow()
+        expired = (session.query(ReservationModel)
+            .filter(ReservationModel.quota_id.in_(quota_ids))
+            .filter(ReservationModel.expires_at < now)
+            .all())
+        for ref in expired:
+            self._release_reservation(session, ref, committed=False)
+
+    def reserve_domain_quota(self, deltas, domain_id, region_name,
+                             expires_at):
+        services = list(set(name.split('.')[0] for name in deltas))
+        reservation_id = uuid.uuid4().hex
+        session = self.get_session()
+        with session.begin():
+            query = self._filter_domain_quotas(session.query(QuotasModel),
+                                               domain_id, region_name,
+                                               services)
+            quotas = {}
+            for ref in query.all():
+                quotas[ref.resource] = ref
+            for resource_name in deltas:
+                if resource_name not in quotas:
+                    raise exception.QuotaNotFound(resource=resource_name)
+
+            self._reclaim_expired_reservations(
+                session, [ref.id for ref in quotas.values()])
+
+            now = timeutils.utcnow()
+            for resource_name, delta in deltas.iteritems():
+                quota_id = quotas[resource_name].id
+                # NOTE: releases are only applied on commit, so a rollback
+                # can never push the available capacity over the ceiling.
+                if delta > 0 and not self._adjust_available(session,
+                                                            quota_id, delta):
+                    raise exception.QuotaExceeded(resource=resource_name)
+                session.add(ReservationModel(id=uuid.uuid4().hex,
+                                             reservation_id=reservation_id,
+                                             quota_id=quota_id,
+                                             delta=delta,
+                                             created_at=now,
+                                             expires_at=expires_at))
+            session.flush()
+        return {'id': reservation_id,
+                'domain_id': domain_id,
+                'region': region_name,
+                'resources': deltas,
+                'expires_at': expires_at}
+
+    def _get_reservations(self, session, reservation_id, domain_id):
+        refs = (session.query(ReservationModel)
+            .join(QuotasModel, QuotasModel.id == ReservationModel.quota_id)
+            .filter(ReservationModel.reservation_id == reservation_id)
+            .filter(QuotasModel.domain_id == domain_id)
+            .all())
+        if not refs:
+            raise exception.QuotaReservationNotFound(
+                reservation_id=reservation_id)
+        return refs
+
+    def commit_domain_quota_reservation(self, reservation_id, domain_id):
+        session = self.get_session()
+        with session.begin():
+            now = timeutils.utcnow()
+            refs = [ref for ref in self._get_reservations(session,
+                                                          reservation_id,
+                                                          domain_id)
+                    if ref.expires_at >= now]
+            released = [ref for ref in refs
+                        if self._release_reservation(session, ref,
+                                                     committed=True)]
+            if not released:
+                raise exception.QuotaReservationNotFound(
+                    reservation_id=reservation_id)
+
+    def rollback_domain_quota_reservation(self, reservation_id, domain_id):
+        session = self.get_session()
+        with session.begin():
+            for ref in self._get_reservations(session, reservation_id,
+                                              domain_id):
+                self._release_reservation(session, ref, committed=False)
@@ -0,0 +1,408 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""SQL quota driver accounting reservations against in-memory counters.
+
+The available capacity of the quotas is kept in process memory, sharded by
+domain and region, so that reserving, committing and rolling back quota does
+not need a database round-trip. The changes are written back to the SQL
+tables in a single transaction once ``usage_flush_threshold`` operations have
+been accounted or ``usage_flush_interval`` seconds have passed.
+
+Each flush leaves the database in a consistent state: the available capacity
+of the quotas and the reservation rows always match. On startup, expired
+reservations found in the database are reclaimed and the outstanding ones are
+loaded back into memory, so a crash only loses the operations accounted since
+the last flush.
+
+NOTE: the counters are owned by the process, this driver must only be used
+when a single keystone process serves the reservations of the quotas.
+
+"""
+
+import contextlib
+import threading
+import time
+import uuid
+
+from keystone import config
+from keystone import exception
+from keystone.openstack.common import log as logging
+from keystone.openstack.common import loopingcall
+from keystone.openstack.common import timeutils
+from keystone.quota.backends import sql
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+
+class Shard(object):
+    """Usage counters of the open quotas of a domain in a region."""
+
+    def __init__(self, quotas):
+        # resource name -> {'id': ..., 'ceiling': ..., 'available': ...}
+        self.quotas = quotas
+        self.lock = threading.Lock()
+        self.closed = False
+
+
+class Quotas(sql.Quotas):
+    def __init__(self):
+        super(Quotas, self).__init__()
+        # NOTE: locks are always taken in the shard, flush, state order.
+        self._state_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._shards = {}
+        # reservation id -> {'id', 'domain_id', 'region', 'deltas',
+        #                    'expires_at', 'persisted'}
+        # where deltas is a list of (resource name, quota id, delta)
+        self._reservations = {}
+        # (domain id, region) -> set of reservation ids
+        self._shard_reservations = {}
+        # changes accounted in memory and not flushed yet
+        self._available_deltas = {}
+        self._created = set()
+        self._settled = set()
+        self._pending_count = 0
+        self._flushed_at = time.time()
+        self._reconciled = False
+        self._flush_timer = None
+
+    def _reconcile(self):
+        """Loads the outstanding reservations left in the database.
+
+        Reservations which expired while no process was serving them are
+        reclaimed first, through the regular SQL driver.
+        """
+        with self._flush_lock:
+            if self._reconciled:
+                return
+            session = self.get_session()
+            with session.begin():
+                now = timeutils.utcnow()
+                query = session.query(sql.ReservationModel)
+                query = query.filter(sql.ReservationModel.expires_at < now)
+                expired = query.all()
+                for ref in expired:
+                    self._release_reservation(session, ref, committed=False)
+                query = session.query(sql.ReservationModel,
+                                      sql.QuotasModel.domain_id,
+                                      sql.QuotasModel.region,
+                                      sql.QuotasModel.resource)
+                query = query.join(
+                    sql.QuotasModel,
+                    sql.QuotasModel.id == sql.ReservationModel.quota_id)
+                refs = query.all()
+            with self._state_lock:
+                for ref, domain_id, region_name, resource_name in refs:
+                    reservation = self._reservations.setdefault(
+                        ref.reservation_id,
+                        {'id': ref.reservation_id,
+                         'domain_id': domain_id,
+                         'region': region_name,
+                         'deltas': [],
+                         'expires_at': ref.expires_at,
+                         'persisted': True})
+                    reservation['deltas'].append((resource_name,
+                                                  ref.quota_id, ref.delta))
+                    key = (domain_id, region_name)
+                    self._shard_reservations.setdefault(key, set()).add(
+                        ref.reservation_id)
+                self._reconciled = True
+
+        interval = CONF.quota.usage_flush_interval
+        if interval > 0 and self._flush_timer is None:
+            self._flush_timer = loopingcall.FixedIntervalLoopingCall(
+                self._flush_on_interval)
+            self._flush_timer.start(interval=interval, initial_delay=interval)
+
+    def _get_shard(self, domain_id, region_name):
+        if not self._reconciled:
+            self._reconcile()
+        key = (domain_id, region_name)
+        shard = self._shards.get(key)
+        if shard is not None:
+            return shard
+
+        # NOTE: holding the flush lock guarantees that the changes read back
+        # from the database and the pending ones do not overlap.
+        with self._flush_lock:
+            session = self.get_session()
+            refs = (session.query(sql.QuotasModel.id,
+                                  sql.QuotasModel.resource,
+                                  sql.QuotasModel.ceiling,
+                                  sql.QuotasModel.available)
+                .filter(sql.QuotasModel.domain_id == domain_id)
+                .filter(sql.QuotasModel.region == region_name)
+                .filter(sql.QuotasModel.closed_at == None)  # noqa
+                .all())
+            with self._state_lock:
+                shard = self._shards.get(key)
+                if shard is None:
+                    quotas = {}
+                    for ref in refs:
+                        available = ref.available
+                        if ref.ceiling >= 0:
+                            available += self._available_deltas.get(ref.id,
+                                                                    0)
+                        quotas[ref.resource] = {'id': ref.id,
+                                                'ceiling': ref.ceiling,
+                                                'available': available}
+                    shard = Shard(quotas)
+                    self._shards[key] = shard
+        return shard
+
+    @contextlib.contextmanager
+    def _locked_shard(self, domain_id, region_name):
+        while True:
+            shard = self._get_shard(domain_id, region_name)
+            with shard.lock:
+                # the shard may have been dropped while waiting for the lock
+                if not shard.closed:
+                    yield shard
+                    return
+
+    def _drop_shard(self, domain_id, region_name):
+        """Forgets the counters of a shard, they are reloaded on next use."""
+        with self._state_lock:
+            shard = self._shards.pop((domain_id, region_name), None)
+        if shard is not None:
+            with shard.lock:
+                shard.closed = True
+
+    def _account(self, shard, resource_name, quota_id, amount):
+        """Adds amount to the available capacity of a quota.
+
+        Must be called with the state lock held.
+        """
+        quota = shard.quotas.get(resource_name)
+        if quota is not None and quota['id'] == quota_id:
+            if quota['ceiling'] < 0:
+                return
+            quota['available'] += amount
+        self._available_deltas[quota_id] = (
+            self._available_deltas.get(quota_id, 0) + amount)
+
+    def _settle(self, shard, reservation, committed):
+        """Gives back or keeps the capacity held by a reservation.
+
+        Must be called with the state lock held, mirrors
+        :meth:`keystone.quota.backends.sql.Quotas._release_reservation`.
+        """
+        del self._reservations[reservation['id']]
+        key = (reservation['domain_id'], reservation['region'])
+        self._shard_reservations[key].discard(reservation['id'])
+        if reservation['persisted']:
+            self._settled.add(reservation['id'])
+        else:
+            self._created.discard(reservation['id'])
+        for resource_name, quota_id, delta in reservation['deltas']:
+            if (delta < 0) == committed:
+                self._account(shard, resource_name, quota_id, abs(delta))
+        self._pending_count += 1
+
+    def _reclaim_expired(self, shard, domain_id, region_name):
+        """Must be called with the state lock held."""
+        now = timeutils.utcnow()
+        reservation_ids = self._shard_reservations.get(
+            (domain_id, region_name), ())
+        expired = [self._reservations[reservation_id]
+                   for reservation_id in reservation_ids
+                   if self._reservations[reservation_id]['expires_at'] < now]
+        for reservation in expired:
+            self._settle(shard, reservation, committed=False)
+
+    def reserve_domain_quota(self, deltas, domain_id, region_name,
+                             expires_at):
+        with self._locked_shard(domain_id, region_name) as shard:
+            for resource_name in deltas:
+                if resource_name not in shard.quotas:
+                    raise exception.QuotaNotFound(resource=resource_name)
+
+            with self._state_lock:
+                self._reclaim_expired(shard, domain_id, region_name)
+
+                for resource_name, delta in deltas.iteritems():
+                    quota = shard.quotas[resource_name]
+                    if (delta > 0 and quota['ceiling'] >= 0 and
+                            quota['available'] < delta):
+                        raise exception.QuotaExceeded(resource=resource_name)
+
+                reservation_id = uuid.uuid4().hex
+                reservation = {'id': reservation_id,
+                               'domain_id': domain_id,
+                               'region': region_name,
+                               'deltas': [],
+                               'expires_at': expires_at,
+                               'persisted': False}
+                for resource_name, delta in deltas.iteritems():
+                    quota_id = shard.quotas[resource_name]['id']
+                    # NOTE: releases are only applied on commit, like the SQL
+                    # driver does.
+                    if delta > 0:
+                        self._account(shard, resource_name, quota_id, -delta)
+                    reservation['deltas'].append((resource_name, quota_id,
+                                                  delta))
+                self._reservations[reservation_id] = reservation
+                self._shard_reservations.setdefault(
+                    (domain_id, region_name), set()).add(reservation_id)
+                self._created.add(reservation_id)
+                self._pending_count += 1
+
+        self._flush_on_threshold()
+        return {'id': reservation_id,
+                'domain_id': domain_id,
+                'region': region_name,
+                'resources': deltas,
+                'expires_at': expires_at}
+
+    def _settle_reservation(self, reservation_id, domain_id, committed):
+        if not self._reconciled:
+            self._reconcile()
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None or reservation['domain_id'] != domain_id:
+            raise exception.QuotaReservationNotFound(
+                reservation_id=reservation_id)
+
+        with self._locked_shard(domain_id, reservation['region']) as shard:
+            with self._state_lock:
+                # settled concurrently while waiting for the shard
+                if reservation_id not in self._reservations:
+                    raise exception.QuotaReservationNotFound(
+                        reservation_id=reservation_id)
+                expired = reservation['expires_at'] < timeutils.utcnow()
+                self._settle(shard, reservation, committed and not expired)
+
+        self._flush_on_threshold()
+        if committed and expired:
+            raise exception.QuotaReservationNotFound(
+                reservation_id=reservation_id)
+
+    def commit_domain_quota_reservation(self, reservation_id, domain_id):
+        self._settle_reservation(reservation_id, domain_id, committed=True)
+
+    def rollback_domain_quota_reservation(self, reservation_id, domain_id):
+        self._settle_reservation(reservation_id, domain_id, committed=False)
+
+    def set_domain_quotas(self, quotas, domain_id, region_name, parent_data,
+                          created_by):
+        # NOTE: the SQL driver shifts the available capacity by the change of
+        # the ceilings, the pending changes are kept on top of it when the
+        # shard is loaded again.
+        ret = super(Quotas, self).set_domain_quotas(quotas, domain_id,
+                                                    region_name, parent_data,
+                                                    created_by)
+        self._drop_shard(domain_id, region_name)
+        return ret
+
+    def delete_domain_quota(self, service_list, domain_id, region_name,
+                            deleted_by):
+        ret = super(Quotas, self).delete_domain_quota(service_list, domain_id,
+                                                      region_name, deleted_by)
+        self._drop_shard(domain_id, region_name)
+        return ret
+
+    def _flush_on_threshold(self):
+        threshold = CONF.quota.usage_flush_threshold
+        interval = CONF.quota.usage_flush_interval
+        if ((threshold > 0 and self._pending_count >= threshold) or
+                (interval > 0 and
+                 time.time() - self._flushed_at >= interval)):
+            self._flush_on_interval()
+
+    def _flush_on_interval(self):
+        try:
+            self.flush_usage()
+        except Exception:
+            # NOTE: the changes are kept and retried on the next flush.
+            LOG.exception(_('Failed to flush the quota usage.'))
+
+    def flush_usage(self):
+        """Writes the changes accounted in memory to the database.
+
+        All the changes are written within a single transaction, when it
+        fails they are kept in memory for the next flush.
+        """
+        with self._flush_lock:
+            with self._state_lock:
+                available_deltas = self._available_deltas
+                settled = self._settled
+                created = []
+                for reservation_id in self._created:
+                    reservation = self._reservations[reservation_id]
+                    reservation['persisted'] = True
+                    created.append(dict(reservation,
+                                        deltas=list(reservation['deltas'])))
+                self._available_deltas = {}
+                self._settled = set()
+                self._created = set()
+                self._pending_count = 0
+                self._flushed_at = time.time()
+
+            try:
+                self._write_usage(available_deltas, settled, created)
+            except Exception:
+                with self._state_lock:
+                    self._restore_usage(available_deltas, settled, created)
+                raise
+
+    def _write_usage(self, available_deltas, settled, created):
+        session = self.get_session()
+        with session.begin():
+            for quota_id, delta in available_deltas.iteritems():
+                if not delta:
+                    continue
+                (session.query(sql.QuotasModel)
+                    .filter(sql.QuotasModel.id == quota_id)
+                    .filter(sql.QuotasModel.ceiling >= 0)
+                    .update({'available': sql.QuotasModel.available + delta},
+                            synchronize_session=False))
+            if settled:
+                (session.query(sql.ReservationModel)
+                    .filter(sql.ReservationModel.reservation_id.in_(
+                        list(settled)))
+                    .delete(synchronize_session=False))
+            now = timeutils.utcnow()
+            for reservation in created:
+                for resource_name, quota_id, delta in reservation['deltas']:
+                    session.add(sql.ReservationModel(
+                        id=uuid.uuid4().hex,
+                        reservation_id=reservation['id'],
+                        quota_id=quota_id,
+                        delta=delta,
+                        created_at=now,
+                        expires_at=reservation['expires_at']))
+            session.flush()
+
+    def _restore_usage(self, available_deltas, settled, created):
+        """Merges back the changes of a failed flush.
+
+        Must be called with the state lock held.
+        """
+        for quota_id, delta in available_deltas.iteritems():
+            self._available_deltas[quota_id] = (
+                self._available_deltas.get(quota_id, 0) + delta)
+        self._settled.update(settled)
+        for reservation in created:
+            reservation_id = reservation['id']
+            if reservation_id in self._settled:
+                # settled since, it never has to be written
+                self._settled.discard(reservation_id)
+            elif reservation_id in self._reservations:
+                self._reservations[reservation_id]['persisted'] = False
+                self._created.add(reservation_id)
+        self._pending_count += 1
@@ -16,12 +16,15 @@
 # under the License.
 """WSGI Routers for the Identity service."""
 
+import urllib
 
 from keystone.common import controller
 from keystone.common import dependency
+from keystone.common import wsgi
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import log as logging
+from keystone.openstack.common import timeutils
 
 CONF = config.CONF
 LOG = logging.getLogger(__name__)
@@ -48,52 +51,30 @@ class DomainQuota(controller.V3Controller):
     def _cloud_admin_info_to_dict(self, context, domain_id):
         return {"role": "admin"}
 
-    def _get_default_values(self, domain_id, region_name, minus, servs):
+    def _get_default_values(self, domain_id, region_name, services):
         child = dict(domain_id=domain_id, region=region_name)
-        services = minus.keys()
-
-        if not services:
-            services = servs
-
-        defaults = dict()
-        if 'nova' in services:
-            nova = dict()
-            for option, value in CONF.nova.iteritems():
-                if (not minus) or (option not in minus['nova'].keys()):
-                    nova[option] = value
-                else:
-                    nova[option] = minus['nova'][option]
-            defaults['nova'] = nova
-        if 'cinder' in services:
-            cinder = dict()
-            for option, value in CONF.cinder.interitems():
-                if (not minus) or (option not in minus['cinder'].keys()):
-                    cinder[option] = value
-                else:
-                    cinder[option] = minus['cinder'][option]
-            defaults['cinder'] = cinder
-        if 'neutron' in services:
-            neutron = dict()
-            for option, value in CONF.neutron.interitems():
-                if (not minus) or (option not in minus['neutron'].keys()):
-                    neutron[option] = value
-                else:
-                    neutron[option] = minus['neutron'][option]
-            defaults['neutron'] = neutron
-
+        defaults = self.quota_api.get_domain_quotas_with_defaults(
+            services, domain_id, region_name)
         return list(list([child, defaults]))
 
     @controller.protected()
-    def get_domain_quotas_for_region(self, domain_id,
+    def get_domain_quotas_for_region(self, context, domain_id,
                                      quotas=None):
-        """Get quotas from domain_id by region."""
+        """Get quotas from domain_id by region.
+
+        The region and services are read from the query string when the
+        request has no body. Responses carry an ETag, a request whose
+        If-None-Match matches it gets a 304 without reading the ceilings.
+        """
         if quotas is None:
-            raise exception.ValidationError(attribute="quotas",
-                                            target="request")
-        
-        domain = self.identity_api.get_domain(domain_id)
-        if domain is None:
-            raise exception.DomainNotFound(domain_id)
+            query = context['query_string']
+            quotas = {}
+            if 'region' in query:
+                quotas['region'] = query['region']
+            if query.get('services'):
+                quotas['services'] = query['services'].split(',')
+
+        self.identity_api.get_domain(domain_id)
 
         self._require_attribute(quotas, 'region')
         self._require_attribute(quotas, 'services')
@@ -101,12 +82,73 @@ class DomainQuota(controller.V3Controller):
         services = quotas['services']
 
         #return ceilings
-        ceilings = self.quota_api.get_domain_quota_by_services(services,
-                                                               domain_id,
-                                                               region)
-        result = self._get_default_values(domain_id, region, ceilings,
-                                          services)
-        return result
+        version = self.quota_api.get_domain_quota_version(domain_id, region)
+        return wsgi.render_conditional_response(
+            context, version,
+            lambda: self._get_default_values(domain_id, region, services),
+            variant=(region, sorted(services)))
+
+    def _is_integer(self, value):
+        return (isinstance(value, (int, long)) and
+                not isinstance(value, bool))
+
+    def _get_limit(self, query):
+        try:
+            limit = int(query.get('limit', CONF.quota.list_limit))
+        except ValueError:
+            raise exception.ValidationError(attribute='limit',
+                                            target='query')
+        if limit <= 0:
+            raise exception.ValidationError(attribute='limit',
+                                            target='query')
+        return min(limit, CONF.quota.list_limit)
+
+    def _wrap_page(self, context, collection_name, refs, limit, marker_attr):
+        """Wraps a page of refs, linking to the next page if there may be
+        one, keyed by the marker_attr of the last ref.
+        """
+        next_url = None
+        if len(refs) == limit:
+            next_query = dict(context['query_string'],
+                              marker=refs[-1][marker_attr])
+            next_url = '%s?%s' % (self.base_url(path=context['path']),
+                                  urllib.urlencode(sorted(
+                                      next_query.items())))
+        return {collection_name: refs,
+                'links': {'next': next_url,
+                          'self': self.base_url(path=context['path']),
+                          'previous': None}}
+
+    @controller.protected()
+    def list_region_quotas(self, context):
+        """Lists the quotas of every domain in a region."""
+        query = context['query_string']
+        self._require_attribute(query, 'region')
+        services = None
+        if query.get('services'):
+            services = query['services'].split(',')
+
+        limit = self._get_limit(query)
+        refs = self.quota_api.list_region_quotas(query['region'], services,
+                                                 limit, query.get('marker'))
+        return self._wrap_page(context, self.collection_name, refs, limit,
+                               'domain_id')
+
+    @controller.protected()
+    def list_domain_quota_history(self, context, domain_id):
+        """Lists the ceiling changes of a domain in a region."""
+        self.identity_api.get_domain(domain_id)
+
+        query = context['query_string']
+        self._require_attribute(query, 'region')
+        limit = self._get_limit(query)
+        refs = self.quota_api.list_domain_quota_history(domain_id,
+                                                        query['region'],
+                                                        limit,
+                                                        query.get('marker'))
+        for ref in refs:
+            ref['updated_at'] = timeutils.isotime(ref['updated_at'])
+        return self._wrap_page(context, 'history', refs, limit, 'id')
 
     @controller.protected()
     def update_domain_quotas_in_region(self, context, domain_id,
@@ -125,35 +167,28 @@ class DomainQuota(controller.V3Controller):
 
         quotas_to_update = {}
         services = list()
-        if "nova" in quotas:
-            quotas_to_update.update(self._concatenate_service_name(
-                quotas['nova'], 'nova'))
-            services.append("nova")
-
-        if "cinder" in quotas:
-            quotas_to_update.update(self._concatenate_service_name(
-                quotas['cinder'], 'cinder'))
-            services.append("cinder")
-
-        if "neutron" in quotas:
+        for service, ceilings in quotas.iteritems():
+            if service == 'region':
+                continue
+            if not isinstance(ceilings, dict):
+                raise exception.ValidationError(attribute=service,
+                                                target='quotas')
+            for resource_name, ceiling in ceilings.iteritems():
+                if not self._is_integer(ceiling):
+                    raise exception.ValidationError(attribute=resource_name,
+                                                    target=service)
             quotas_to_update.update(self._concatenate_service_name(
-                quotas['neutron'], 'neutron'))
-            services.append("neutron")
+                ceilings, service))
+            services.append(service)
 
         created_by = self._user_info_to_dict(context)
         parent_data = self._cloud_admin_info_to_dict(context, domain_id)
         try:
             #update
-            for resource, new_ceiling in quotas_to_update.iteritems():
-                self.quota_api.set_domain_quota(resource, new_ceiling,
-                                                domain_id, region, parent_data,
-                                                created_by)
-
-            ceilings = self.quota_api.get_domain_quota_by_services(services,
-                                                                   domain_id,
-                                                                   region)
-            result = self._get_default_values(domain_id, region, ceilings,
-                                              services)
+            self.quota_api.set_domain_quotas(quotas_to_update, domain_id,
+                                             region, parent_data, created_by)
+
+            result = self._get_default_values(domain_id, region, services)
             return result
         except exception.Error as error:
             raise error
@@ -182,12 +217,55 @@ class DomainQuota(controller.V3Controller):
             self.quota_api.delete_domain_quota(services, domain_id, region,
                                                deleted_by)
 
-            ceilings = self.quota_api.get_domain_quota_by_services(services,
-                                                                   domain_id,
-                                                                   region)
-            result = self._get_default_values(domain_id, region, ceilings,
-                                              services)
+            result = self._get_default_values(domain_id, region, services)
             return result
 
         except exception.Error as error:
             raise error
+
+    @controller.protected()
+    def reserve_domain_quota(self, context, domain_id, reservation=None):
+        """Atomically reserves quota capacity of a domain in a region."""
+        if reservation is None:
+            raise exception.ValidationError(attribute='reservation',
+                                            target='request')
+
+        domain = self.identity_api.get_domain(domain_id)
+        if domain is None:
+            raise exception.DomainNotFound(domain_id)
+
+        self._require_attribute(reservation, 'region')
+        self._require_attribute(reservation, 'resources')
+        resources = reservation['resources']
+        if not isinstance(resources, dict) or not resources:
+            raise exception.ValidationError(attribute='resources',
+                                            target='reservation')
+        for resource_name, delta in resources.iteritems():
+            if not self._is_integer(delta):
+                raise exception.ValidationError(attribute=resource_name,
+                                                target='resources')
+        expire = reservation.get('expire')
+        if expire is not None and (not self._is_integer(expire) or
+                                   expire <= 0):
+            raise exception.ValidationError(attribute='expire',
+                                            target='reservation')
+
+        ref = self.quota_api.reserve_domain_quota(resources, domain_id,
+                                                  reservation['region'],
+                                                  expire)
+        ref['expires_at'] = timeutils.isotime(ref['expires_at'])
+        return {'reservation': ref}
+
+    @controller.protected()
+    def commit_domain_quota_reservation(self, context, domain_id,
+                                        reservation_id):
+        """Makes the capacity held by a reservation permanent."""
+        self.quota_api.commit_domain_quota_reservation(reservation_id,
+                                                       domain_id)
+
+    @controller.protected()
+    def rollback_domain_quota_reservation(self, context, domain_id,
+                                          reservation_id):
+        """Gives back the capacity held by a reservation."""
+        self.quota_api.rollback_domain_quota_reservation(reservation_id,
+                                                         domain_id)
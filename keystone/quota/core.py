@@ -16,15 +16,91 @@
 
 """Main entry point into the Quota extension."""
 
+import datetime
+import json
+
+from oslo.config import cfg
+
+from keystone.common import cache
 from keystone.common import dependency
 from keystone.common import manager
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import log as logging
+from keystone.openstack.common import timeutils
 
 
 CONF = config.CONF
 LOG = logging.getLogger(__name__)
+SHOULD_CACHE = cache.should_cache_fn('quota')
+
+
+class DefaultQuotas(object):
+    """Registry of the default ceilings of the services with quotas.
+
+    The defaults of every service listed in the ``services`` option of the
+    ``[quota]`` section are read once from the configuration group named
+    after the service, so that requests never walk the configuration. The
+    groups of the services keystone does not know about are registered with
+    a single ``defaults`` option, a dictionary of ceilings keyed by resource
+    name. More defaults can be registered at runtime with :meth:`register`.
+
+    """
+
+    def __init__(self, conf=None):
+        if conf is None:
+            conf = CONF
+        self._defaults = {}
+        for service in conf.quota.services:
+            if service not in conf:
+                conf.register_opt(cfg.DictOpt('defaults', default={}),
+                                  group=service)
+            # NOTE: the group of a service is registered by the first
+            # registry built on the configuration, later ones find it.
+            if 'defaults' in conf[service]:
+                defaults = conf[service].defaults
+            else:
+                defaults = dict(conf[service].iteritems())
+            self.register(service, self._parse_defaults(service, defaults))
+
+    def _parse_defaults(self, service, defaults):
+        ceilings = {}
+        for resource_name, ceiling in defaults.iteritems():
+            try:
+                ceilings[resource_name] = int(ceiling)
+            except (TypeError, ValueError):
+                msg = _('Unable to parse the default ceiling of %(service)s '
+                        'resource %(resource)s: %(ceiling)s. Skipping it.')
+                LOG.error(msg, {'service': service,
+                                'resource': resource_name,
+                                'ceiling': ceiling})
+        return ceilings
+
+    def register(self, service, defaults):
+        """Registers (or replaces) the default ceilings of a service.
+
+        :param defaults: dictionary of ceilings keyed by resource name,
+        without the service name prefix.
+        """
+        self._defaults[service] = dict(defaults)
+
+    def services(self):
+        return self._defaults.keys()
+
+    def merge(self, ceilings, services):
+        """Merges stored ceilings over the defaults of the given services.
+
+        :param ceilings: dictionary of ceilings keyed by service then by
+        resource name, as returned by get_domain_quota_by_services.
+        :returns: dictionary of ceilings keyed by service then by resource
+        name for all the given services.
+        """
+        quotas = {}
+        for service in services:
+            merged = dict(self._defaults.get(service, {}))
+            merged.update(ceilings.get(service, {}))
+            quotas[service] = merged
+        return quotas
 
 
 @dependency.provider('quota_api')
@@ -37,6 +113,125 @@ class Manager(manager.Manager):
 
     def __init__(self):
         super(Manager, self).__init__(CONF.quota.driver)
+        self.defaults = DefaultQuotas()
+
+    def get_domain_quotas_with_defaults(self, service_list, domain_id,
+                                        region_name):
+        """Gets the ceilings of the given services, falling back to the
+        default ceilings of the resources without a stored ceiling.
+        """
+        ceilings = self.get_domain_quota_by_services(service_list, domain_id,
+                                                     region_name)
+        return self.defaults.merge(ceilings, service_list)
+
+    def get_domain_quota_by_services(self, service_list, domain_id,
+                                     region_name):
+        # NOTE: ceilings are cached per (service, domain, region) rather than
+        # per service list, so that a write to a single service invalidates
+        # exactly one cache key regardless of which service combinations
+        # have been requested by consumers.
+        services_quotas = {}
+        for service in service_list:
+            quotas = self._get_domain_quota_by_service(service, domain_id,
+                                                       region_name)
+            if quotas:
+                services_quotas[service] = quotas
+        return services_quotas
+
+    @cache.on_arguments(should_cache_fn=SHOULD_CACHE,
+                        expiration_time=CONF.quota.cache_time)
+    def _get_domain_quota_by_service(self, service, domain_id, region_name):
+        quotas = self.driver.get_domain_quota_by_services([service],
+                                                          domain_id,
+                                                          region_name)
+        return quotas.get(service, {})
+
+    def get_domain_quota_version(self, domain_id, region_name):
+        """Returns the version of the ceilings of a domain in a region, or
+        None when the backend keeps none.
+
+        The version is read from the backend on every call rather than
+        cached, so that all the processes agree on it.
+        """
+        try:
+            return self.driver.get_domain_quota_version(domain_id,
+                                                        region_name)
+        except exception.NotImplemented:
+            return None
+
+    def set_domain_quota(self, resource_name, ceiling, domain_id, region_name,
+                         parent_data, created_by):
+        ret = self.driver.set_domain_quota(resource_name, ceiling, domain_id,
+                                           region_name, parent_data,
+                                           created_by)
+        service = resource_name.split('.')[0]
+        self._invalidate_domain_quota_cache([service], domain_id, region_name)
+        return ret
+
+    def set_domain_quotas(self, quotas, domain_id, region_name, parent_data,
+                          created_by):
+        ret = self.driver.set_domain_quotas(quotas, domain_id, region_name,
+                                            parent_data, created_by)
+        services = set(name.split('.')[0] for name in quotas)
+        self._invalidate_domain_quota_cache(services, domain_id, region_name)
+        return ret
+
+    def delete_domain_quota(self, service_list, domain_id, region_name,
+                            deleted_by):
+        ret = self.driver.delete_domain_quota(service_list, domain_id,
+                                              region_name, deleted_by)
+        self._invalidate_domain_quota_cache(service_list, domain_id,
+                                            region_name)
+        return ret
+
+    def reserve_domain_quota(self, deltas, domain_id, region_name,
+                             expire=None):
+        if expire is None:
+            expire = CONF.quota.reservation_expire
+        expires_at = timeutils.utcnow() + datetime.timedelta(seconds=expire)
+        return self.driver.reserve_domain_quota(deltas, domain_id,
+                                                region_name, expires_at)
+
+    def archive_quota_history(self, stream, before, batch_size=None):
+        """Moves the ceiling changes made before a point in time to a stream.
+
+        The changes are written to the stream as JSON lines, oldest first,
+        and deleted from the backend one batch at a time, once the batch has
+        been flushed to the stream.
+
+        :param stream: file-like object to write the changes to.
+        :param before: datetime before which changes are archived.
+        :param batch_size: number of changes read and deleted at once.
+        :returns: number of archived changes
+        """
+        if batch_size is None:
+            batch_size = CONF.quota.history_archive_batch_size
+        archived = 0
+        while True:
+            history = self.driver.list_quota_history_before(before,
+                                                            batch_size)
+            if not history:
+                break
+            for change in history:
+                change['updated_at'] = timeutils.strtime(change['updated_at'])
+                stream.write(json.dumps(change) + '\n')
+            stream.flush()
+            self.driver.delete_quota_history(
+                [change['id'] for change in history])
+            archived += len(history)
+            LOG.debug(_('Archived %d quota history records.'), archived)
+            if len(history) < batch_size:
+                break
+        return archived
+
+    def _invalidate_domain_quota_cache(self, service_list, domain_id,
+                                       region_name):
+        # NOTE: invalidate takes the exact same arguments as the cached
+        # method, including "self".
+        for service in service_list:
+            self._get_domain_quota_by_service.invalidate(self, service,
+                                                         domain_id,
+                                                         region_name)
 
 
 class Driver(object):
@@ -55,6 +250,23 @@ class Driver(object):
        """
         raise exception.NotImplemented()
 
+    def set_domain_quotas(self, quotas, domain_id, region_name, parent_data,
+                          created_by):
+        """Updates the quotas applicable to the specified child for all the
+        given resources in a single transaction.
+
+        :param quotas: dictionary of ceilings keyed by resource name in the
+        format <service-name>.<resource-name>
+        :param domain_id: domain-id of the domain for which quota is to be
+        updated.
+        :param region_name: name of the region for which quota is to be
+        updated.
+        :param parent_data: details of the entity calling this method. It
+        should be a dictionary and should exactly match the parent_data
+        already present in the db.
+        """
+        raise exception.NotImplemented()
+
     def delete_domain_quota(self, service_list, domain_id, region_name,
                             deleted_by):
         """Deletes quota applicable to the specified child for all the
@@ -79,3 +291,83 @@ class Driver(object):
         It should be a dictionary.
         """
         raise exception.NotImplemented()
+
+    def get_domain_quota_version(self, domain_id, region_name):
+        """Gets the version of the ceilings of a domain in a region, which
+        changes whenever one of them is set or deleted.
+
+        :returns: the version, the same in every process sharing the backend
+        """
+        raise exception.NotImplemented()
+
+    def list_region_quotas(self, region_name, services=None, limit=None,
+                           marker=None):
+        """Lists the quotas of every domain in a region, ordered by domain.
+
+        :param region_name: name of the region to list the quotas of.
+        :param services: optional list of services to restrict the listing
+        to.
+        :param limit: maximum number of domains to return.
+        :param marker: domain-id of the last domain of the previous page.
+        :returns: list of dictionaries with the domain_id, the region and the
+        ceilings keyed by service then by resource name.
+        """
+        raise exception.NotImplemented()
+
+    def list_domain_quota_history(self, domain_id, region_name, limit=None,
+                                  marker=None):
+        """Lists the ceiling changes of the quotas of a domain in a region,
+        most recent first.
+
+        :param limit: maximum number of changes to return.
+        :param marker: id of the last change of the previous page.
+        :returns: list of changes with the id, quota_id, resource,
+        updated_at, updated_by and remark of each change.
+        """
+        raise exception.NotImplemented()
+
+    def list_quota_history_before(self, before, limit):
+        """Lists the oldest ceiling changes made before a point in time.
+
+        :param before: datetime before which changes are listed.
+        :param limit: maximum number of changes to return.
+        """
+        raise exception.NotImplemented()
+
+    def delete_quota_history(self, history_ids):
+        """Deletes the given ceiling changes."""
+        raise exception.NotImplemented()
+
+    def reserve_domain_quota(self, deltas, domain_id, region_name,
+                             expires_at):
+        """Atomically reserves capacity of the specified domain quotas.
+
+        Positive deltas are taken out of the available capacity straight
+        away, negative deltas (releases) are only applied on commit. A
+        reservation that is neither committed nor rolled back before it
+        expires is reclaimed.
+
+        :param deltas: dictionary of amounts keyed by resource name in the
+        format <service-name>.<resource-name>
+        :param domain_id: domain-id of the domain to reserve quota from.
+        :param region_name: name of the region to reserve quota from.
+        :param expires_at: datetime at which the reservation expires.
+        :returns: reservation dictionary
+        :raises: keystone.exception.QuotaNotFound,
+                 keystone.exception.QuotaExceeded
+        """
+        raise exception.NotImplemented()
+
+    def commit_domain_quota_reservation(self, reservation_id, domain_id):
+        """Makes the capacity held by a reservation permanent.
+
+        :raises: keystone.exception.QuotaReservationNotFound
+        """
+        raise exception.NotImplemented()
+
+    def rollback_domain_quota_reservation(self, reservation_id, domain_id):
+        """Gives back the capacity held by a reservation.
+
+        :raises: keystone.exception.QuotaReservationNotFound
+        """
+        raise exception.NotImplemented()
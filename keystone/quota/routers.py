@@ -22,6 +22,11 @@ from keystone.quota import controllers
 def append_v3_routers(mapper, routers):
     quota_controller = controllers.DomainQuota()
 
+    mapper.connect('/quotas',
+                   controller=quota_controller,
+                   action='list_region_quotas',
+                   conditions=dict(method=['GET']))
+
     mapper.connect('/domains/{domain_id}/quotas',
                    controller=quota_controller,
                    action='get_domain_quotas_for_region',
@@ -36,3 +41,25 @@ def append_v3_routers(mapper, routers):
                    controller=quota_controller,
                    action='delete_domain_quotas_from_region',
                    conditions=dict(method=['DELETE']))
+
+    mapper.connect('/domains/{domain_id}/quotas/history',
+                   controller=quota_controller,
+                   action='list_domain_quota_history',
+                   conditions=dict(method=['GET']))
+
+    mapper.connect('/domains/{domain_id}/quotas/reservations',
+                   controller=quota_controller,
+                   action='reserve_domain_quota',
+                   conditions=dict(method=['POST']))
+
+    mapper.connect('/domains/{domain_id}/quotas/reservations/'
+                   '{reservation_id}/commit',
+                   controller=quota_controller,
+                   action='commit_domain_quota_reservation',
+                   conditions=dict(method=['POST']))
+
+    mapper.connect('/domains/{domain_id}/quotas/reservations/'
+                   '{reservation_id}',
+                   controller=quota_controller,
+                   action='rollback_domain_quota_reservation',
+                   conditions=dict(method=['DELETE']))
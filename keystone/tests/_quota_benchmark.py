@@ -0,0 +1,237 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Benchmarks of the quota SQL backend.
+
+Seeds domains x regions x services into a file backed SQLite database, then
+measures the latency percentiles and the number of SQL queries per call of
+the quota manager operations, with and without the cache and the bulk
+updates. The results are written as JSON::
+
+    python -m keystone.tests._quota_benchmark --output quota_benchmark.json
+
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+from sqlalchemy import event
+
+from keystone.common import cache
+from keystone.common import dependency
+from keystone.common import sql
+from keystone import config
+from keystone import quota
+from keystone import tests
+
+
+CONF = config.CONF
+PARENT_DATA = {'role': 'admin'}
+CREATED_BY = {'user_id': 'benchmark', 'role': 'admin'}
+
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of a sorted list of values."""
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class QueryCounter(object):
+    """Counts the statements executed by an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+
+class QuotaBenchmark(object):
+    def __init__(self, domains, regions, services, resources, iterations,
+                 db_file):
+        self.domain_ids = [uuid.uuid4().hex for i in range(domains)]
+        self.regions = ['Region%d' % i for i in range(regions)]
+        self.services = ['service%d' % i for i in range(services)]
+        self.resources = ['resource%d' % i for i in range(resources)]
+        self.iterations = iterations
+        self.db_file = db_file
+        self.random = random.Random(0)
+        self.results = []
+
+    def setup(self):
+        CONF(args=[], project='keystone',
+             default_config_files=[tests.etcdir('keystone.conf.sample'),
+                                   tests.testsdir('test_overrides.conf'),
+                                   tests.testsdir('backend_sql_disk.conf')])
+        CONF.set_override('connection', 'sqlite:///%s' % self.db_file, 'sql')
+        CONF.set_override('proxies', [], 'cache')
+        cache.configure_cache_region(cache.REGION)
+
+        if os.path.exists(self.db_file):
+            os.unlink(self.db_file)
+        dependency.reset()
+        self.quota_api = quota.Manager()
+        engine = sql.Base().get_engine()
+        sql.ModelBase.metadata.create_all(bind=engine)
+        self.queries = QueryCounter(engine)
+
+        for domain_id in self.domain_ids:
+            for region in self.regions:
+                self.quota_api.driver.set_domain_quotas(
+                    self._ceilings(self.services), domain_id, region,
+                    PARENT_DATA, CREATED_BY)
+
+    def _ceilings(self, services):
+        ceilings = {}
+        for service in services:
+            for resource in self.resources:
+                ceilings['%s.%s' % (service, resource)] = (
+                    self.random.randint(1, 1000))
+        return ceilings
+
+    def _scope(self):
+        return (self.random.choice(self.domain_ids),
+                self.random.choice(self.regions))
+
+    def measure(self, operation, mode, call, prepare=None):
+        """Runs call for every iteration, with a fresh random scope.
+
+        prepare, when given, is run before each call and is not measured.
+        """
+        latencies = []
+        queries = 0
+        for i in range(self.iterations):
+            domain_id, region = self._scope()
+            if prepare is not None:
+                prepare(domain_id, region)
+            count = self.queries.count
+            start = time.time()
+            call(domain_id, region)
+            latencies.append((time.time() - start) * 1000.0)
+            queries += self.queries.count - count
+
+        latencies.sort()
+        self.results.append({
+            'operation': operation,
+            'mode': mode,
+            'calls': self.iterations,
+            'queries_per_call': float(queries) / self.iterations,
+            'latency_ms': {
+                'min': latencies[0],
+                'mean': sum(latencies) / len(latencies),
+                'p50': percentile(latencies, 50),
+                'p90': percentile(latencies, 90),
+                'p99': percentile(latencies, 99),
+                'max': latencies[-1]}})
+
+    def run(self):
+        self.setup()
+
+        def get(domain_id, region):
+            self.quota_api.get_domain_quota_by_services(self.services,
+                                                        domain_id, region)
+
+        CONF.set_override('caching', False, 'quota')
+        self.measure('get_domain_quota_by_services', 'uncached', get)
+        CONF.set_override('caching', True, 'quota')
+        for domain_id in self.domain_ids:
+            for region in self.regions:
+                get(domain_id, region)
+        self.measure('get_domain_quota_by_services', 'cached', get)
+
+        def set_one(domain_id, region):
+            resource_name = '%s.%s' % (self.random.choice(self.services),
+                                       self.random.choice(self.resources))
+            self.quota_api.set_domain_quota(
+                resource_name, self.random.randint(1, 1000), domain_id,
+                region, PARENT_DATA, CREATED_BY)
+
+        def set_per_resource(domain_id, region):
+            service = self.random.choice(self.services)
+            for resource_name, ceiling in self._ceilings([service]).items():
+                self.quota_api.set_domain_quota(resource_name, ceiling,
+                                                domain_id, region,
+                                                PARENT_DATA, CREATED_BY)
+
+        def set_bulk(domain_id, region):
+            service = self.random.choice(self.services)
+            self.quota_api.set_domain_quotas(self._ceilings([service]),
+                                             domain_id, region, PARENT_DATA,
+                                             CREATED_BY)
+
+        self.measure('set_domain_quota', 'single', set_one)
+        self.measure('set_domain_quota', 'per_resource', set_per_resource)
+        self.measure('set_domain_quotas', 'bulk', set_bulk)
+
+        deleted = {}
+
+        def delete(domain_id, region):
+            deleted[(domain_id, region)] = self.random.choice(self.services)
+            self.quota_api.delete_domain_quota(
+                [deleted[(domain_id, region)]], domain_id, region,
+                CREATED_BY)
+
+        def restore(domain_id, region):
+            service = deleted.pop((domain_id, region), None)
+            if service is not None:
+                self.quota_api.set_domain_quotas(
+                    self._ceilings([service]), domain_id, region,
+                    PARENT_DATA, CREATED_BY)
+
+        self.measure('delete_domain_quota', 'single', delete,
+                     prepare=restore)
+
+        return {'parameters': {'domains': len(self.domain_ids),
+                               'regions': len(self.regions),
+                               'services': len(self.services),
+                               'resources': len(self.resources),
+                               'iterations': self.iterations,
+                               'driver': CONF.quota.driver,
+                               'connection': CONF.sql.connection},
+                'results': self.results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument('--regions', type=int, default=2)
+    parser.add_argument('--services', type=int, default=3)
+    parser.add_argument('--resources', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--db-file',
+                        default=tests.tmpdir('quota_benchmark.db'))
+    parser.add_argument('--output', default=None,
+                        help='Path of the JSON results, stdout by default.')
+    args = parser.parse_args(argv)
+
+    benchmark = QuotaBenchmark(args.domains, args.regions, args.services,
+                               args.resources, args.iterations, args.db_file)
+    results = json.dumps(benchmark.run(), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        sys.stdout.write(results + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -17,12 +17,19 @@
 import copy
 import datetime
 import hashlib
+import json
+import os
+import StringIO
 import uuid
 
+from oslo.config import cfg
+
 from keystone.catalog import core
+from keystone.common import cms
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import timeutils
+from keystone.quota import core as quota_core
 from keystone import tests
 from keystone.tests import default_fixtures
 
@@ -2890,6 +2897,67 @@ class TokenTests(object):
         self.check_list_revoked_tokens([self.delete_token()
                                         for x in xrange(2)])
 
+    def test_list_revoked_tokens_since(self):
+        self.assertEqual(self.token_api.list_revoked_tokens_since(0), [])
+
+        token_ids = [self.delete_token() for x in xrange(2)]
+        revoked = self.token_api.list_revoked_tokens_since(0)
+        self.assertEqual([x['id'] for x in revoked], token_ids)
+        for x in revoked:
+            self.assertIn('expires', x)
+            self.assertIn('revoked_at', x)
+        self.assertTrue(revoked[0]['seq'] < revoked[1]['seq'])
+
+        self.assertEqual(
+            [x['id'] for x in
+             self.token_api.list_revoked_tokens_since(revoked[0]['seq'])],
+            token_ids[1:])
+        self.assertEqual(
+            self.token_api.list_revoked_tokens_since(revoked[1]['seq']), [])
+
+    def test_list_revoked_tokens_since_clock_behind(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        token_id = self.delete_token()
+        revoked = self.token_api.list_revoked_tokens_since(0)
+        marker = revoked[-1]['seq']
+
+        # revoked by a node whose clock is behind
+        timeutils.advance_time_seconds(-30)
+        late_token_id = self.delete_token()
+        timeutils.advance_time_seconds(30)
+        revoked = self.token_api.list_revoked_tokens_since(marker)
+        self.assertEqual([x['id'] for x in revoked], [late_token_id])
+        self.assertNotIn(token_id, [x['id'] for x in revoked])
+
+    def test_list_revoked_tokens_since_skips_expired(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        token_id = uuid.uuid4().hex
+        expires = timeutils.utcnow() + datetime.timedelta(minutes=1)
+        self.token_api.create_token(token_id, {'id': token_id, 'a': 'b',
+                                               'user': {'id': 'testuserid'},
+                                               'expires': expires})
+        self.token_api.delete_token(token_id)
+        timeutils.advance_time_seconds(120)
+        self.assertEqual(self.token_api.list_revoked_tokens_since(0), [])
+
+    def test_signed_revocations_since(self):
+        token_id = self.delete_token()
+        signed = self.token_api.get_signed_revocations_since(0)
+        data = json.loads(cms.cms_verify(signed, CONF.signing.certfile,
+                                         CONF.signing.ca_certs))
+        self.assertEqual([x['id'] for x in data['revoked']], [token_id])
+        self.assertEqual(data['next'], data['revoked'][0]['seq'])
+
+        # nothing revoked since the marker
+        marker = data['next']
+        signed = self.token_api.get_signed_revocations_since(marker)
+        data = json.loads(cms.cms_verify(signed, CONF.signing.certfile,
+                                         CONF.signing.ca_certs))
+        self.assertEqual(data['revoked'], [])
+        self.assertEqual(data['next'], marker)
+
     def test_flush_expired_token(self):
         token_id = uuid.uuid4().hex
         expire_time = timeutils.utcnow() - datetime.timedelta(minutes=1)
@@ -2951,6 +3019,122 @@ class TokenTests(object):
         self.assertIn(token_id, revoked_tokens)
         self.assertIn(token2_id, revoked_tokens)
 
+    def _count_signatures(self):
+        signatures = []
+        cms_sign_text = cms.cms_sign_text
+
+        def count_cms_sign_text(*args, **kwargs):
+            signatures.append(args[0])
+            return cms_sign_text(*args, **kwargs)
+
+        self.stubs.Set(cms, 'cms_sign_text', count_cms_sign_text)
+        return signatures
+
+    def _get_signed_revoked_ids(self):
+        signed = self.token_api.get_signed_revocation_list()
+        data = json.loads(cms.cms_verify(signed, CONF.signing.certfile,
+                                         CONF.signing.ca_certs))
+        return [x['id'] for x in data['revoked']]
+
+    def test_signed_revocation_list_cache(self):
+        signatures = self._count_signatures()
+        self.assertEqual(self._get_signed_revoked_ids(), [])
+        self.assertEqual(self._get_signed_revoked_ids(), [])
+        self.assertEqual(len(signatures), 1)
+
+        token_id = self.delete_token()
+        self.assertEqual(self._get_signed_revoked_ids(), [token_id])
+        self.assertEqual(self._get_signed_revoked_ids(), [token_id])
+        self.assertEqual(len(signatures), 2)
+
+    def test_signed_revocation_list_without_cache(self):
+        self.opt_in_group('token', caching=False)
+        signatures = self._count_signatures()
+        self.assertEqual(self._get_signed_revoked_ids(), [])
+        token_id = self.delete_token()
+        self.assertEqual(self._get_signed_revoked_ids(), [token_id])
+        self.assertEqual(len(signatures), 2)
+
+    def test_signed_revocation_list_sign_interval(self):
+        self.opt_in_group('token', revocation_sign_interval=3600)
+        signatures = self._count_signatures()
+        self.assertEqual(self._get_signed_revoked_ids(), [])
+        self.delete_token()
+        self.assertEqual(self._get_signed_revoked_ids(), [])
+        self.assertEqual(len(signatures), 1)
+
+    def _count_driver_gets(self):
+        gets = []
+        get_token = self.token_api.driver.get_token
+
+        def counting_get_token(token_id):
+            gets.append(token_id)
+            return get_token(token_id)
+
+        self.stubs.Set(self.token_api.driver, 'get_token', counting_get_token)
+        return gets
+
+    def test_get_token_404_cached(self):
+        gets = self._count_driver_gets()
+        token_id = uuid.uuid4().hex
+        for i in range(3):
+            self.assertRaises(exception.TokenNotFound,
+                              self.token_api.get_token, token_id)
+        self.assertEqual(len(gets), 1)
+
+        # creating the token makes it found at once
+        self.token_api.create_token(token_id, {'id': token_id,
+                                               'user': {'id': 'testuserid'}})
+        self.assertEqual(self.token_api.get_token(token_id)['id'], token_id)
+
+    def test_get_token_404_cache_expires(self):
+        gets = self._count_driver_gets()
+        token_id = uuid.uuid4().hex
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token, token_id)
+        timeutils.advance_time_seconds(CONF.token.negative_cache_time)
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token, token_id)
+        self.assertEqual(len(gets), 2)
+
+    def test_get_token_404_cache_disabled(self):
+        self.opt_in_group('token', negative_cache_time=0)
+        gets = self._count_driver_gets()
+        token_id = uuid.uuid4().hex
+        for i in range(2):
+            self.assertRaises(exception.TokenNotFound,
+                              self.token_api.get_token, token_id)
+        self.assertEqual(len(gets), 2)
+
+    def test_get_token_404_cache_size(self):
+        self.opt_in_group('token', negative_cache_size=2)
+        gets = self._count_driver_gets()
+        token_ids = [uuid.uuid4().hex for i in range(3)]
+        for token_id in token_ids + token_ids[1:]:
+            self.assertRaises(exception.TokenNotFound,
+                              self.token_api.get_token, token_id)
+        self.assertEqual(len(gets), 3)
+
+        # the oldest id was dropped
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token, token_ids[0])
+        self.assertEqual(len(gets), 4)
+
+    def test_expired_token_404_cached(self):
+        token_id = uuid.uuid4().hex
+        expire_time = timeutils.utcnow() - datetime.timedelta(minutes=1)
+        self.token_api.create_token(token_id, {'id': token_id,
+                                               'expires': expire_time,
+                                               'user': {'id': 'testuserid'}})
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token, token_id)
+        gets = self._count_driver_gets()
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.get_token, token_id)
+        self.assertEqual(len(gets), 0)
+
     def test_predictable_revoked_pki_token_id(self):
         token_id = self._create_token_id()
         token_id_hash = hashlib.md5(token_id).hexdigest()
@@ -3226,6 +3410,41 @@ class CatalogTests(object):
                           self.catalog_api.delete_endpoint,
                           endpoint['id'])
 
+    def test_catalog_version(self):
+        service = {
+            'id': uuid.uuid4().hex,
+            'type': uuid.uuid4().hex,
+            'name': uuid.uuid4().hex,
+        }
+        versions = [self.catalog_api.get_catalog_version()]
+        self.catalog_api.create_service(service['id'], service.copy())
+        versions.append(self.catalog_api.get_catalog_version())
+        service['name'] = uuid.uuid4().hex
+        self.catalog_api.update_service(service['id'], service.copy())
+        versions.append(self.catalog_api.get_catalog_version())
+
+        endpoint = {
+            'id': uuid.uuid4().hex,
+            'region': uuid.uuid4().hex,
+            'interface': uuid.uuid4().hex[:8],
+            'url': uuid.uuid4().hex,
+            'service_id': service['id'],
+        }
+        self.catalog_api.create_endpoint(endpoint['id'], endpoint.copy())
+        versions.append(self.catalog_api.get_catalog_version())
+        endpoint['url'] = uuid.uuid4().hex
+        self.catalog_api.update_endpoint(endpoint['id'], endpoint.copy())
+        versions.append(self.catalog_api.get_catalog_version())
+        self.catalog_api.delete_endpoint(endpoint['id'])
+        versions.append(self.catalog_api.get_catalog_version())
+        self.catalog_api.delete_service(service['id'])
+        versions.append(self.catalog_api.get_catalog_version())
+
+        self.assertEqual(len(versions), len(set(versions)))
+        # reads leave the version alone
+        self.catalog_api.list_services()
+        self.assertEqual(versions[-1], self.catalog_api.get_catalog_version())
+
     def test_get_service_404(self):
         self.assertRaises(exception.ServiceNotFound,
                           self.catalog_api.get_service,
@@ -3622,3 +3841,341 @@ class InheritanceTests(object):
         # project3 (since it has both a direct user role and an inherited role)
         user_projects = self.assignment_api.list_projects_for_user(user1['id'])
         self.assertEqual(len(user_projects), 5)
+
+
+class QuotaTests(object):
+    def _set_domain_quota(self, resource_name, ceiling, domain_id,
+                          region='RegionOne'):
+        self.quota_api.set_domain_quota(resource_name, ceiling, domain_id,
+                                        region, {'role': 'admin'},
+                                        {'user_id': 'foo', 'role': 'admin'})
+
+    def test_set_and_get_domain_quota(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('nova.cores', 54, domain_id)
+        self._set_domain_quota('cinder.volumes', 5, domain_id)
+        quotas = self.quota_api.get_domain_quota_by_services(
+            ['nova', 'cinder'], domain_id, 'RegionOne')
+        self.assertEqual({'nova': {'instances': 27, 'cores': 54},
+                          'cinder': {'volumes': 5}}, quotas)
+
+    def test_get_domain_quota_is_region_scoped(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('nova.instances', 14, domain_id,
+                               region='RegionTwo')
+        self.assertEqual({'nova': {'instances': 14}},
+                         self.quota_api.get_domain_quota_by_services(
+                             ['nova'], domain_id, 'RegionTwo'))
+        self.assertEqual({}, self.quota_api.get_domain_quota_by_services(
+            ['nova'], uuid.uuid4().hex, 'RegionOne'))
+
+    def test_update_domain_quota_wrong_parent(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self.assertRaises(exception.ForbiddenAction,
+                          self.quota_api.set_domain_quota,
+                          'nova.instances', 14, domain_id, 'RegionOne',
+                          {'role': uuid.uuid4().hex}, {'user_id': 'foo'})
+
+    def test_update_domain_quota(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('nova.instances', 14, domain_id)
+        quotas = self.quota_api.get_domain_quota_by_services(
+            ['nova'], domain_id, 'RegionOne')
+        self.assertEqual({'nova': {'instances': 14}}, quotas)
+
+    def test_delete_domain_quota(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('cinder.volumes', 5, domain_id)
+        self.quota_api.delete_domain_quota(['nova'], domain_id, 'RegionOne',
+                                           {'user_id': 'foo'})
+        quotas = self.quota_api.get_domain_quota_by_services(
+            ['nova', 'cinder'], domain_id, 'RegionOne')
+        self.assertEqual({'cinder': {'volumes': 5}}, quotas)
+
+    def test_domain_quota_version(self):
+        domain_id = uuid.uuid4().hex
+        versions = [self.quota_api.get_domain_quota_version(domain_id,
+                                                            'RegionOne')]
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        versions.append(self.quota_api.get_domain_quota_version(domain_id,
+                                                                'RegionOne'))
+        # the version is kept by the backend, not by the cache of the manager
+        self.quota_api.driver.set_domain_quota(
+            'nova.instances', 14, domain_id, 'RegionOne', {'role': 'admin'},
+            {'user_id': 'foo'})
+        versions.append(self.quota_api.get_domain_quota_version(domain_id,
+                                                                'RegionOne'))
+        self.quota_api.delete_domain_quota(['nova'], domain_id, 'RegionOne',
+                                           {'user_id': 'foo'})
+        versions.append(self.quota_api.get_domain_quota_version(domain_id,
+                                                                'RegionOne'))
+        self.assertEqual(len(versions), len(set(versions)))
+        self.assertEqual(versions[-1],
+                         self.quota_api.get_domain_quota_version(domain_id,
+                                                                 'RegionOne'))
+
+        # other domains and regions have their own versions
+        version = self.quota_api.get_domain_quota_version(domain_id, 'USA')
+        self._set_domain_quota('nova.instances', 27, uuid.uuid4().hex)
+        self.assertEqual(version,
+                         self.quota_api.get_domain_quota_version(domain_id,
+                                                                 'USA'))
+
+    def test_cache_layer_domain_quota(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('cinder.volumes', 5, domain_id)
+        quotas = self.quota_api.get_domain_quota_by_services(
+            ['nova', 'cinder'], domain_id, 'RegionOne')
+        # Update the ceilings, bypassing the quota api manager
+        self.quota_api.driver.set_domain_quota(
+            'nova.instances', 14, domain_id, 'RegionOne', {'role': 'admin'},
+            {'user_id': 'foo'})
+        self.quota_api.driver.set_domain_quota(
+            'cinder.volumes', 10, domain_id, 'RegionOne', {'role': 'admin'},
+            {'user_id': 'foo'})
+        # Verify the cached ceilings are still returned
+        self.assertEqual(quotas, self.quota_api.get_domain_quota_by_services(
+            ['nova', 'cinder'], domain_id, 'RegionOne'))
+        # Update nova through the manager, only nova should be invalidated
+        self._set_domain_quota('nova.cores', 54, domain_id)
+        self.assertEqual({'nova': {'instances': 14, 'cores': 54},
+                          'cinder': {'volumes': 5}},
+                         self.quota_api.get_domain_quota_by_services(
+                             ['nova', 'cinder'], domain_id, 'RegionOne'))
+        # Delete cinder through the manager, its cache entry is dropped
+        self.quota_api.delete_domain_quota(['cinder'], domain_id,
+                                           'RegionOne', {'user_id': 'foo'})
+        self.assertEqual({'nova': {'instances': 14, 'cores': 54}},
+                         self.quota_api.get_domain_quota_by_services(
+                             ['nova', 'cinder'], domain_id, 'RegionOne'))
+
+    def test_set_domain_quotas(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self.quota_api.set_domain_quotas(
+            {'nova.instances': 14, 'nova.cores': 54, 'cinder.volumes': 5},
+            domain_id, 'RegionOne', {'role': 'admin'}, {'user_id': 'foo'})
+        quotas = self.quota_api.get_domain_quota_by_services(
+            ['nova', 'cinder'], domain_id, 'RegionOne')
+        self.assertEqual({'nova': {'instances': 14, 'cores': 54},
+                          'cinder': {'volumes': 5}}, quotas)
+
+    def _reserve_domain_quota(self, deltas, domain_id, expire=None):
+        return self.quota_api.reserve_domain_quota(deltas, domain_id,
+                                                   'RegionOne', expire)
+
+    def test_reserve_domain_quota_up_to_ceiling(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 3, domain_id)
+        for i in range(3):
+            self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertRaises(exception.QuotaExceeded,
+                          self._reserve_domain_quota,
+                          {'nova.instances': 1}, domain_id)
+
+    def test_reserve_domain_quota_is_atomic(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 10, domain_id)
+        self._set_domain_quota('nova.cores', 2, domain_id)
+        self.assertRaises(exception.QuotaExceeded,
+                          self._reserve_domain_quota,
+                          {'nova.instances': 1, 'nova.cores': 4}, domain_id)
+        # nothing was taken from instances by the failed reservation
+        self._reserve_domain_quota({'nova.instances': 10}, domain_id)
+
+    def test_reserve_domain_quota_not_found(self):
+        self.assertRaises(exception.QuotaNotFound,
+                          self._reserve_domain_quota,
+                          {'nova.instances': 1}, uuid.uuid4().hex)
+
+    def test_reserve_domain_quota_unlimited(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.fixed_ips', -1, domain_id)
+        self._reserve_domain_quota({'nova.fixed_ips': 1000}, domain_id)
+
+    def test_rollback_domain_quota_reservation(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 1, domain_id)
+        reservation = self._reserve_domain_quota({'nova.instances': 1},
+                                                 domain_id)
+        self.quota_api.rollback_domain_quota_reservation(reservation['id'],
+                                                         domain_id)
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertRaises(exception.QuotaReservationNotFound,
+                          self.quota_api.rollback_domain_quota_reservation,
+                          reservation['id'], domain_id)
+
+    def test_commit_domain_quota_reservation(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 1, domain_id)
+        reservation = self._reserve_domain_quota({'nova.instances': 1},
+                                                 domain_id)
+        self.assertRaises(exception.QuotaReservationNotFound,
+                          self.quota_api.commit_domain_quota_reservation,
+                          reservation['id'], uuid.uuid4().hex)
+        self.quota_api.commit_domain_quota_reservation(reservation['id'],
+                                                       domain_id)
+        self.assertRaises(exception.QuotaExceeded,
+                          self._reserve_domain_quota,
+                          {'nova.instances': 1}, domain_id)
+        # a committed release frees the capacity again
+        reservation = self._reserve_domain_quota({'nova.instances': -1},
+                                                 domain_id)
+        self.quota_api.commit_domain_quota_reservation(reservation['id'],
+                                                       domain_id)
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+
+    def test_expired_domain_quota_reservation_is_reclaimed(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 1, domain_id)
+        reservation = self._reserve_domain_quota({'nova.instances': 1},
+                                                 domain_id, expire=-1)
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertRaises(exception.QuotaReservationNotFound,
+                          self.quota_api.commit_domain_quota_reservation,
+                          reservation['id'], domain_id)
+
+    def test_update_ceiling_keeps_reservations(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 2, domain_id)
+        self._reserve_domain_quota({'nova.instances': 2}, domain_id)
+        self._set_domain_quota('nova.instances', 3, domain_id)
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertRaises(exception.QuotaExceeded,
+                          self._reserve_domain_quota,
+                          {'nova.instances': 1}, domain_id)
+
+    def test_get_domain_quotas_with_defaults(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        self._set_domain_quota('nova.gpus', 2, domain_id)
+        quotas = self.quota_api.get_domain_quotas_with_defaults(
+            ['nova', 'cinder'], domain_id, 'RegionOne')
+        self.assertEqual(27, quotas['nova']['instances'])
+        self.assertEqual(2, quotas['nova']['gpus'])
+        self.assertEqual(CONF.nova.cores, quotas['nova']['cores'])
+        self.assertEqual(dict(CONF.cinder.iteritems()), quotas['cinder'])
+
+    def test_get_domain_quotas_with_registered_defaults(self):
+        domain_id = uuid.uuid4().hex
+        self.quota_api.defaults.register('swift', {'containers': 100,
+                                                   'objects': -1})
+        self._set_domain_quota('swift.containers', 10, domain_id)
+        self.assertEqual({'swift': {'containers': 10, 'objects': -1},
+                          'heat': {}},
+                         self.quota_api.get_domain_quotas_with_defaults(
+                             ['swift', 'heat'], domain_id, 'RegionOne'))
+
+    def test_defaults_of_configured_service(self):
+        config_file = tests.tmpdir('test_quota_defaults.conf')
+        with open(config_file, 'w') as f:
+            f.write('[quota]\n'
+                    'services = nova,swift\n'
+                    '[swift]\n'
+                    'defaults = containers:100,objects:-1,bytes:many\n')
+        self.addCleanup(os.remove, config_file)
+        conf = cfg.ConfigOpts()
+        conf.register_opt(cfg.ListOpt('services'), group='quota')
+        conf.register_opt(cfg.IntOpt('cores', default=20), group='nova')
+        conf(args=[], default_config_files=[config_file])
+
+        defaults = quota_core.DefaultQuotas(conf)
+        self.assertEqual({'nova': {'cores': 20},
+                          'swift': {'containers': 100, 'objects': -1}},
+                         defaults.merge({}, ['nova', 'swift']))
+
+        # built again on the same configuration, the group is registered
+        defaults = quota_core.DefaultQuotas(conf)
+        self.assertEqual({'nova': {'cores': 20},
+                          'swift': {'containers': 100, 'objects': -1}},
+                         defaults.merge({}, ['nova', 'swift']))
+
+    def test_list_region_quotas(self):
+        region = uuid.uuid4().hex
+        domain_ids = sorted(uuid.uuid4().hex for i in range(3))
+        for domain_id in domain_ids:
+            self._set_domain_quota('nova.instances', 27, domain_id, region)
+            self._set_domain_quota('cinder.volumes', 5, domain_id, region)
+        self._set_domain_quota('nova.instances', 14, domain_ids[0])
+        self.quota_api.delete_domain_quota(['cinder'], domain_ids[1], region,
+                                           {'user_id': 'foo'})
+
+        refs = self.quota_api.list_region_quotas(region)
+        self.assertEqual(domain_ids, [ref['domain_id'] for ref in refs])
+        self.assertEqual({'domain_id': domain_ids[0],
+                          'region': region,
+                          'quotas': {'nova': {'instances': 27},
+                                     'cinder': {'volumes': 5}}}, refs[0])
+        self.assertEqual({'nova': {'instances': 27}}, refs[1]['quotas'])
+
+        refs = self.quota_api.list_region_quotas(region, services=['cinder'])
+        self.assertEqual([domain_ids[0], domain_ids[2]],
+                         [ref['domain_id'] for ref in refs])
+
+    def test_list_region_quotas_paginated(self):
+        region = uuid.uuid4().hex
+        domain_ids = sorted(uuid.uuid4().hex for i in range(5))
+        for domain_id in domain_ids:
+            self._set_domain_quota('nova.instances', 27, domain_id, region)
+            self._set_domain_quota('nova.cores', 54, domain_id, region)
+
+        listed = []
+        marker = None
+        while True:
+            refs = self.quota_api.list_region_quotas(region, limit=2,
+                                                     marker=marker)
+            if not refs:
+                break
+            self.assertTrue(len(refs) <= 2)
+            listed.extend(ref['domain_id'] for ref in refs)
+            marker = refs[-1]['domain_id']
+        self.assertEqual(domain_ids, listed)
+
+    def test_list_domain_quota_history(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        for ceiling in [14, 7, 3]:
+            self._set_domain_quota('nova.instances', ceiling, domain_id)
+        self._set_domain_quota('nova.instances', 1, domain_id,
+                               region='RegionTwo')
+        self._set_domain_quota('nova.instances', 2, domain_id,
+                               region='RegionTwo')
+
+        history = self.quota_api.list_domain_quota_history(domain_id,
+                                                           'RegionOne')
+        self.assertEqual(['ceiling: 7 -> 3.', 'ceiling: 14 -> 7.',
+                          'ceiling: 27 -> 14.'],
+                         [change['remark'] for change in history])
+        self.assertEqual('nova.instances', history[0]['resource'])
+
+        page = self.quota_api.list_domain_quota_history(domain_id,
+                                                        'RegionOne', limit=2)
+        self.assertEqual(history[:2], page)
+        page = self.quota_api.list_domain_quota_history(
+            domain_id, 'RegionOne', limit=2, marker=page[-1]['id'])
+        self.assertEqual(history[2:], page)
+
+    def test_archive_quota_history(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        for ceiling in [14, 7, 3]:
+            self._set_domain_quota('nova.instances', ceiling, domain_id)
+
+        stream = StringIO.StringIO()
+        archived = self.quota_api.archive_quota_history(
+            stream, datetime.datetime.now() + datetime.timedelta(seconds=1),
+            batch_size=2)
+        self.assertEqual(3, archived)
+        changes = [json.loads(line) for line in
+                   stream.getvalue().splitlines()]
+        self.assertEqual(['ceiling: 27 -> 14.', 'ceiling: 14 -> 7.',
+                          'ceiling: 7 -> 3.'],
+                         [change['remark'] for change in changes])
+        self.assertEqual([], self.quota_api.list_domain_quota_history(
+            domain_id, 'RegionOne'))
@@ -13,11 +13,13 @@
 # WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
 # License for the specific language governing permissions and limitations
 # under the License.
+import datetime
 import uuid
 
 from keystone import config
 from keystone import exception
 from keystone import identity
+from keystone.openstack.common import timeutils
 from keystone import tests
 from keystone.tests import default_fixtures
 from keystone.tests import test_backend
@@ -71,6 +73,110 @@ class KvsToken(tests.TestCase, test_backend.TokenTests):
             'keystone.identity.backends.kvs.Identity')
         self.load_backends()
 
+    def _create_token(self, user_id, expires, **kwargs):
+        token_id = uuid.uuid4().hex
+        data = {'id': token_id, 'a': 'b', 'user': {'id': user_id},
+                'expires': expires}
+        data.update(kwargs)
+        self.token_api.create_token(token_id, data)
+        return token_id
+
+    def test_list_tokens_without_scan(self):
+        user_id = uuid.uuid4().hex
+        now = timeutils.utcnow()
+        token_id = self._create_token(
+            user_id, now + datetime.timedelta(minutes=1),
+            trust_id='trust', tenant={'id': 'tenant'},
+            token_data={'token': {'OS-OAUTH1': {'consumer_id': 'consumer'}}})
+        self._create_token(user_id, now - datetime.timedelta(minutes=1))
+        self._create_token(uuid.uuid4().hex,
+                           now + datetime.timedelta(minutes=1))
+
+        # the tokens are found through the indexes
+        db = self.token_api.driver.db
+        self.stubs.Set(db, 'items', None)
+        self.assertEqual(self.token_api.list_tokens(user_id), [token_id])
+        self.assertEqual(self.token_api.list_tokens(user_id,
+                                                    tenant_id='tenant'),
+                         [token_id])
+        self.assertEqual(self.token_api.list_tokens(user_id,
+                                                    tenant_id='other'),
+                         [])
+        self.assertEqual(self.token_api.list_tokens(user_id,
+                                                    trust_id='trust'),
+                         [token_id])
+        self.assertEqual(self.token_api.list_tokens(user_id,
+                                                    consumer_id='consumer'),
+                         [token_id])
+
+        self.token_api.delete_tokens(user_id)
+        self.assertEqual(self.token_api.list_tokens(user_id), [])
+        self.assertEqual(self.token_api.list_tokens(user_id,
+                                                    trust_id='trust'),
+                         [])
+        self.assertEqual([x['id'] for x in
+                          self.token_api.driver.list_revoked_tokens()],
+                         [token_id])
+
+    def test_flush_expired_tokens_by_expiry(self):
+        user_id = uuid.uuid4().hex
+        now = timeutils.utcnow()
+        expired_id = self._create_token(user_id,
+                                        now - datetime.timedelta(minutes=1))
+        revoked_id = self._create_token(user_id,
+                                        now - datetime.timedelta(minutes=2))
+        self.token_api.driver.delete_token(revoked_id)
+        token_id = self._create_token(user_id,
+                                      now + datetime.timedelta(minutes=1))
+        # a token created again with a later expiry is kept
+        recreated_id = self._create_token(user_id,
+                                          now - datetime.timedelta(minutes=3))
+        self.token_api.create_token(recreated_id, {
+            'id': recreated_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=2)})
+
+        db = self.token_api.driver.db
+        self.stubs.Set(db, 'items', None)
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(), 2)
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.driver.get_token, expired_id)
+        self.assertEqual(self.token_api.driver.list_revoked_tokens(), [])
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted([token_id, recreated_id]))
+        self.assertEqual(len(db['token_expiry']), 2)
+        self.assertEqual(sorted(db['token_user-%s' % user_id]),
+                         sorted([token_id, recreated_id]))
+
+    def test_flush_keeps_unexpired_revoked_token(self):
+        user_id = uuid.uuid4().hex
+        now = timeutils.utcnow()
+        # revoked once created again with a later expiry
+        token_id = self._create_token(user_id,
+                                      now - datetime.timedelta(minutes=1))
+        self.token_api.create_token(token_id, {
+            'id': token_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=1)})
+        self.token_api.driver.delete_token(token_id)
+
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(), 0)
+        self.assertEqual([x['id'] for x in
+                          self.token_api.driver.list_revoked_tokens()],
+                         [token_id])
+
+    def test_indexes_are_updated_in_place(self):
+        user_id = uuid.uuid4().hex
+        expires = timeutils.utcnow() + datetime.timedelta(minutes=1)
+        token_id = self._create_token(user_id, expires)
+        db = self.token_api.driver.db
+        index = db['token_user-%s' % user_id]
+        second_token_id = self._create_token(user_id, expires)
+        self.assertIs(db['token_user-%s' % user_id], index)
+        self.assertEqual(sorted(index), sorted([token_id, second_token_id]))
+
+        self.token_api.driver.delete_token(token_id)
+        self.assertIs(db['token_user-%s' % user_id], index)
+        self.assertEqual(list(index), [second_token_id])
+
 
 class KvsTrust(tests.TestCase, test_backend.TrustTests):
     def setUp(self):
@@ -120,6 +226,16 @@ class KvsCatalog(tests.TestCase, test_backend.CatalogTests):
         self.assertDictEqual(catalog_ref, self.catalog_foobar)
 
 
+class KvsQuota(tests.TestCase, test_backend.QuotaTests):
+    def setUp(self):
+        super(KvsQuota, self).setUp()
+        identity.CONF.identity.driver = (
+            'keystone.identity.backends.kvs.Identity')
+        identity.CONF.quota.driver = (
+            'keystone.quota.backends.kvs.Quotas')
+        self.load_backends()
+
+
 class KvsTokenCacheInvalidation(tests.TestCase,
                                 test_backend.TokenCacheInvalidation):
     def setUp(self):
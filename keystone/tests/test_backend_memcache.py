@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import contextlib
 import copy
 import datetime
 import uuid
@@ -24,6 +25,7 @@ from keystone.common import utils
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import jsonutils
+from keystone.openstack.common import loopingcall
 from keystone.openstack.common import timeutils
 from keystone import tests
 from keystone.tests import test_backend
@@ -42,18 +44,31 @@ class MemcacheClient(object):
         self.cache = {}
         self.reject_cas = False
 
-    def add(self, key, value):
+    def add(self, key, value, time=0):
         if self.get(key):
             return False
-        return self.set(key, value)
+        return self.set(key, value, time=time)
+
+    def incr(self, key, delta=1):
+        value = self.get(key)
+        if value is None:
+            return None
+        value = int(value) + delta
+        self.set(key, value, time=self.cache[key][1])
+        return value
 
     def append(self, key, value):
         existing_value = self.get(key)
         if existing_value:
-            self.set(key, existing_value + value)
+            # like memcache, appending keeps the expiration time of the key
+            self.set(key, existing_value + value, time=self.cache[key][1])
             return True
         return False
 
+    @contextlib.contextmanager
+    def acquire(self):
+        yield self
+
     def check_key(self, key):
         if not isinstance(key, str):
             raise memcache.Client.MemcachedStringEncodingError()
@@ -64,6 +79,9 @@ class MemcacheClient(object):
 
     def get(self, key):
         """Retrieves the value for a key or None."""
+        return self._get(key)
+
+    def _get(self, key):
         self.check_key(key)
         obj = self.cache.get(key)
         now = utils.unixtime(timeutils.utcnow())
@@ -78,6 +96,15 @@ class MemcacheClient(object):
             data_copy = copy.deepcopy(obj[0])
             return data_copy
 
+    def get_multi(self, keys):
+        """Retrieves the values of the keys found, keyed by key."""
+        values = {}
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
     def set(self, key, value, time=0):
         """Sets the value for a key."""
         self.check_key(key)
@@ -142,6 +169,9 @@ class MemcacheToken(tests.TestCase, test_backend.TokenTests):
     def test_flush_expired_token(self):
         self.assertRaises(exception.NotImplemented,
                           self.token_api.flush_expired_tokens)
+        # the periodic flush stops
+        self.assertRaises(loopingcall.LoopingCallDone,
+                          self.token_api._flush_on_interval)
 
     def test_cleanup_user_index_on_create(self):
         valid_token_id = uuid.uuid4().hex
@@ -149,13 +179,21 @@ class MemcacheToken(tests.TestCase, test_backend.TokenTests):
         expired_token_id = uuid.uuid4().hex
         user_id = unicode(uuid.uuid4().hex)
 
-        expire_delta = datetime.timedelta(seconds=86400)
+        # tokens outliving the configured lifetime are indexed in the
+        # token-index-list of the user
+        self.opt_in_group('token', expiration=300)
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
 
         valid_data = {'id': valid_token_id, 'a': 'b',
+                      'expires': now + datetime.timedelta(days=1),
                       'user': {'id': user_id}}
         second_valid_data = {'id': second_valid_token_id, 'a': 'b',
+                             'expires': now + datetime.timedelta(days=1),
                              'user': {'id': user_id}}
         expired_data = {'id': expired_token_id, 'a': 'b',
+                        'expires': now + datetime.timedelta(hours=2),
                         'user': {'id': user_id}}
         self.token_api.create_token(valid_token_id, valid_data)
         self.token_api.create_token(expired_token_id, expired_data)
@@ -166,16 +204,199 @@ class MemcacheToken(tests.TestCase, test_backend.TokenTests):
         user_record = self.token_api.driver.client.get(user_key)
         user_token_list = jsonutils.loads('[%s]' % user_record)
         self.assertEqual(len(user_token_list), 2)
-        expired_token_ptk = self.token_api.driver._prefix_token_id(
-            expired_token_id)
-        expired_token = self.token_api.driver.client.get(expired_token_ptk)
-        expired_token['expires'] = (timeutils.utcnow() - expire_delta)
-        self.token_api.driver.client.set(expired_token_ptk, expired_token)
+        timeutils.advance_time_seconds(3 * 3600)
 
         self.token_api.create_token(second_valid_token_id, second_valid_data)
         user_record = self.token_api.driver.client.get(user_key)
         user_token_list = jsonutils.loads('[%s]' % user_record)
-        self.assertEqual(len(user_token_list), 2)
+        # in the format of earlier releases, which read the same key
+        self.assertEqual(sorted(user_token_list),
+                         sorted([valid_token_id, second_valid_token_id]))
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted([valid_token_id, second_valid_token_id]))
+
+    def test_user_index_buckets(self):
+        self.opt_in_group('memcache', user_index_interval=3600)
+        now = datetime.datetime(2013, 10, 18, 12, 0, 0)
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        user_id = unicode(uuid.uuid4().hex)
+        token_id = uuid.uuid4().hex
+        second_token_id = uuid.uuid4().hex
+        self.token_api.create_token(token_id, {
+            'id': token_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=30)})
+        self.token_api.create_token(second_token_id, {
+            'id': second_token_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=90)})
+
+        # the tokens are appended to the bucket of their expiry, which is
+        # evicted once its interval has passed
+        client = self.token_api.driver.client
+        user_key = self.token_api.driver._prefix_user_id(user_id)
+        bucket_key = '%s-%d' % (user_key, utils.unixtime(now))
+        self.assertIsNone(client.get(user_key))
+        self.assertEqual(jsonutils.loads('[%s]' % client.get(bucket_key)),
+                         [[token_id, utils.unixtime(
+                             now + datetime.timedelta(minutes=30))]])
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted([token_id, second_token_id]))
+
+        timeutils.advance_time_seconds(3600)
+        self.assertIsNone(client.get(bucket_key))
+        self.assertEqual(self.token_api.list_tokens(user_id),
+                         [second_token_id])
+
+    def test_user_index_without_cas(self):
+        # concurrent logins of a user append to the buckets, compare-and-set
+        # failures do not fail them
+        self.token_api.driver.client.reject_cas = True
+        user_id = unicode(uuid.uuid4().hex)
+        token_ids = [uuid.uuid4().hex for i in range(3)]
+        for token_id in token_ids:
+            self.token_api.create_token(token_id, {'id': token_id, 'a': 'b',
+                                                   'user': {'id': user_id}})
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted(token_ids))
+
+    def test_revocation_list_buckets(self):
+        self.opt_in_group('memcache', revocation_list_interval=3600)
+        now = datetime.datetime(2013, 10, 18, 12, 0, 0)
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        user_id = unicode(uuid.uuid4().hex)
+        token_id = uuid.uuid4().hex
+        second_token_id = uuid.uuid4().hex
+        self.token_api.create_token(second_token_id, {
+            'id': second_token_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=90)})
+        self.token_api.create_token(token_id, {
+            'id': token_id, 'a': 'b', 'user': {'id': user_id},
+            'expires': now + datetime.timedelta(minutes=30)})
+        self.token_api.delete_token(second_token_id)
+        timeutils.advance_time_seconds(1)
+        self.token_api.delete_token(token_id)
+
+        # the revoked tokens are appended to the bucket of their expiry,
+        # without the token data
+        client = self.token_api.driver.client
+        revocation_key = self.token_api.driver.revocation_key
+        self.assertIsNone(client.get(revocation_key))
+        record = client.get('%s-%d' % (revocation_key, utils.unixtime(now)))
+        token_refs = jsonutils.loads('[%s]' % record)
+        self.assertEqual([token_ref['id'] for token_ref in token_refs],
+                         [token_id])
+        self.assertEqual(sorted(token_refs[0]),
+                         ['expires', 'id', 'revoked_at', 'seq'])
+
+        self.assertEqual(
+            [token_ref['id'] for token_ref in
+             self.token_api.list_revoked_tokens_since(0)],
+            [second_token_id, token_id])
+
+        # the expired revocations are not listed anymore
+        timeutils.advance_time_seconds(1800)
+        self.assertEqual(
+            [token_ref['id'] for token_ref in
+             self.token_api.driver.list_revoked_tokens()],
+            [second_token_id])
+        timeutils.advance_time_seconds(1800)
+        self.assertIsNone(client.get('%s-%d' % (revocation_key,
+                                                utils.unixtime(now))))
+
+    def test_legacy_revocation_list(self):
+        now = timeutils.utcnow()
+        expired_token_id = uuid.uuid4().hex
+        token_id = uuid.uuid4().hex
+        # entries appended to the revocation list itself by earlier releases
+        # are listed until they expire
+        entries = [
+            {'id': expired_token_id, 'a': 'b',
+             'expires': now - datetime.timedelta(minutes=1)},
+            {'id': token_id, 'a': 'b',
+             'expires': now + datetime.timedelta(minutes=1)}]
+        self.token_api.driver.client.set(
+            self.token_api.driver.revocation_key,
+            ','.join(jsonutils.dumps(entry) for entry in entries))
+        self.assertEqual(
+            [token_ref['id'] for token_ref in
+             self.token_api.driver.list_revoked_tokens()],
+            [token_id])
+
+    def test_revocations_since_stop_at_missing_seq(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        driver = self.token_api.driver
+        token_ids = [self.delete_token() for i in range(2)]
+        marker = self.token_api.list_revoked_tokens_since(0)[-1]['seq']
+
+        # a revocation incremented the counter but is not appended yet
+        driver._next_revocation_seq()
+        token_id = self.delete_token()
+        self.assertEqual(self.token_api.list_revoked_tokens_since(marker),
+                         [])
+
+        # the number went missing for longer than a revocation takes
+        timeutils.advance_time_seconds(
+            token_memcache.REVOCATION_SEQ_GRACE + 1)
+        self.assertEqual(
+            [token_ref['id'] for token_ref in
+             self.token_api.list_revoked_tokens_since(marker)],
+            [token_id])
+        self.assertNotIn(token_id, token_ids)
+
+    def test_revocation_seq_restarts_above_evicted(self):
+        driver = self.token_api.driver
+        self.delete_token()
+        seq = self.token_api.list_revoked_tokens_since(0)[-1]['seq']
+        driver.client.delete(driver.revocation_seq_key)
+        self.assertTrue(driver._next_revocation_seq() > seq)
+
+    def test_user_index_in_one_round_trip(self):
+        user_id = unicode(uuid.uuid4().hex)
+        token_ids = [uuid.uuid4().hex for i in range(3)]
+        for token_id in token_ids:
+            self.token_api.create_token(token_id, {'id': token_id, 'a': 'b',
+                                                   'user': {'id': user_id}})
+
+        # the index is pruned and the tokens are listed without fetching
+        # them one by one
+        token_gets = []
+        client = self.token_api.driver.client
+        real_get = client.get
+
+        def get(key):
+            if key.startswith('token-'):
+                token_gets.append(key)
+            return real_get(key)
+
+        self.stubs.Set(client, 'get', get)
+        token_id = uuid.uuid4().hex
+        self.token_api.create_token(token_id, {'id': token_id, 'a': 'b',
+                                               'user': {'id': user_id}})
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted(token_ids + [token_id]))
+        self.assertEqual(token_gets, [])
+
+    def test_legacy_user_index(self):
+        user_id = unicode(uuid.uuid4().hex)
+        token_id = uuid.uuid4().hex
+        # entries indexed without their expiry in the token-index-list of the
+        # user by earlier releases are still honoured
+        client = self.token_api.driver.client
+        client.set(self.token_api.driver._prefix_token_id(token_id),
+                   {'id': token_id, 'a': 'b', 'user': {'id': user_id},
+                    'expires': token.default_expire_time()})
+        client.set(self.token_api.driver._prefix_user_id(user_id),
+                   jsonutils.dumps(token_id))
+        self.assertEqual(self.token_api.list_tokens(user_id), [token_id])
+
+        second_token_id = uuid.uuid4().hex
+        self.token_api.create_token(second_token_id,
+                                    {'id': second_token_id, 'a': 'b',
+                                     'user': {'id': user_id}})
+        self.assertEqual(sorted(self.token_api.list_tokens(user_id)),
+                         sorted([token_id, second_token_id]))
 
     def test_cas_failure(self):
         self.token_api.driver.client.reject_cas = True
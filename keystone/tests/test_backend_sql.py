@@ -14,6 +14,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import datetime
 import uuid
 
 import sqlalchemy
@@ -22,9 +23,14 @@ from keystone.common import sql
 from keystone import config
 from keystone import exception
 from keystone.identity.backends import sql as identity_sql
+from keystone.openstack.common import timeutils
+from keystone.quota.backends import sql as quota_sql
+from keystone.quota.backends import sql_counters as quota_sql_counters
 from keystone import tests
 from keystone.tests import default_fixtures
 from keystone.tests import test_backend
+from keystone.token.backends import sql as token_sql
+from keystone.token.backends import sql_partitioned as token_sql_partitioned
 
 
 CONF = config.CONF
@@ -352,7 +358,221 @@ class SqlTrust(SqlTests, test_backend.TrustTests):
 
 
 class SqlToken(SqlTests, test_backend.TokenTests):
-    pass
+    def _create_tokens(self, count, expires):
+        for i in range(count):
+            token_id = uuid.uuid4().hex
+            self.token_api.create_token(token_id, {
+                'id': token_id,
+                'expires': timeutils.utcnow() + expires,
+                'user': {'id': 'testuserid'}})
+
+    def test_flush_expired_tokens_in_batches(self):
+        self._create_tokens(5, -datetime.timedelta(minutes=1))
+        self._create_tokens(1, datetime.timedelta(minutes=1))
+        sleeps = []
+        self.stubs.Set(token_sql.time, 'sleep', sleeps.append)
+        progress = []
+
+        flushed = self.token_api.driver.flush_expired_tokens(
+            batch_size=2, progress=progress.append)
+        self.assertEqual(flushed, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertEqual(sleeps, [CONF.token.flush_batch_interval] * 2)
+        self.assertEqual(len(self.token_api.list_tokens('testuserid')), 1)
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(), 0)
+
+    def test_flush_expired_tokens_at_once(self):
+        self._create_tokens(3, -datetime.timedelta(minutes=1))
+        self.opt_in_group('token', flush_batch_size=0)
+        progress = []
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(
+            progress=progress.append), 3)
+        self.assertEqual(progress, [3])
+
+    def test_flush_on_interval(self):
+        self._create_tokens(2, -datetime.timedelta(minutes=1))
+        self.token_api._flush_on_interval()
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(), 0)
+
+        # failures are logged, the flush goes on at the next interval
+        def failing_flush():
+            raise sqlalchemy.exc.OperationalError(None, None, None)
+        self.stubs.Set(self.token_api.driver, 'flush_expired_tokens',
+                       failing_flush)
+        self.token_api._flush_on_interval()
+
+
+class SqlPartitionedToken(SqlTests, test_backend.TokenTests):
+    def config(self, config_files):
+        super(SqlPartitionedToken, self).config(config_files)
+        self.opt_in_group(
+            'token', driver='keystone.token.backends.sql_partitioned.Token')
+
+    def _create_token(self, expires):
+        token_id = uuid.uuid4().hex
+        self.token_api.create_token(token_id, {
+            'id': token_id,
+            'expires': expires,
+            'user': {'id': 'testuserid'}})
+        return token_id
+
+    def test_invalid_partition_interval(self):
+        for interval in [0, 30, 90]:
+            self.opt_in_group('token', partition_interval=interval)
+            self.assertRaises(ValueError, token_sql_partitioned.Token)
+        self.opt_in_group('token', partition_interval=120)
+        token_sql_partitioned.Token()
+
+    def test_tokens_written_to_expiry_partition(self):
+        driver = self.token_api.driver
+        for delta in [datetime.timedelta(minutes=1),
+                      datetime.timedelta(hours=5)]:
+            expires = timeutils.utcnow() + delta
+            token_id = self._create_token(expires)
+            table = driver._get_table(driver._partition_name(expires))
+            session = driver.get_session()
+            rows = session.execute(table.select()).fetchall()
+            self.assertIn(token_id, [row['id'] for row in rows])
+            self.assertEqual(self.token_api.get_token(token_id)['id'],
+                             token_id)
+
+    def test_create_partitions(self):
+        driver = self.token_api.driver
+        created = driver.create_partitions()
+        self.assertEqual(created, driver._lifetime_partitions())
+        self.assertEqual(driver.create_partitions(), [])
+        self.assertEqual(driver._list_partitions(refresh=True), created)
+
+    def test_flush_drops_passed_partitions(self):
+        # at the start of a partition interval
+        timeutils.set_time_override(datetime.datetime(2013, 10, 18, 12, 0))
+        self.addCleanup(timeutils.clear_time_override)
+        expired = self._create_token(timeutils.utcnow() +
+                                     datetime.timedelta(minutes=1))
+        self._create_token(timeutils.utcnow() +
+                           datetime.timedelta(minutes=2))
+        valid = self._create_token(timeutils.utcnow() +
+                                   datetime.timedelta(hours=3))
+        passed = self.token_api.driver._partition_name(timeutils.utcnow())
+
+        # the passed partition is kept for one more interval
+        timeutils.advance_time_seconds(CONF.token.partition_interval)
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(), 0)
+        self.assertIn(passed,
+                      self.token_api.driver._list_partitions(refresh=True))
+
+        timeutils.advance_time_seconds(CONF.token.partition_interval)
+        progress = []
+        self.assertEqual(self.token_api.driver.flush_expired_tokens(
+            progress=progress.append), 2)
+        self.assertEqual(progress, [2])
+        self.assertNotIn(passed,
+                         self.token_api.driver._list_partitions(refresh=True))
+        self.assertEqual(self.token_api.list_tokens('testuserid'), [valid])
+        self.assertRaises(exception.TokenNotFound,
+                          self.token_api.driver.get_token, expired)
+
+    def test_read_retried_after_partition_dropped(self):
+        token_id = self._create_token(timeutils.utcnow() +
+                                      datetime.timedelta(hours=1))
+        # another process dropped a partition this one still lists
+        driver = self.token_api.driver
+        dropped = driver._partition_name(timeutils.utcnow() +
+                                         datetime.timedelta(days=30))
+        driver._partitions.add(dropped)
+        self.assertEqual(driver.list_tokens('testuserid'), [token_id])
+        self.assertNotIn(dropped, driver._list_partitions())
+
+        driver._partitions.add(dropped)
+        self.assertEqual(driver.get_token(token_id)['id'], token_id)
+        driver._partitions.add(dropped)
+        driver.delete_token(token_id)
+        self.assertEqual(driver.list_revoked_tokens()[0]['id'], token_id)
+
+
+class SqlQuota(SqlTests, test_backend.QuotaTests):
+    def test_quota_history_order_within_a_second(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 27, domain_id)
+        for ceiling in [14, 7, 3]:
+            self._set_domain_quota('nova.instances', ceiling, domain_id)
+        # as stored by a DATETIME column without fractional seconds
+        session = self.quota_api.driver.get_session()
+        with session.begin():
+            session.query(quota_sql.HistoryQuotasModel).update(
+                {'updated_at': datetime.datetime(2013, 10, 1)})
+
+        history = self.quota_api.list_domain_quota_history(domain_id,
+                                                           'RegionOne')
+        self.assertEqual(['ceiling: 7 -> 3.', 'ceiling: 14 -> 7.',
+                          'ceiling: 27 -> 14.'],
+                         [change['remark'] for change in history])
+        changes = self.quota_api.driver.list_quota_history_before(
+            datetime.datetime(2013, 10, 2), 2)
+        self.assertEqual(['ceiling: 27 -> 14.', 'ceiling: 14 -> 7.'],
+                         [change['remark'] for change in changes])
+
+
+class SqlCountersQuota(SqlQuota):
+    def config(self, config_files):
+        super(SqlCountersQuota, self).config(config_files)
+        self.opt_in_group(
+            'quota', driver='keystone.quota.backends.sql_counters.Quotas',
+            usage_flush_interval=0, usage_flush_threshold=0)
+
+    def _get_available(self, domain_id, resource_name):
+        session = self.quota_api.driver.get_session()
+        return (session.query(quota_sql.QuotasModel.available)
+                .filter_by(domain_id=domain_id, resource=resource_name)
+                .filter_by(closed_at=None)
+                .scalar())
+
+    def test_reservations_are_written_on_flush(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 10, domain_id)
+        reservation = self._reserve_domain_quota({'nova.instances': 3},
+                                                 domain_id)
+        self._reserve_domain_quota({'nova.instances': 2}, domain_id)
+        self.assertEqual(10, self._get_available(domain_id,
+                                                 'nova.instances'))
+        self.quota_api.driver.flush_usage()
+        self.assertEqual(5, self._get_available(domain_id, 'nova.instances'))
+        self.quota_api.rollback_domain_quota_reservation(reservation['id'],
+                                                         domain_id)
+        self.quota_api.driver.flush_usage()
+        self.assertEqual(8, self._get_available(domain_id, 'nova.instances'))
+
+    def test_flush_on_threshold(self):
+        self.opt_in_group('quota', usage_flush_threshold=2)
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 10, domain_id)
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertEqual(10, self._get_available(domain_id,
+                                                 'nova.instances'))
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+        self.assertEqual(8, self._get_available(domain_id, 'nova.instances'))
+
+    def test_reconcile_flushed_reservations(self):
+        domain_id = uuid.uuid4().hex
+        self._set_domain_quota('nova.instances', 3, domain_id)
+        reservation = self._reserve_domain_quota({'nova.instances': 1},
+                                                 domain_id)
+        expired = self._reserve_domain_quota({'nova.instances': 1},
+                                             domain_id, expire=-1)
+        self.quota_api.driver.flush_usage()
+        # not flushed, lost by the restart below
+        self._reserve_domain_quota({'nova.instances': 1}, domain_id)
+
+        driver = quota_sql_counters.Quotas()
+        self.assertRaises(exception.QuotaReservationNotFound,
+                          driver.commit_domain_quota_reservation,
+                          expired['id'], domain_id)
+        driver.commit_domain_quota_reservation(reservation['id'], domain_id)
+        driver.flush_usage()
+        self.assertEqual(2, self._get_available(domain_id, 'nova.instances'))
+        # the capacity of the expired and lost reservations is available
+        driver.reserve_domain_quota({'nova.instances': 2}, domain_id,
+                                    'RegionOne', expired['expires_at'])
 
 
 class SqlCatalog(SqlTests, test_backend.CatalogTests):
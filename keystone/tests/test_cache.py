@@ -54,6 +54,9 @@ class CacheIsolatingProxy(proxy.ProxyBackend):
     def get(self, key):
         return _copy_value(self.proxied.get(key))
 
+    def get_multi(self, keys):
+        return [_copy_value(value) for value in self.proxied.get_multi(keys)]
+
     def set(self, key, value):
         self.proxied.set(key, _copy_value(value))
 
@@ -136,6 +139,25 @@ class CacheRegionTest(tests.TestCase):
         cached_value = cacheable_function(test_value)
         self.assertTrue(cached_value.cached)
 
+    def test_get_multi_on_arguments(self):
+        # Verify the cached results of a decorated function are fetched
+        # together, and the results which are not cached are missing.
+        calls = []
+
+        @cache.cache_on_arguments(self.region)
+        def cacheable_function(value):
+            calls.append(value)
+            return TestProxyValue(value)
+
+        cacheable_function('a')
+        cacheable_function('c')
+        values = cacheable_function.get_multi([('a',), ('b',), ('c',)])
+        self.assertEqual(values[0].value, 'a')
+        self.assertIs(values[1], NO_VALUE)
+        self.assertEqual(values[2].value, 'c')
+        self.assertEqual(calls, ['a', 'c'])
+        self.assertEqual(cacheable_function.get_multi([]), [])
+
     def test_cache_dictionary_config_builder(self):
         """Validate we build a sane dogpile.cache dictionary config."""
         CONF.cache.config_prefix = 'test_prefix'
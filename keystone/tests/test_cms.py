@@ -0,0 +1,196 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import os
+import shutil
+
+from keystone.common import cms
+from keystone.common import environment
+from keystone import config
+from keystone import tests
+
+
+CONF = config.CONF
+
+
+class CmsTestCase(tests.TestCase):
+    def setUp(self):
+        super(CmsTestCase, self).setUp()
+        self.opt_in_group('signing',
+                          certfile=tests.rootdir(
+                              'examples/pki/certs/signing_cert.pem'),
+                          keyfile=tests.rootdir(
+                              'examples/pki/private/signing_key.pem'),
+                          ca_certs=tests.rootdir(
+                              'examples/pki/certs/cacert.pem'))
+        self.text = json.dumps({'access': {'token': {'id': 'x' * 100}}})
+
+    def _openssl_sign(self, text):
+        return cms._openssl_sign_text(text, CONF.signing.certfile,
+                                      CONF.signing.keyfile)
+
+
+class CmsSigningTest(CmsTestCase):
+    def test_engine_matches_openssl(self):
+        if cms.x509 is None:
+            self.skipTest('No crypto binding available')
+
+        engine = cms.SigningEngine(CONF.signing.certfile,
+                                   CONF.signing.keyfile)
+        for text in [self.text, 'x', 'x' * 100000]:
+            self.assertEqual(engine.sign(text), self._openssl_sign(text))
+
+    def test_sign_token_verifies(self):
+        token = cms.cms_sign_token(self.text, CONF.signing.certfile,
+                                   CONF.signing.keyfile)
+        self.assertTrue(cms.is_ans1_token(token))
+        self.assertEqual(cms.verify_token(token, CONF.signing.certfile,
+                                          CONF.signing.ca_certs),
+                         self.text)
+
+    def test_engine_is_loaded_once(self):
+        if cms.x509 is None:
+            self.skipTest('No crypto binding available')
+
+        engine = cms.get_signing_engine(CONF.signing.certfile,
+                                        CONF.signing.keyfile)
+        self.assertIsNotNone(engine)
+        self.assertIs(cms.get_signing_engine(CONF.signing.certfile,
+                                             CONF.signing.keyfile),
+                      engine)
+
+    def test_sign_text_without_binding(self):
+        self.stubs.Set(cms, 'x509', None)
+        self.assertIsNone(cms.get_signing_engine(CONF.signing.certfile,
+                                                 CONF.signing.keyfile))
+        self.assertEqual(cms.cms_sign_text(self.text, CONF.signing.certfile,
+                                           CONF.signing.keyfile),
+                         self._openssl_sign(self.text))
+
+    def test_sign_text_mismatched_key(self):
+        # the CA key does not match the signing certificate, the engine is
+        # not used and openssl reports the error
+        keyfile = tests.rootdir('examples/pki/private/cakey.pem')
+        self.assertIsNone(cms.get_signing_engine(CONF.signing.certfile,
+                                                 keyfile))
+        self.assertRaises(environment.subprocess.CalledProcessError,
+                          cms.cms_sign_text, self.text,
+                          CONF.signing.certfile, keyfile)
+
+    def test_sign_text_missing_files(self):
+        certfile = tests.tmpdir('missing_signing_cert.pem')
+        self.assertFalse(os.path.exists(certfile))
+        self.assertRaises(environment.subprocess.CalledProcessError,
+                          cms.cms_sign_text, self.text, certfile,
+                          CONF.signing.keyfile)
+
+
+class CmsVerificationTest(CmsTestCase):
+    def setUp(self):
+        super(CmsVerificationTest, self).setUp()
+        self.token = cms.cms_sign_token(self.text, CONF.signing.certfile,
+                                        CONF.signing.keyfile)
+
+    def _verify(self, token, ca_certs=None):
+        return cms.verify_token(token, CONF.signing.certfile,
+                                ca_certs or CONF.signing.ca_certs)
+
+    def test_token_to_cms(self):
+        formatted = cms.token_to_cms(self.token)
+        self.assertEqual(cms.cms_to_token(formatted), self.token)
+        lines = formatted.splitlines()
+        self.assertEqual(lines[0], '-----BEGIN CMS-----')
+        self.assertEqual(lines[-1], '-----END CMS-----')
+        for line in lines[1:-2]:
+            self.assertEqual(len(line), 64)
+
+    def test_verify_token(self):
+        self.assertEqual(self._verify(self.token), self.text)
+        self.assertEqual(cms._openssl_verify(cms.token_to_cms(self.token),
+                                             CONF.signing.certfile,
+                                             CONF.signing.ca_certs),
+                         self.text)
+
+    def test_verify_token_without_binding(self):
+        self.stubs.Set(cms, 'x509', None)
+        self.assertIsNone(cms.get_verification_engine(CONF.signing.certfile,
+                                                      CONF.signing.ca_certs))
+        self.assertEqual(self._verify(self.token), self.text)
+
+    def test_verify_token_with_incomplete_binding(self):
+        if cms.x509 is None:
+            self.skipTest('No crypto binding available')
+
+        class Binding(object):
+            ffi = None
+            lib = object()
+
+        self.stubs.Set(cms.binding, 'Binding', Binding)
+        self.stubs.Set(cms, '_engines', {})
+        self.assertIsNone(cms.get_verification_engine(CONF.signing.certfile,
+                                                      CONF.signing.ca_certs))
+        self.assertEqual(self._verify(self.token), self.text)
+
+    def test_verify_tampered_token(self):
+        token = self.token[:-8] + 'AAAAAAAA'
+        self.assertRaises(environment.subprocess.CalledProcessError,
+                          self._verify, token)
+        self.assertRaises(environment.subprocess.CalledProcessError,
+                          self._verify, 'MII' + 'A' * 100)
+
+    def test_verify_untrusted_signer(self):
+        # the signing certificate is not a CA of itself
+        self.assertRaises(environment.subprocess.CalledProcessError,
+                          self._verify, self.token, CONF.signing.certfile)
+
+    def test_verified_cache(self):
+        if cms.x509 is None:
+            self.skipTest('No crypto binding available')
+
+        engine = cms.VerificationEngine(CONF.signing.certfile,
+                                        CONF.signing.ca_certs,
+                                        cache_size=2)
+        ders = [cms.base64.b64decode(cms.cms_sign_token(
+            'x%d' % i, CONF.signing.certfile,
+            CONF.signing.keyfile).replace('-', '/')) for i in range(3)]
+        for der in ders:
+            engine.verify(der)
+        self.assertEqual(len(engine._verified), 2)
+        self.assertEqual(engine.verify(ders[2]), 'x2')
+
+        # a remembered document is not verified again
+        self.stubs.Set(engine, '_binding', None)
+        self.assertEqual(engine.verify(ders[1]), 'x1')
+
+    def test_verification_engine_reloaded(self):
+        if cms.x509 is None:
+            self.skipTest('No crypto binding available')
+
+        ca_certs = tests.tmpdir('test_cms_cacert.pem')
+        shutil.copy(CONF.signing.ca_certs, ca_certs)
+        self.addCleanup(os.remove, ca_certs)
+        engine = cms.get_verification_engine(CONF.signing.certfile,
+                                             ca_certs)
+        self.assertIs(cms.get_verification_engine(CONF.signing.certfile,
+                                                  ca_certs),
+                      engine)
+
+        mtime = os.path.getmtime(ca_certs)
+        os.utime(ca_certs, (mtime + 1, mtime + 1))
+        self.assertIsNot(cms.get_verification_engine(CONF.signing.certfile,
+                                                     ca_certs),
+                         engine)
@@ -1198,6 +1198,23 @@ class JsonTestCase(RestfulTestCase, CoreApiTests, LegacyV2UsernameTests):
             expected_status=200)
         self.assertValidRevocationListResponse(r)
 
+    def test_fetch_revocation_list_since_admin_200(self):
+        token = self.get_scoped_token()
+        r = self.admin_request(
+            method='GET',
+            path='/v2.0/tokens/revoked?since=0',
+            token=token,
+            expected_status=200)
+        self.assertValidRevocationListResponse(r)
+
+    def test_fetch_revocation_list_since_invalid_400(self):
+        token = self.get_scoped_token()
+        self.admin_request(
+            method='GET',
+            path='/v2.0/tokens/revoked?since=yesterday',
+            token=token,
+            expected_status=400)
+
     def assertValidRevocationListResponse(self, response):
         self.assertIsNotNone(response.result['signed'])
 
@@ -0,0 +1,156 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import threading
+
+from dogpile.cache import api
+
+from keystone.common import cache
+from keystone.common.cache import memcache_pool
+from keystone import config
+from keystone import exception
+from keystone import tests
+from keystone.tests import test_backend_memcache
+from keystone.token.backends import memcache as token_memcache
+
+
+CONF = config.CONF
+
+
+class CountingPool(memcache_pool.ConnectionPool):
+    def __init__(self, maxsize, get_timeout):
+        super(CountingPool, self).__init__(maxsize, get_timeout)
+        self.created = []
+
+    def _create_connection(self):
+        self.created.append(object())
+        return self.created[-1]
+
+
+class ConnectionPoolTest(tests.TestCase):
+    def test_connections_are_reused(self):
+        pool = CountingPool(maxsize=2, get_timeout=1)
+        with pool.acquire() as connection:
+            pass
+        with pool.acquire() as second_connection:
+            self.assertIs(second_connection, connection)
+        self.assertEqual(len(pool.created), 1)
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['acquired'], 2)
+        self.assertEqual(stats['waited'], 0)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['free'], 1)
+
+    def test_pool_is_bounded(self):
+        pool = CountingPool(maxsize=2, get_timeout=0.1)
+        with pool.acquire() as connection:
+            with pool.acquire() as second_connection:
+                self.assertIsNot(second_connection, connection)
+                # no connection is returned in time
+                self.assertRaises(exception.UnexpectedError,
+                                  pool.acquire().__enter__)
+        self.assertEqual(len(pool.created), 2)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        self.assertEqual(pool.stats()['free'], 2)
+
+    def test_wait_for_connection(self):
+        pool = CountingPool(maxsize=1, get_timeout=5)
+        acquired = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with pool.acquire():
+                acquired.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        acquired.wait()
+        threading.Timer(0.05, release.set).start()
+        with pool.acquire():
+            pass
+        thread.join()
+
+        stats = pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['waited'], 1)
+        self.assertTrue(stats['max_wait_time'] > 0)
+        self.assertTrue(stats['wait_time'] >= stats['max_wait_time'])
+
+    def test_failed_creation_is_not_counted(self):
+        pool = CountingPool(maxsize=1, get_timeout=0.1)
+
+        def fail():
+            raise ValueError()
+
+        self.stubs.Set(pool, '_create_connection', fail)
+        self.assertRaises(ValueError, pool.acquire().__enter__)
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+class SharedMemcacheClient(test_backend_memcache.MemcacheClient):
+    """Clients of the same fake server."""
+
+    servers = {}
+
+    def __init__(self, servers, *args, **kwargs):
+        super(SharedMemcacheClient, self).__init__()
+        self.cache = self.servers.setdefault(tuple(servers), {})
+
+
+class MemcachePoolTest(tests.TestCase):
+    def setUp(self):
+        super(MemcachePoolTest, self).setUp()
+        self.stubs.Set(memcache_pool.memcache, 'Client',
+                       SharedMemcacheClient)
+        self.stubs.Set(SharedMemcacheClient, 'servers', {})
+        self.stubs.Set(memcache_pool, '_pools', {})
+        self.opt_in_group('memcache', pool_maxsize=2)
+
+    def test_pool_is_shared(self):
+        pool = memcache_pool.get_pool(['localhost:11211'])
+        self.assertIs(memcache_pool.get_pool(['localhost:11211']), pool)
+        self.assertIsNot(memcache_pool.get_pool(['otherhost:11211']), pool)
+        self.assertEqual(pool.maxsize, 2)
+
+    def test_client_per_operation(self):
+        client = memcache_pool.get_client(['localhost:11211'])
+        client.set('key', 'value')
+        self.assertEqual(client.get('key'), 'value')
+        with client.acquire():
+            self.assertEqual(client.get('key'), 'value')
+        stats = client.pool.stats()
+        self.assertEqual(stats['acquired'], 4)
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['free'], 2)
+
+    def test_token_driver_uses_pool(self):
+        self.opt_in_group('memcache', servers='localhost:11211')
+        driver = token_memcache.Token()
+        self.assertIs(driver.client.pool,
+                      memcache_pool.get_pool(['localhost:11211']))
+
+    def test_cache_backend(self):
+        region = cache.make_region().configure(
+            'keystone.common.cache.memcache_pool',
+            arguments={'url': 'localhost:11211'})
+        region.set('key', 'value')
+        self.assertEqual(region.get('key'), 'value')
+        self.assertEqual(region.get('missing'), api.NO_VALUE)
+        self.assertEqual(
+            memcache_pool.get_pool(['localhost:11211']).stats()['size'], 1)
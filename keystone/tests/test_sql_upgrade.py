@@ -26,6 +26,7 @@ To run these tests against a live database:
     all data will be lost.
 """
 import copy
+import datetime
 import json
 import uuid
 
@@ -610,6 +611,282 @@ class SqlUpgradeTests(SqlMigrateBase):
         self.assertEquals(type(quota_table.c.resource.type),
                           sqlalchemy.types.VARCHAR)
 
+    def test_upgrade_35_to_36(self):
+        self.upgrade(35)
+        session = self.Session()
+        quota_id = uuid.uuid4().hex
+        self.insert_dict(session, 'quota',
+                         {'id': quota_id,
+                          'resource': 'nova.instances',
+                          'ceiling': 10,
+                          'available': -1,
+                          'created_at': datetime.datetime.now(),
+                          'created_by': 'admin'})
+        for key, value in [('domain-id', DEFAULT_DOMAIN_ID),
+                           ('region', 'RegionOne'),
+                           ('role', 'admin')]:
+            self.insert_dict(session, 'child_field_data',
+                             {'id': uuid.uuid4().hex,
+                              'quota_id': quota_id,
+                              'key': key,
+                              'value': value})
+
+        self.upgrade(36)
+        self.assertTableDoesNotExist('child_field_data')
+        # NOTE: we need a different metadata object
+        quota_table = sqlalchemy.Table('quota',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        quota = session.query(quota_table).filter_by(id=quota_id).one()
+        self.assertEqual(quota.domain_id, DEFAULT_DOMAIN_ID)
+        self.assertEqual(quota.region, 'RegionOne')
+        self.assertEqual(quota.service, 'nova')
+        parent_table = sqlalchemy.Table('parent_field_data', self.metadata,
+                                        autoload=True)
+        parent = session.query(parent_table).filter_by(
+            quota_id=quota_id).one()
+        self.assertEqual((parent.key, parent.value), ('role', 'admin'))
+
+        self.downgrade(35)
+        # NOTE: not reflected, sqlite leaves the foreign key of the table
+        # on the temporary table of the downgrade of the quota table.
+        child_table = sqlalchemy.Table('child_field_data',
+                                       sqlalchemy.MetaData(),
+                                       sqlalchemy.Column('quota_id',
+                                                         sqlalchemy.String),
+                                       sqlalchemy.Column('key',
+                                                         sqlalchemy.Text),
+                                       sqlalchemy.Column('value',
+                                                         sqlalchemy.Text))
+        children = self.engine.execute(child_table.select().where(
+            child_table.c.quota_id == quota_id))
+        self.assertEqual(sorted((child.key, child.value)
+                                for child in children),
+                         [('domain-id', DEFAULT_DOMAIN_ID),
+                          ('region', 'RegionOne'),
+                          ('role', 'admin')])
+        self.assertEqual(session.query(parent_table).count(), 0)
+        self.assertTableColumns('child_field_data',
+                                ['id', 'quota_id', 'key', 'value'])
+        session.close()
+
+    def test_upgrade_37_to_38(self):
+        self.upgrade(38)
+        quota_table = sqlalchemy.Table('quota',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        index_data = [(idx.name, idx.columns.keys())
+                      for idx in quota_table.indexes]
+        self.assertIn(('ix_quota_region_domain_id',
+                       ['region', 'domain_id', 'closed_at']), index_data)
+
+        self.downgrade(37)
+        quota_table = sqlalchemy.Table('quota',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        self.assertNotIn('ix_quota_region_domain_id',
+                         [idx.name for idx in quota_table.indexes])
+
+    def test_upgrade_38_to_39(self):
+        self.upgrade(39)
+        history_table = sqlalchemy.Table('h_quota',
+                                         sqlalchemy.MetaData(),
+                                         autoload=True,
+                                         autoload_with=self.engine)
+        index_data = [(idx.name, idx.columns.keys())
+                      for idx in history_table.indexes]
+        self.assertIn(('ix_h_quota_quota_id_updated_at',
+                       ['quota_id', 'updated_at']), index_data)
+
+        self.downgrade(38)
+        history_table = sqlalchemy.Table('h_quota',
+                                         sqlalchemy.MetaData(),
+                                         autoload=True,
+                                         autoload_with=self.engine)
+        self.assertNotIn('ix_h_quota_quota_id_updated_at',
+                         [idx.name for idx in history_table.indexes])
+
+    def test_upgrade_39_to_40(self):
+        self.upgrade(40)
+        self.assertTableColumns('token',
+                                ['id', 'expires', 'extra', 'valid',
+                                 'trust_id', 'user_id', 'revoked_at'])
+        token_table = sqlalchemy.Table('token',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        self.assertIn('ix_token_revoked_at',
+                      [idx.name for idx in token_table.indexes])
+
+        self.downgrade(39)
+        self.assertTableColumns('token',
+                                ['id', 'expires', 'extra', 'valid',
+                                 'trust_id', 'user_id'])
+
+    def test_upgrade_40_to_41(self):
+        self.upgrade(40)
+        session = self.Session()
+        expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        tokens = {
+            'project': {'tenant': {'id': 'tenant-1'}},
+            'oauth': {'tenant': {'id': 'tenant-2'},
+                      'token_data': {'token': {
+                          'OS-OAUTH1': {'consumer_id': 'consumer-1'}}}},
+            'unscoped': {'token_data': {'access': {}}}}
+        for token_id, extra in tokens.items():
+            self.insert_dict(session, 'token',
+                             {'id': token_id,
+                              'expires': expires,
+                              'extra': json.dumps(extra),
+                              'valid': True,
+                              'user_id': 'user-1'})
+        session.close()
+
+        self.upgrade(41)
+        self.assertTableColumns('token',
+                                ['id', 'expires', 'extra', 'valid',
+                                 'trust_id', 'user_id', 'revoked_at',
+                                 'tenant_id', 'consumer_id'])
+        token_table = sqlalchemy.Table('token',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        index_data = [(idx.name, idx.columns.keys())
+                      for idx in token_table.indexes]
+        self.assertIn(('ix_token_user_id_tenant_id',
+                       ['user_id', 'tenant_id', 'valid', 'expires']),
+                      index_data)
+        self.assertIn(('ix_token_user_id_consumer_id',
+                       ['user_id', 'consumer_id', 'valid', 'expires']),
+                      index_data)
+        session = self.Session()
+        rows = session.query(token_table.c.id, token_table.c.tenant_id,
+                             token_table.c.consumer_id).all()
+        self.assertEqual(sorted(rows),
+                         [('oauth', 'tenant-2', 'consumer-1'),
+                          ('project', 'tenant-1', None),
+                          ('unscoped', None, None)])
+        session.close()
+
+        self.downgrade(40)
+        self.assertTableColumns('token',
+                                ['id', 'expires', 'extra', 'valid',
+                                 'trust_id', 'user_id', 'revoked_at'])
+
+    def test_upgrade_41_to_42(self):
+        self.upgrade(41)
+        session = self.Session()
+        changes = [('late', datetime.datetime(2013, 10, 2)),
+                   ('b-early', datetime.datetime(2013, 10, 1)),
+                   ('a-early', datetime.datetime(2013, 10, 1))]
+        for history_id, updated_at in changes:
+            self.insert_dict(session, 'h_quota',
+                             {'id': history_id,
+                              'quota_id': 'quota-1',
+                              'updated_at': updated_at,
+                              'updated_by': 'admin',
+                              'remark': ''})
+        session.close()
+
+        self.upgrade(42)
+        history_table = sqlalchemy.Table('h_quota',
+                                         sqlalchemy.MetaData(),
+                                         autoload=True,
+                                         autoload_with=self.engine)
+        index_data = [(idx.name, idx.columns.keys())
+                      for idx in history_table.indexes]
+        self.assertIn(('ix_h_quota_updated_at', ['updated_at']), index_data)
+        self.assertIn(('ix_h_quota_seq', ['seq']), index_data)
+        session = self.Session()
+        rows = session.query(history_table.c.id, history_table.c.seq).all()
+        self.assertEqual(sorted(rows, key=lambda row: row[1]),
+                         [('a-early', 1), ('b-early', 2), ('late', 3)])
+        sequence_table = sqlalchemy.Table('sequence',
+                                          sqlalchemy.MetaData(),
+                                          autoload=True,
+                                          autoload_with=self.engine)
+        self.assertEqual(session.query(sequence_table).all(),
+                         [('h_quota', 3)])
+        session.close()
+
+        self.downgrade(41)
+        self.assertTableDoesNotExist('sequence')
+        history_table = sqlalchemy.Table('h_quota',
+                                         sqlalchemy.MetaData(),
+                                         autoload=True,
+                                         autoload_with=self.engine)
+        self.assertNotIn('seq', history_table.c)
+        self.assertNotIn('ix_h_quota_updated_at',
+                         [idx.name for idx in history_table.indexes])
+
+    def test_upgrade_42_to_43(self):
+        self.upgrade(42)
+        # a partition of keystone.token.backends.sql_partitioned
+        token_table = sqlalchemy.Table('token',
+                                       sqlalchemy.MetaData(),
+                                       autoload=True,
+                                       autoload_with=self.engine)
+        partition_table = token_table.tometadata(sqlalchemy.MetaData())
+        partition_table.name = 'token_201310181200'
+        partition_table.indexes = set()
+        partition_table.create(self.engine)
+        self.addCleanup(partition_table.drop, self.engine, checkfirst=True)
+
+        session = self.Session()
+        now = datetime.datetime.utcnow()
+        expires = now + datetime.timedelta(hours=1)
+        tokens = [('token', 'late', False, now),
+                  ('token_201310181200', 'early', False,
+                   now - datetime.timedelta(minutes=1)),
+                  ('token', 'valid', True, None)]
+        for table_name, token_id, valid, revoked_at in tokens:
+            self.insert_dict(session, table_name,
+                             {'id': token_id,
+                              'expires': expires,
+                              'extra': '{}',
+                              'valid': valid,
+                              'user_id': 'user-1',
+                              'revoked_at': revoked_at})
+        session.close()
+
+        self.upgrade(43)
+        session = self.Session()
+        rows = []
+        for table_name in ['token', 'token_201310181200']:
+            table = sqlalchemy.Table(table_name,
+                                     sqlalchemy.MetaData(),
+                                     autoload=True,
+                                     autoload_with=self.engine)
+            self.assertIn('ix_%s_revocation_seq' % table_name,
+                          [idx.name for idx in table.indexes])
+            rows.extend(session.query(table.c.id,
+                                      table.c.revocation_seq).all())
+        self.assertEqual(sorted(rows),
+                         [('early', 1), ('late', 2), ('valid', None)])
+        sequence_table = sqlalchemy.Table('sequence',
+                                          sqlalchemy.MetaData(),
+                                          autoload=True,
+                                          autoload_with=self.engine)
+        self.assertIn(('token_revocation', 2),
+                      session.query(sequence_table).all())
+        session.close()
+
+        self.downgrade(42)
+        for table_name in ['token', 'token_201310181200']:
+            table = sqlalchemy.Table(table_name,
+                                     sqlalchemy.MetaData(),
+                                     autoload=True,
+                                     autoload_with=self.engine)
+            self.assertNotIn('revocation_seq', table.c)
+        session = self.Session()
+        self.assertNotIn('token_revocation',
+                         [row[0] for row in
+                          session.query(sequence_table).all()])
+        session.close()
+
     def test_downgrade_32_to_31(self):
         self.upgrade(32)
         session = self.Session()
@@ -338,6 +338,94 @@ class TestPKITokenAPIs(test_v3.RestfulTestCase):
         r = self.get('/auth/tokens/OS-PKI/revoked')
         self.assertIn('signed', r.result)
 
+    def test_revoked_tokens_since(self):
+        token = self.get_requested_token(self.build_authentication_request(
+            user_id=self.user['id'],
+            password=self.user['password'],
+            project_id=self.project['id']))
+        self.delete('/auth/tokens', headers={'X-Subject-Token': token},
+                    expected_status=204)
+
+        r = self.get('/auth/tokens/OS-PKI/revoked?since=0')
+        data = json.loads(cms.cms_verify(r.result['signed'],
+                                         CONF.signing.certfile,
+                                         CONF.signing.ca_certs))
+        self.assertEqual([x['id'] for x in data['revoked']],
+                         [cms.cms_hash_token(token)])
+        self.assertEqual(data['next'], data['revoked'][0]['seq'])
+
+        r = self.get('/auth/tokens/OS-PKI/revoked?since=%d' % data['next'])
+        data = json.loads(cms.cms_verify(r.result['signed'],
+                                         CONF.signing.certfile,
+                                         CONF.signing.ca_certs))
+        self.assertEqual(data['revoked'], [])
+
+        self.get('/auth/tokens/OS-PKI/revoked?since=yesterday',
+                 expected_status=400)
+        self.get('/auth/tokens/OS-PKI/revoked?since=-1',
+                 expected_status=400)
+
+    def test_validate_tokens(self):
+        project_token = self.get_requested_token(
+            self.build_authentication_request(
+                user_id=self.user['id'],
+                password=self.user['password'],
+                project_id=self.project['id']))
+        unscoped_token = self.get_requested_token(
+            self.build_authentication_request(
+                user_id=self.user['id'],
+                password=self.user['password']))
+        revoked_token = self.get_requested_token(
+            self.build_authentication_request(
+                user_id=self.user['id'],
+                password=self.user['password']))
+        self.delete('/auth/tokens', headers={'X-Subject-Token': revoked_token},
+                    expected_status=204)
+        r = self.admin_request(
+            method='POST',
+            path='/v2.0/tokens',
+            body={'auth': {
+                'passwordCredentials': {
+                    'userId': self.default_domain_user['id'],
+                    'password': self.default_domain_user['password']},
+                'tenantId': self.default_domain_project['id']}})
+        v2_token = r.result['access']['token']
+
+        token_ids = [project_token, unscoped_token, revoked_token,
+                     uuid.uuid4().hex, v2_token['id']]
+        r = self.post('/auth/tokens/validate', body={'token_ids': token_ids},
+                      expected_status=200)
+        tokens = r.result['tokens']
+        self.assertEqual([t['id'] for t in tokens], token_ids)
+        self.assertEqual([t['valid'] for t in tokens],
+                         [True, True, False, False, True])
+        self.assertEqual(tokens[0]['project']['id'], self.project['id'])
+        self.assertIn('expires_at', tokens[0])
+        self.assertNotIn('project', tokens[1])
+        self.assertNotIn('domain', tokens[1])
+        self.assertNotIn('expires_at', tokens[2])
+        self.assertEqual(tokens[4]['project']['id'],
+                         self.default_domain_project['id'])
+        self.assertEqual(tokens[4]['expires_at'], v2_token['expires'])
+
+        # the cached token data gives the same results
+        r = self.post('/auth/tokens/validate', body={'token_ids': token_ids},
+                      expected_status=200)
+        self.assertEqual(r.result['tokens'], tokens)
+
+    def test_validate_tokens_invalid_request(self):
+        self.post('/auth/tokens/validate', body={'token_ids': 'x'},
+                  expected_status=400)
+        self.opt_in_group('token', max_batch_size=2)
+        self.post('/auth/tokens/validate',
+                  body={'token_ids': ['x', 'y', 'z']},
+                  expected_status=400)
+        for token_id in [None, 1, ['x'], {'id': 'x'},
+                         'x' * (CONF.max_token_size + 1)]:
+            self.post('/auth/tokens/validate',
+                      body={'token_ids': ['x', token_id]},
+                      expected_status=400)
+
 
 class TestUUIDTokenAPIs(TestPKITokenAPIs):
     def config_files(self):
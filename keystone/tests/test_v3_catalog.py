@@ -49,6 +49,24 @@ class CatalogTestCase(test_v3.RestfulTestCase):
             'service_id': self.service_id})
         self.assertValidServiceResponse(r, self.service)
 
+    def test_get_service_not_modified(self):
+        """Call ``GET /services/{service_id}`` with ``If-None-Match``."""
+        path = '/services/%(service_id)s' % {'service_id': self.service_id}
+        r = self.get(path)
+        etag = r.headers['ETag']
+
+        r = self.get(path, headers={'If-None-Match': etag},
+                     expected_status=304)
+        self.assertEqual(r.headers['ETag'], etag)
+        self.assertEqual(r.body, '')
+
+        service = self.new_service_ref()
+        del service['id']
+        self.patch(path, body={'service': service})
+        r = self.get(path, headers={'If-None-Match': etag})
+        self.assertNotEqual(r.headers['ETag'], etag)
+        self.assertValidServiceResponse(r, service)
+
     def test_update_service(self):
         """Call ``PATCH /services/{service_id}``."""
         service = self.new_service_ref()
@@ -75,6 +93,34 @@ class CatalogTestCase(test_v3.RestfulTestCase):
         r = self.get('/endpoints', content_type='xml')
         self.assertValidEndpointListResponse(r, ref=self.endpoint)
 
+    def test_list_endpoints_not_modified(self):
+        """Call ``GET /endpoints`` with ``If-None-Match``."""
+        r = self.get('/endpoints')
+        etag = r.headers['ETag']
+        self.get('/endpoints', headers={'If-None-Match': etag},
+                 expected_status=304)
+
+        # the other representations have their own tags
+        r = self.get('/endpoints', headers={'If-None-Match': etag},
+                     content_type='xml')
+        self.assertNotEqual(r.headers['ETag'], etag)
+        r = self.get('/endpoints?interface=public',
+                     headers={'If-None-Match': etag})
+        self.assertNotEqual(r.headers['ETag'], etag)
+
+        ref = self.new_endpoint_ref(service_id=self.service_id)
+        r = self.post('/endpoints', body={'endpoint': ref})
+        endpoint = r.result['endpoint']
+        r = self.get('/endpoints', headers={'If-None-Match': etag})
+        self.assertValidEndpointListResponse(r, ref=endpoint)
+
+    def test_list_endpoints_not_modified_without_cache(self):
+        """Call ``GET /endpoints`` with ``If-None-Match``, uncached."""
+        self.opt_in_group('cache', enabled=False)
+        etag = self.get('/endpoints').headers['ETag']
+        self.get('/endpoints', headers={'If-None-Match': etag},
+                 expected_status=304)
+
     def test_create_endpoint(self):
         """Call ``POST /endpoints``."""
         ref = self.new_endpoint_ref(service_id=self.service_id)
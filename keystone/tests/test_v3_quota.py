@@ -47,6 +47,38 @@ class DomainQuotaTestCase(test_v3.RestfulTestCase):
                  body={"quotas": {"region": "USA"}},
                  expected_status=400)
 
+    def test_get_quota_domain_query(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 27}}},
+                 expected_status=200)
+
+        r = self.get('/domains/%s/quotas?region=USA&services=nova' %
+                     self.domain_id)
+        self.assertEqual(r.result[1]['nova']['instances'], 27)
+
+    def test_get_quota_domain_not_modified(self):
+        path = '/domains/%s/quotas?region=USA&services=nova' % self.domain_id
+        r = self.get(path)
+        etag = r.headers['ETag']
+        self.get(path, headers={'If-None-Match': etag}, expected_status=304)
+
+        r = self.get('/domains/%s/quotas?region=USA&services=nova,cinder' %
+                     self.domain_id, headers={'If-None-Match': etag})
+        self.assertNotEqual(r.headers['ETag'], etag)
+
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 27}}},
+                 expected_status=200)
+        r = self.get(path, headers={'If-None-Match': etag})
+        self.assertNotEqual(r.headers['ETag'], etag)
+        self.assertEqual(r.result[1]['nova']['instances'], 27)
+
+    def test_get_quota_domain_not_modified_without_cache(self):
+        self.opt_in_group('cache', enabled=False)
+        path = '/domains/%s/quotas?region=USA&services=nova' % self.domain_id
+        etag = self.get(path).headers['ETag']
+        self.get(path, headers={'If-None-Match': etag}, expected_status=304)
+
     def test_delete_domain_quota(self):
         self.put('/domains/%s/quotas' % self.domain_id,
                  body={'quotas': {'region': 'USA', 'nova': {'instances': 27}}},
@@ -79,12 +111,151 @@ class DomainQuotaTestCase(test_v3.RestfulTestCase):
                  body={'quotas': {'region': 'USA', 'nova': {'instances': 14}}},
                  expected_status=200)
 
+    def test_update_domain_quota_any_service(self):
+        r = self.put('/domains/%s/quotas' % self.domain_id,
+                     body={'quotas': {'region': 'USA',
+                                      'nova': {'instances': 27},
+                                      'swift': {'containers': 5}}},
+                     expected_status=200)
+        child, quotas = r.result
+        self.assertEqual(27, quotas['nova']['instances'])
+        self.assertIn('cores', quotas['nova'])
+        self.assertEqual({'containers': 5}, quotas['swift'])
+
     def test_update_domain_quota_domain_nonexistent(self):
         self.put('/domains/233/quotas',
                  body={'quotas': {'region': 'USA', 'nova': {'instances': 20}}},
                  expected_status=404)
 
+    def test_update_domain_quota_invalid_ceiling(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 27}}},
+                 expected_status=200)
+        for ceiling in ['14', None, True, 1.5, {}]:
+            self.put('/domains/%s/quotas' % self.domain_id,
+                     body={'quotas': {'region': 'USA',
+                                      'nova': {'instances': ceiling}}},
+                     expected_status=400)
+        r = self.get('/domains/%s/quotas?region=USA&services=nova' %
+                     self.domain_id)
+        child, quotas = r.result
+        self.assertEqual(27, quotas['nova']['instances'])
+
     def test_update_domain_quota_domain_no_region(self):
         self.put('/domains/%s/quotas' % self.domain_id,
                  body={'quotas': {'nova': {'instances': 20}}},
                  expected_status=400)
+
+    def test_list_region_quotas(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 27}}},
+                 expected_status=200)
+        r = self.get('/quotas?region=USA&services=nova')
+        self.assertEqual([{'domain_id': self.domain_id,
+                           'region': 'USA',
+                           'quotas': {'nova': {'instances': 27}}}],
+                         r.result['quotas'])
+        self.assertIsNone(r.result['links']['next'])
+
+        r = self.get('/quotas?region=USA&limit=1')
+        self.assertIn('marker=%s' % self.domain_id,
+                      r.result['links']['next'])
+
+    def test_list_region_quotas_no_region(self):
+        self.get('/quotas', expected_status=400)
+
+    def test_list_domain_quota_history(self):
+        for ceiling in [27, 14, 7]:
+            self.put('/domains/%s/quotas' % self.domain_id,
+                     body={'quotas': {'region': 'USA',
+                                      'nova': {'instances': ceiling}}},
+                     expected_status=200)
+        r = self.get('/domains/%s/quotas/history?region=USA&limit=1' %
+                     self.domain_id)
+        self.assertEqual(['ceiling: 14 -> 7.'],
+                         [change['remark'] for change in r.result['history']])
+        marker = r.result['history'][0]['id']
+        self.assertIn('marker=%s' % marker, r.result['links']['next'])
+
+        r = self.get('/domains/%s/quotas/history?region=USA&marker=%s' % (
+                     self.domain_id, marker))
+        self.assertEqual(['ceiling: 27 -> 14.'],
+                         [change['remark'] for change in r.result['history']])
+
+    def test_list_domain_quota_history_no_region(self):
+        self.get('/domains/%s/quotas/history' % self.domain_id,
+                 expected_status=400)
+
+    def test_reserve_commit_domain_quota(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 1}}},
+                 expected_status=200)
+        r = self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                      body={'reservation': {
+                          'region': 'USA',
+                          'resources': {'nova.instances': 1}}},
+                      expected_status=201)
+        reservation_id = r.result['reservation']['id']
+        self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                  body={'reservation': {
+                      'region': 'USA',
+                      'resources': {'nova.instances': 1}}},
+                  expected_status=413)
+        self.post('/domains/%s/quotas/reservations/%s/commit' % (
+                  self.domain_id, reservation_id),
+                  expected_status=204)
+
+    def test_reserve_rollback_domain_quota(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 1}}},
+                 expected_status=200)
+        r = self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                      body={'reservation': {
+                          'region': 'USA',
+                          'resources': {'nova.instances': 1}}},
+                      expected_status=201)
+        self.delete('/domains/%s/quotas/reservations/%s' % (
+                    self.domain_id, r.result['reservation']['id']),
+                    expected_status=204)
+        self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                  body={'reservation': {
+                      'region': 'USA',
+                      'resources': {'nova.instances': 1}}},
+                  expected_status=201)
+
+    def test_reserve_domain_quota_no_region(self):
+        self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                  body={'reservation': {
+                      'resources': {'nova.instances': 1}}},
+                  expected_status=400)
+
+    def test_reserve_domain_quota_invalid_input(self):
+        self.put('/domains/%s/quotas' % self.domain_id,
+                 body={'quotas': {'region': 'USA', 'nova': {'instances': 1}}},
+                 expected_status=200)
+        for reservation in [{'resources': {'nova.instances': '1'}},
+                            {'resources': {'nova.instances': None}},
+                            {'resources': {'nova.instances': True}},
+                            {'resources': ['nova.instances']},
+                            {'resources': {}},
+                            {'resources': {'nova.instances': 1},
+                             'expire': '60'},
+                            {'resources': {'nova.instances': 1},
+                             'expire': 0}]:
+            reservation['region'] = 'USA'
+            self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                      body={'reservation': reservation},
+                      expected_status=400)
+        self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                  body={'reservation': {
+                      'region': 'USA',
+                      'resources': {'nova.instances': 1},
+                      'expire': 60}},
+                  expected_status=201)
+
+    def test_reserve_domain_quota_not_found(self):
+        self.post('/domains/%s/quotas/reservations' % self.domain_id,
+                  body={'reservation': {
+                      'region': 'USA',
+                      'resources': {'nova.instances': 1}}},
+                  expected_status=404)
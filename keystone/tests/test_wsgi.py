@@ -97,6 +97,14 @@ class ApplicationTest(BaseWSGITest):
         self.assertEqual(resp.headers.get('Content-Length'), '0')
         self.assertEqual(resp.headers.get('Content-Type'), None)
 
+    def test_render_conditional_response_without_version(self):
+        context = {'path': '/', 'query_string': {},
+                   'headers': {'If-None-Match': '*'}}
+        resp = wsgi.render_conditional_response(
+            context, None, lambda: {'attribute': 'value'})
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual(resp.headers.get('ETag'), None)
+
     def test_application_local_config(self):
         class FakeApp(wsgi.Application):
             def __init__(self, *args, **kwargs):
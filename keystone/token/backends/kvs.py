@@ -15,6 +15,7 @@
 # under the License.
 
 import copy
+import heapq
 
 from keystone.common import kvs
 from keystone import exception
@@ -30,6 +31,14 @@ class Token(kvs.Base, token.Driver):
 
     Deprecated in Havana and will be removed in Icehouse, as this backend
     is not production grade.
+
+    Tokens are stored under ``token-<id>``, and ``revoked-token-<id>`` once
+    revoked. The unexpired tokens are indexed by user, trust and consumer
+    under ``token_user-<user_id>``, ``token_trust-<trust_id>`` and
+    ``token_consumer-<consumer_id>`` as dictionaries of their expiry keyed by
+    token id, the revoked tokens under ``revoked_tokens``. ``token_expiry``
+    is a heap of (expires, token id) ordering all the tokens by expiry, and
+    ``revocation_seq`` the sequence number of the last revocation.
     """
 
     def __init__(self, *args, **kw):
@@ -38,6 +47,42 @@ class Token(kvs.Base, token.Driver):
                    "keystone.token.backends.sql or "
                    "keystone.token.backend.memcache instead."))
 
+    def _index_keys(self, ref):
+        keys = []
+        if ref.get('user') and ref['user'].get('id'):
+            keys.append('token_user-%s' % ref['user']['id'])
+        if ref.get('trust_id'):
+            keys.append('token_trust-%s' % ref['trust_id'])
+        consumer_id = self._consumer_id(ref)
+        if consumer_id:
+            keys.append('token_consumer-%s' % consumer_id)
+        return keys
+
+    def _consumer_id(self, ref):
+        try:
+            return ref['token_data']['token']['OS-OAUTH1']['consumer_id']
+        except (KeyError, TypeError):
+            return None
+
+    def _add_to_index(self, key, token_id, expires):
+        # NOTE: the indexes are updated in place, copying them as
+        # DictKvs.get() and set() do would make every token creation linear
+        # in the number of tokens of the user.
+        self.db.setdefault(key, {})[token_id] = expires
+
+    def _remove_from_index(self, key, token_id):
+        index = self.db[key] if key in self.db else {}
+        if token_id not in index:
+            return
+        del index[token_id]
+        if not index:
+            del self.db[key]
+
+    def _expiry_heap(self):
+        # NOTE: the heap is updated in place, copying it as DictKvs.get()
+        # does would make every token creation linear.
+        return self.db.setdefault('token_expiry', [])
+
     # Public interface
     def get_token(self, token_id):
         try:
@@ -55,15 +100,25 @@ class Token(kvs.Base, token.Driver):
         if not data_copy.get('user_id'):
             data_copy['user_id'] = data_copy['user']['id']
         self.db.set('token-%s' % token_id, data_copy)
+        for key in self._index_keys(data_copy):
+            self._add_to_index(key, token_id, data_copy['expires'])
+        heapq.heappush(self._expiry_heap(),
+                       (data_copy['expires'], token_id))
         return copy.deepcopy(data_copy)
 
     def delete_token(self, token_id):
         try:
             token_ref = self.get_token(token_id)
             self.db.delete('token-%s' % token_id)
+            token_ref['revoked_at'] = timeutils.utcnow()
+            seq = self.db.setdefault('revocation_seq', 0) + 1
+            self.db['revocation_seq'] = token_ref['revocation_seq'] = seq
             self.db.set('revoked-token-%s' % token_id, token_ref)
         except exception.NotFound:
             raise exception.TokenNotFound(token_id=token_id)
+        for key in self._index_keys(token_ref):
+            self._remove_from_index(key, token_id)
+        self._add_to_index('revoked_tokens', token_id, token_ref['expires'])
 
     def is_not_expired(self, now, ref):
         return not ref.get('expires') and ref.get('expires') < now
@@ -71,60 +126,32 @@ class Token(kvs.Base, token.Driver):
     def is_expired(self, now, ref):
         return ref.get('expires') and ref.get('expires') < now
 
-    def trust_matches(self, trust_id, ref):
-        return ref.get('trust_id') and ref['trust_id'] == trust_id
-
-    def _list_tokens_for_trust(self, trust_id):
-        tokens = []
+    def _list_indexed_tokens(self, key):
+        """Returns the ids of the unexpired tokens of an index."""
         now = timeutils.utcnow()
-        for token, ref in self.db.items():
-            if not token.startswith('token-') or self.is_expired(now, ref):
-                continue
-            if self.trust_matches(trust_id, ref):
-                tokens.append(token.split('-', 1)[1])
-        return tokens
+        return [token_id
+                for token_id, expires in self.db.get(key, {}).iteritems()
+                if not expires or expires >= now]
 
-    def _consumer_matches(self, consumer_id, token_ref_dict):
-        if consumer_id is None:
-            return True
-        else:
-            if 'token_data' in token_ref_dict:
-                token_data = token_ref_dict.get('token_data')
-                if 'token' in token_data:
-                    token = token_data.get('token')
-                    oauth = token.get('OS-OAUTH1')
-                    if oauth and oauth.get('consumer_id') == consumer_id:
-                        return True
-            return False
+    def _list_tokens_for_trust(self, trust_id):
+        return self._list_indexed_tokens('token_trust-%s' % trust_id)
 
     def _list_tokens_for_consumer(self, consumer_id):
-        tokens = []
-        now = timeutils.utcnow()
-        for token, ref in self.db.items():
-            if not token.startswith('token-') or self.is_expired(now, ref):
-                continue
-            if self._consumer_matches(consumer_id, ref):
-                tokens.append(token.split('-', 1)[1])
-        return tokens
+        return self._list_indexed_tokens('token_consumer-%s' % consumer_id)
 
     def _list_tokens_for_user(self, user_id, tenant_id=None):
-        def user_matches(user_id, ref):
-            return ref.get('user') and ref['user'].get('id') == user_id
-
         def tenant_matches(tenant_id, ref):
             return ((tenant_id is None) or
                     (ref.get('tenant') and
                      ref['tenant'].get('id') == tenant_id))
 
         tokens = []
-        now = timeutils.utcnow()
-        for token, ref in self.db.items():
-            if not token.startswith('token-') or self.is_expired(now, ref):
-                continue
-            else:
-                if (user_matches(user_id, ref) and
-                        tenant_matches(tenant_id, ref)):
-                        tokens.append(token.split('-', 1)[1])
+        for token_id in self._list_indexed_tokens('token_user-%s' % user_id):
+            if tenant_id is not None:
+                ref = self.db.get('token-%s' % token_id)
+                if not tenant_matches(tenant_id, ref):
+                    continue
+            tokens.append(token_id)
         return tokens
 
     def list_tokens(self, user_id, tenant_id=None, trust_id=None,
@@ -136,19 +163,53 @@ class Token(kvs.Base, token.Driver):
         else:
             return self._list_tokens_for_user(user_id, tenant_id)
 
+    def _list_revoked_refs(self):
+        return [self.db.get('revoked-token-%s' % token_id)
+                for token_id in self.db.get('revoked_tokens', {})]
+
     def list_revoked_tokens(self):
         tokens = []
-        for token, token_ref in self.db.items():
-            if not token.startswith('revoked-token-'):
-                continue
+        for token_ref in self._list_revoked_refs():
             record = {}
             record['id'] = token_ref['id']
             record['expires'] = token_ref['expires']
             tokens.append(record)
         return tokens
 
-    def flush_expired_tokens(self):
+    def list_revoked_tokens_since(self, since):
         now = timeutils.utcnow()
-        for token, token_ref in self.db.items():
+        tokens = []
+        for token_ref in self._list_revoked_refs():
             if self.is_expired(now, token_ref):
-                self.db.delete(token)
+                continue
+            seq = token_ref.get('revocation_seq')
+            if seq is None or seq <= since:
+                continue
+            tokens.append({'id': token_ref['id'],
+                           'expires': token_ref['expires'],
+                           'revoked_at': token_ref['revoked_at'],
+                           'seq': seq})
+        tokens.sort(key=lambda record: record['seq'])
+        return tokens
+
+    def flush_expired_tokens(self, batch_size=None, progress=None):
+        now = timeutils.utcnow()
+        flushed = 0
+        heap = self._expiry_heap()
+        while heap and heap[0][0] < now:
+            expires, token_id = heapq.heappop(heap)
+            for key in ('token-%s' % token_id, 'revoked-token-%s' % token_id):
+                # NOTE: the token may have been created again since this
+                # entry was pushed, with a later expiry.
+                if key not in self.db or not self.is_expired(now,
+                                                             self.db[key]):
+                    continue
+                ref = self.db.pop(key)
+                for index_key in self._index_keys(ref):
+                    self._remove_from_index(index_key, token_id)
+                if key.startswith('revoked-token-'):
+                    self._remove_from_index('revoked_tokens', token_id)
+                flushed += 1
+        if progress is not None:
+            progress(flushed)
+        return flushed
@@ -17,8 +17,7 @@
 from __future__ import absolute_import
 import copy
 
-import memcache
-
+from keystone.common.cache import memcache_pool
 from keystone.common import utils
 from keystone import config
 from keystone import exception
@@ -32,9 +31,14 @@ CONF = config.CONF
 
 LOG = logging.getLogger(__name__)
 
+# Seconds a revocation sequence number may go missing from the revocation
+# list, between its increment and the append of its revocation.
+REVOCATION_SEQ_GRACE = 60
+
 
 class Token(token.Driver):
     revocation_key = 'revocation-list'
+    revocation_seq_key = 'revocation-seq'
 
     def __init__(self, client=None):
         self._memcache_client = client
@@ -50,8 +54,9 @@ class Token(token.Driver):
         # specific to the cas() (compare and set) methods and the caching of
         # the previous value(s). It appears greenthread should ensure there is
         # a single data structure per spawned greenthread.
-        self._memcache_client = memcache.Client(memcache_servers, debug=0,
-                                                cache_cas=True)
+        # Each operation checks a client out of a pool shared with the other
+        # consumers of the servers, compare and set loops keep the same one.
+        self._memcache_client = memcache_pool.get_client(memcache_servers)
         return self._memcache_client
 
     def _prefix_token_id(self, token_id):
@@ -60,6 +65,50 @@ class Token(token.Driver):
     def _prefix_user_id(self, user_id):
         return 'usertokens-%s' % user_id.encode('utf-8')
 
+    def _bucket_keys(self, key, interval, current_ts):
+        """Returns the keys which may hold unexpired entries of a list.
+
+        The first one is the key of the list itself, the following ones are
+        its buckets covering the token lifetime, from now on, each holding
+        the entries which expire within the same interval seconds.
+        """
+        keys = [key]
+        bucket = current_ts - current_ts % interval
+        while bucket <= current_ts + CONF.token.expiration:
+            keys.append('%s-%d' % (key, bucket))
+            bucket += interval
+        return keys
+
+    def _add_to_bucket(self, key, data_json, expires_ts, interval):
+        """Appends an entry to the bucket of a list covering its expiry.
+
+        The bucket is evicted by memcache once its interval has passed.
+
+        :returns: False when the token lifetime does not cover the bucket
+        """
+        current_ts = utils.unixtime(timeutils.utcnow())
+        bucket = expires_ts - expires_ts % interval
+        if bucket > current_ts + CONF.token.expiration:
+            return False
+        bucket_key = '%s-%d' % (key, bucket)
+        # NOTE: append and add are atomic, concurrent writers of a bucket do
+        # not need to compare and set it.
+        if not self.client.append(bucket_key, ',%s' % data_json):
+            if not self.client.add(bucket_key, data_json,
+                                   time=bucket + interval):
+                if not self.client.append(bucket_key, ',%s' % data_json):
+                    msg = _('Unable to add entry to "%s".') % bucket_key
+                    raise exception.UnexpectedError(msg)
+        return True
+
+    def _get_bucket_records(self, key, interval, current_ts):
+        """Returns the records of a list and of its buckets in one round
+        trip, in the order of _bucket_keys.
+        """
+        keys = self._bucket_keys(key, interval, current_ts)
+        records = self.client.get_multi(keys)
+        return [records.get(bucket_key) for bucket_key in keys]
+
     def get_token(self, token_id):
         if token_id is None:
             raise exception.TokenNotFound(token_id='')
@@ -78,26 +127,78 @@ class Token(token.Driver):
         if not data_copy.get('user_id'):
             data_copy['user_id'] = data_copy['user']['id']
         kwargs = {}
+        expires_ts = None
         if data_copy['expires'] is not None:
             expires_ts = utils.unixtime(data_copy['expires'])
             kwargs['time'] = expires_ts
         self.client.set(ptk, data_copy, **kwargs)
         if 'id' in data['user']:
-            token_data = jsonutils.dumps(token_id)
+            # NOTE: the expiry is indexed along with the token id, so that
+            # expired entries are pruned without fetching the tokens.
+            token_data = jsonutils.dumps([token_id, expires_ts])
             user_id = data['user']['id']
             user_key = self._prefix_user_id(user_id)
-            # Append the new token_id to the token-index-list stored in the
+            # Append the new token_id to the bucket of its expiry. Tokens
+            # outliving the configured lifetime are not looked up in the
+            # buckets, append them to the token-index-list stored in the
             # user-key within memcache.
-            self._update_user_list_with_cas(user_key, token_data)
+            if not self._add_to_bucket(user_key, token_data, expires_ts,
+                                       CONF.memcache.user_index_interval):
+                self._update_user_list_with_cas(user_key,
+                                                jsonutils.dumps(token_id))
         return copy.deepcopy(data_copy)
 
+    def _get_tokens(self, client, token_ids):
+        """Fetches tokens in a single round trip.
+
+        :returns: dict of the tokens found, keyed by token id
+        """
+        ptks = dict((self._prefix_token_id(token_id), token_id)
+                    for token_id in token_ids)
+        if not ptks:
+            return {}
+        token_refs = client.get_multi(ptks.keys())
+        return dict((ptks[ptk], token_ref)
+                    for ptk, token_ref in token_refs.iteritems()
+                    if token_ref)
+
+    def _load_user_list(self, client, record, current_ts):
+        """Returns the unexpired [token_id, expires] entries of a
+        token-index-list.
+
+        Entries indexed without their expiry, those of the token-index-list
+        of the user itself, are plain token ids and their expiry is read
+        from the tokens.
+        """
+        entries = []
+        legacy_ids = []
+        for entry in jsonutils.loads('[%s]' % (record or '')):
+            if isinstance(entry, list):
+                entries.append(entry)
+            else:
+                legacy_ids.append(entry)
+        for token_id, token_ref in self._get_tokens(client,
+                                                    legacy_ids).iteritems():
+            expires_ts = None
+            if token_ref.get('expires') is not None:
+                expires_ts = utils.unixtime(token_ref['expires'])
+            entries.append([token_id, expires_ts])
+        return [entry for entry in entries
+                if entry[1] is None or entry[1] >= current_ts]
+
     def _update_user_list_with_cas(self, user_key, token_id):
+        # NOTE: the cas ids are kept by the client which called gets(), the
+        # whole loop runs on the same client of the pool.
+        with self.client.acquire() as client:
+            return self._update_user_list_with_client(client, user_key,
+                                                      token_id)
+
+    def _update_user_list_with_client(self, client, user_key, token_id):
         cas_retry = 0
         max_cas_retry = CONF.memcache.max_compare_and_set_retry
-        current_time = timeutils.normalize_time(
-            timeutils.parse_isotime(timeutils.isotime()))
+        current_ts = utils.unixtime(timeutils.utcnow())
 
-        self.client.reset_cas()
+        client.reset_cas()
 
         while cas_retry <= max_cas_retry:
             # NOTE(morganfainberg): cas or "compare and set" is a function of
@@ -110,27 +211,16 @@ class Token(token.Driver):
             # case memcache is down or something horrible happens we don't
             # iterate forever trying to compare and set the new value.
             cas_retry += 1
-            record = self.client.gets(user_key)
-            filtered_list = []
-
-            if record is not None:
-                token_list = jsonutils.loads('[%s]' % record)
-                for token_i in token_list:
-                    ptk = self._prefix_token_id(token_i)
-                    token_ref = self.client.get(ptk)
-                    if not token_ref:
-                        # skip tokens that do not exist in memcache
-                        continue
-
-                    if 'expires' in token_ref:
-                        expires_at = timeutils.normalize_time(
-                            token_ref['expires'])
-                        if expires_at < current_time:
-                            # skip tokens that are expired.
-                            continue
-
-                    # Add the still valid token_id to the list.
-                    filtered_list.append(jsonutils.dumps(token_i))
+            record = client.gets(user_key)
+            # Keep the entries of the tokens which have not expired,
+            # revoked tokens are pruned once they expire.
+            # NOTE: the token-index-list is also read and written by earlier
+            # releases, which only know plain token ids. Its entries are
+            # kept in that format until no node runs them anymore, the
+            # buckets they do not read hold the entries with their expiry.
+            filtered_list = [jsonutils.dumps(entry[0]) for entry in
+                             self._load_user_list(client, record,
+                                                  current_ts)]
             # Add the new token_id to the list.
             filtered_list.append(token_id)
 
@@ -138,7 +228,7 @@ class Token(token.Driver):
             # token-index-list for the user-key. Cas is used to prevent race
             # conditions from causing the loss of valid token ids from this
             # list.
-            if self.client.cas(user_key, ','.join(filtered_list)):
+            if client.cas(user_key, ','.join(filtered_list)):
                 msg = _('Successful set of token-index-list for user-key '
                         '"%(user_key)s", #%(count)d records')
                 LOG.debug(msg, {'user_key': user_key,
@@ -161,8 +251,43 @@ class Token(token.Driver):
         error_msg = _('Unable to add token user list')
         raise exception.UnexpectedError(error_msg)
 
+    def _next_revocation_seq(self):
+        """Returns the sequence number of a new revocation.
+
+        The counter is incremented atomically, each revocation gets its own
+        number. Should the counter be evicted, it restarts above the numbers
+        already handed out.
+        """
+        seq = self.client.incr(self.revocation_seq_key)
+        if seq is None:
+            current_ts = utils.unixtime(timeutils.utcnow())
+            # NOTE: the revocations with the highest numbers may have been
+            # evicted along with the counter, which is also seeded with the
+            # time in milliseconds to restart above them.
+            seed = max([int(current_ts * 1000)] +
+                       [token_ref.get('seq', 0)
+                        for token_refs in self._list_revocations(current_ts)
+                        for token_ref in token_refs])
+            self.client.add(self.revocation_seq_key, seed)
+            seq = self.client.incr(self.revocation_seq_key)
+            if seq is None:
+                msg = _('Unable to get a revocation sequence number.')
+                raise exception.UnexpectedError(msg)
+        return int(seq)
+
     def _add_to_revocation_list(self, data):
-        data_json = jsonutils.dumps(data)
+        # NOTE: only what is listed is kept, the revocation list does not
+        # grow with the size of the tokens.
+        data_json = jsonutils.dumps({'id': data['id'],
+                                     'expires': data['expires'],
+                                     'revoked_at': data['revoked_at'],
+                                     'seq': data['seq']})
+        if self._add_to_bucket(self.revocation_key, data_json,
+                               utils.unixtime(data['expires']),
+                               CONF.memcache.revocation_list_interval):
+            return
+        # Tokens outliving the configured lifetime are appended to the
+        # revocation list itself.
         if not self.client.append(self.revocation_key, ',%s' % data_json):
             if not self.client.add(self.revocation_key, data_json):
                 if not self.client.append(self.revocation_key,
@@ -175,18 +300,25 @@ class Token(token.Driver):
         data = self.get_token(token_id)
         ptk = self._prefix_token_id(token_id)
         result = self.client.delete(ptk)
+        data['revoked_at'] = timeutils.isotime(subsecond=True)
+        data['seq'] = self._next_revocation_seq()
         self._add_to_revocation_list(data)
         return result
 
     def list_tokens(self, user_id, tenant_id=None, trust_id=None,
                     consumer_id=None):
         tokens = []
-        user_key = self._prefix_user_id(user_id)
-        user_record = self.client.get(user_key) or ""
-        token_list = jsonutils.loads('[%s]' % user_record)
+        current_ts = utils.unixtime(timeutils.utcnow())
+        user_records = self._get_bucket_records(
+            self._prefix_user_id(user_id), CONF.memcache.user_index_interval,
+            current_ts)
+        user_record = ','.join(record for record in user_records if record)
+        token_list = [token_id for token_id, expires_ts in
+                      self._load_user_list(self.client, user_record,
+                                           current_ts)]
+        token_refs = self._get_tokens(self.client, token_list)
         for token_id in token_list:
-            ptk = self._prefix_token_id(token_id)
-            token_ref = self.client.get(ptk)
+            token_ref = token_refs.get(token_id)
             if token_ref:
                 if tenant_id is not None:
                     tenant = token_ref.get('tenant')
@@ -211,8 +343,61 @@ class Token(token.Driver):
                 tokens.append(token_id)
         return tokens
 
+    def _list_revocations(self, current_ts):
+        """Returns the entries of the revocation list and of each of its
+        buckets, in the order of _bucket_keys, expired ones included.
+        """
+        records = self._get_bucket_records(
+            self.revocation_key, CONF.memcache.revocation_list_interval,
+            current_ts)
+        return [jsonutils.loads('[%s]' % record) if record else []
+                for record in records]
+
     def list_revoked_tokens(self):
-        list_json = self.client.get(self.revocation_key)
-        if list_json:
-            return jsonutils.loads('[%s]' % list_json)
-        return []
+        current_ts = utils.unixtime(timeutils.utcnow())
+        tokens = []
+        for i, token_refs in enumerate(self._list_revocations(current_ts)):
+            if i < 2:
+                # NOTE: the entries of the revocation list itself and of the
+                # current bucket may have expired, the following buckets only
+                # hold unexpired tokens.
+                token_refs = [
+                    token_ref for token_ref in token_refs
+                    if utils.unixtime(timeutils.parse_isotime(
+                        token_ref['expires'])) >= current_ts]
+            tokens.extend(token_refs)
+        return tokens
+
+    def list_revoked_tokens_since(self, since):
+        current_ts = utils.unixtime(timeutils.utcnow())
+        token_refs = sorted(
+            (token_ref
+             for token_refs in self._list_revocations(current_ts)
+             for token_ref in token_refs
+             if token_ref.get('seq', 0) > since),
+            key=lambda token_ref: token_ref['seq'])
+        tokens = []
+        # NOTE: the counter starts from a seed, the numbers listed from the
+        # start follow the first one listed.
+        expected_seq = since + 1 if since else None
+        for token_ref in token_refs:
+            revoked_at = timeutils.normalize_time(
+                timeutils.parse_isotime(token_ref['revoked_at']))
+            # NOTE: a missing number is a revocation which may not be
+            # appended yet, stop short of it so that the marker does not
+            # pass it, unless it went missing for longer than it takes.
+            if (expected_seq is not None and
+                    token_ref['seq'] > expected_seq and
+                    utils.unixtime(revoked_at) >
+                    current_ts - REVOCATION_SEQ_GRACE):
+                break
+            expected_seq = token_ref['seq'] + 1
+            expires_ts = utils.unixtime(
+                timeutils.parse_isotime(token_ref['expires']))
+            if expires_ts < current_ts:
+                continue
+            tokens.append({'id': token_ref['id'],
+                           'expires': token_ref['expires'],
+                           'revoked_at': revoked_at,
+                           'seq': token_ref['seq']})
+        return tokens
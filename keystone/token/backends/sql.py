@@ -15,13 +15,20 @@
 # under the License.
 
 import copy
+import time
 
 from keystone.common import sql
+from keystone import config
 from keystone import exception
 from keystone.openstack.common import timeutils
 from keystone import token
 
 
+CONF = config.CONF
+
+REVOCATION_SEQUENCE = 'token_revocation'
+
+
 class TokenModel(sql.ModelBase, sql.DictBase):
     __tablename__ = 'token'
     attributes = ['id', 'expires', 'user_id', 'trust_id']
@@ -31,9 +38,24 @@ class TokenModel(sql.ModelBase, sql.DictBase):
     valid = sql.Column(sql.Boolean(), default=True, nullable=False)
     user_id = sql.Column(sql.String(64))
     trust_id = sql.Column(sql.String(64))
+    revoked_at = sql.Column(sql.DateTime(), nullable=True)
+    # NOTE: tenant_id and consumer_id duplicate the tenant and OAuth consumer
+    # of the extra blob, so that tokens are listed and revoked without
+    # deserializing it. They are not part of the token dictionaries.
+    tenant_id = sql.Column(sql.String(64), nullable=True)
+    consumer_id = sql.Column(sql.String(64), nullable=True)
+    # NOTE: orders the revocations for the revocation feed, see
+    # list_revoked_tokens_since.
+    revocation_seq = sql.Column(sql.Integer, nullable=True)
     __table_args__ = (
         sql.Index('ix_token_expires', 'expires'),
-        sql.Index('ix_token_valid', 'valid')
+        sql.Index('ix_token_valid', 'valid'),
+        sql.Index('ix_token_revoked_at', 'revoked_at'),
+        sql.Index('ix_token_revocation_seq', 'revocation_seq'),
+        sql.Index('ix_token_user_id_tenant_id',
+                  'user_id', 'tenant_id', 'valid', 'expires'),
+        sql.Index('ix_token_user_id_consumer_id',
+                  'user_id', 'consumer_id', 'valid', 'expires')
     )
 
 
@@ -48,7 +70,7 @@ class Token(sql.Base, token.Driver):
             raise exception.TokenNotFound(token_id=token_id)
         return token_ref.to_dict()
 
-    def create_token(self, token_id, data):
+    def _new_token_ref(self, data):
         data_copy = copy.deepcopy(data)
         if not data_copy.get('expires'):
             data_copy['expires'] = token.default_expire_time()
@@ -57,6 +79,13 @@ class Token(sql.Base, token.Driver):
 
         token_ref = TokenModel.from_dict(data_copy)
         token_ref.valid = True
+        if data_copy.get('tenant'):
+            token_ref.tenant_id = data_copy['tenant'].get('id')
+        token_ref.consumer_id = self._consumer_id(data_copy)
+        return token_ref
+
+    def create_token(self, token_id, data):
+        token_ref = self._new_token_ref(data)
         session = self.get_session()
         with session.begin():
             session.add(token_ref)
@@ -70,6 +99,9 @@ class Token(sql.Base, token.Driver):
             if not token_ref or not token_ref.valid:
                 raise exception.TokenNotFound(token_id=token_id)
             token_ref.valid = False
+            token_ref.revoked_at = timeutils.utcnow()
+            token_ref.revocation_seq = sql.next_sequence_value(
+                session, REVOCATION_SEQUENCE)
             session.flush()
 
     def delete_tokens(self, user_id, tenant_id=None, trust_id=None,
@@ -92,35 +124,24 @@ class Token(sql.Base, token.Driver):
                 query = query.filter(TokenModel.trust_id == trust_id)
             else:
                 query = query.filter(TokenModel.user_id == user_id)
-
-            for token_ref in query.all():
-                if tenant_id:
-                    token_ref_dict = token_ref.to_dict()
-                    if not self._tenant_matches(tenant_id, token_ref_dict):
-                        continue
-                if consumer_id:
-                    token_ref_dict = token_ref.to_dict()
-                    if not self._consumer_matches(consumer_id, token_ref_dict):
-                        continue
-
-                token_ref.valid = False
-
+            if tenant_id:
+                query = query.filter(TokenModel.tenant_id == tenant_id)
+            if consumer_id:
+                query = query.filter(TokenModel.consumer_id == consumer_id)
+
+            # NOTE: the tokens revoked together share a sequence number.
+            seq = sql.next_sequence_value(session, REVOCATION_SEQUENCE)
+            query.update({'valid': False, 'revoked_at': now,
+                          'revocation_seq': seq},
+                         synchronize_session=False)
             session.flush()
 
-    def _tenant_matches(self, tenant_id, token_ref_dict):
-        return ((tenant_id is None) or
-                (token_ref_dict.get('tenant') and
-                 token_ref_dict['tenant'].get('id') == tenant_id))
-
-    def _consumer_matches(self, consumer_id, ref):
-        if consumer_id is None:
-            return True
-        else:
-            try:
-                oauth = ref['token_data']['token'].get('OS-OAUTH1', {})
-                return oauth and oauth['consumer_id'] == consumer_id
-            except KeyError:
-                return False
+    def _consumer_id(self, ref):
+        try:
+            oauth = ref['token_data']['token'].get('OS-OAUTH1') or {}
+        except KeyError:
+            return None
+        return oauth.get('consumer_id')
 
     def _list_tokens_for_trust(self, trust_id):
         session = self.get_session()
@@ -138,35 +159,26 @@ class Token(sql.Base, token.Driver):
 
     def _list_tokens_for_user(self, user_id, tenant_id=None):
         session = self.get_session()
-        tokens = []
         now = timeutils.utcnow()
-        query = session.query(TokenModel)
+        query = session.query(TokenModel.id)
         query = query.filter(TokenModel.expires > now)
         query = query.filter(TokenModel.user_id == user_id)
+        if tenant_id:
+            query = query.filter(TokenModel.tenant_id == tenant_id)
 
         token_references = query.filter_by(valid=True)
-        for token_ref in token_references:
-            token_ref_dict = token_ref.to_dict()
-            if self._tenant_matches(tenant_id, token_ref_dict):
-                tokens.append(token_ref['id'])
-        return tokens
+        return [token_ref.id for token_ref in token_references]
 
     def _list_tokens_for_consumer(self, user_id, consumer_id):
-        tokens = []
         session = self.get_session()
-        with session.begin():
-            now = timeutils.utcnow()
-            query = session.query(TokenModel)
-            query = query.filter(TokenModel.expires > now)
-            query = query.filter(TokenModel.user_id == user_id)
-            token_references = query.filter_by(valid=True)
+        now = timeutils.utcnow()
+        query = session.query(TokenModel.id)
+        query = query.filter(TokenModel.expires > now)
+        query = query.filter(TokenModel.user_id == user_id)
+        query = query.filter(TokenModel.consumer_id == consumer_id)
 
-            for token_ref in token_references:
-                token_ref_dict = token_ref.to_dict()
-                if self._consumer_matches(consumer_id, token_ref_dict):
-                    tokens.append(token_ref_dict['id'])
-            session.flush()
-        return tokens
+        token_references = query.filter_by(valid=True)
+        return [token_ref.id for token_ref in token_references]
 
     def list_tokens(self, user_id, tenant_id=None, trust_id=None,
                     consumer_id=None):
@@ -192,11 +204,52 @@ class Token(sql.Base, token.Driver):
             tokens.append(record)
         return tokens
 
-    def flush_expired_tokens(self):
+    def list_revoked_tokens_since(self, since):
         session = self.get_session()
-
         query = session.query(TokenModel)
-        query = query.filter(TokenModel.expires < timeutils.utcnow())
-        query.delete(synchronize_session=False)
+        query = query.filter(TokenModel.revocation_seq > since)
+        query = query.filter(TokenModel.expires > timeutils.utcnow())
+        query = query.filter_by(valid=False)
+        query = query.order_by(TokenModel.revocation_seq)
+        return [{'id': token_ref['id'],
+                 'expires': token_ref['expires'],
+                 'revoked_at': token_ref['revoked_at'],
+                 'seq': token_ref['revocation_seq']}
+                for token_ref in query]
+
+    def flush_expired_tokens(self, batch_size=None, progress=None):
+        if batch_size is None:
+            batch_size = CONF.token.flush_batch_size
+        now = timeutils.utcnow()
+        session = self.get_session()
 
-        session.flush()
+        if batch_size <= 0:
+            with session.begin():
+                query = session.query(TokenModel)
+                query = query.filter(TokenModel.expires < now)
+                flushed = query.delete(synchronize_session=False)
+            if progress is not None:
+                progress(flushed)
+            return flushed
+
+        # NOTE: delete in short transactions, walking the expires index, so
+        # that locks are only held for a batch at a time and token creation
+        # is not stalled by large flushes.
+        flushed = 0
+        while True:
+            with session.begin():
+                query = session.query(TokenModel.id)
+                query = query.filter(TokenModel.expires < now)
+                query = query.order_by(TokenModel.expires)
+                token_ids = [ref.id for ref in query.limit(batch_size)]
+                if token_ids:
+                    query = session.query(TokenModel)
+                    query = query.filter(TokenModel.id.in_(token_ids))
+                    query.delete(synchronize_session=False)
+            flushed += len(token_ids)
+            if progress is not None:
+                progress(flushed)
+            if len(token_ids) < batch_size:
+                return flushed
+            if CONF.token.flush_batch_interval > 0:
+                time.sleep(CONF.token.flush_batch_interval)
@@ -0,0 +1,346 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""SQL token driver storing the tokens in tables partitioned by expiry.
+
+Each partition is a table holding the tokens which expire within the same
+``partition_interval`` seconds, named after the start of that interval in
+UTC, e.g. ``token_201310181200``. Tokens are written to the partition of
+their expiry, reads probe the partitions which may still hold unexpired
+tokens in a single query, and flushing the expired tokens drops the
+partitions whose interval has passed instead of deleting rows one by one.
+
+Each process keeps its own list of the partitions. A partition is only
+dropped one interval after it has passed, when no process reads it any
+more, and a read which still hits a dropped partition is retried once
+after listing the partitions again.
+
+The partitions covering the token lifetime are created when first needed.
+``keystone-manage token_partition`` creates them in advance, so that no
+schema change happens while serving requests.
+
+"""
+
+import calendar
+import datetime
+import re
+import threading
+
+from keystone.common import sql
+from keystone import config
+from keystone import exception
+from keystone.openstack.common import log as logging
+from keystone.openstack.common import timeutils
+from keystone.token.backends import sql as token_sql
+
+
+CONF = config.CONF
+LOG = logging.getLogger(__name__)
+
+PARTITION_PREFIX = 'token_'
+PARTITION_TIME_FORMAT = '%Y%m%d%H%M'
+PARTITION_NAME_RE = re.compile(r'^%s\d{12}$' % PARTITION_PREFIX)
+
+
+def _union(queries):
+    if len(queries) == 1:
+        return queries[0]
+    return sql.union_all(*queries)
+
+
+class Token(token_sql.Token):
+    def __init__(self):
+        super(Token, self).__init__()
+        interval = CONF.token.partition_interval
+        # NOTE: partitions are named to the minute, shorter or unaligned
+        # intervals would give different partitions the same name.
+        if interval <= 0 or interval % 60:
+            raise ValueError(
+                _('Invalid token partition_interval: %s. It must be a '
+                  'positive multiple of 60 seconds.') % interval)
+        self._tables = {}
+        self._partitions = None
+        self._partitions_lock = threading.Lock()
+
+    def _partition_start(self, when):
+        seconds = calendar.timegm(when.utctimetuple())
+        return seconds - seconds % CONF.token.partition_interval
+
+    def _partition_name(self, when):
+        start = datetime.datetime.utcfromtimestamp(
+            self._partition_start(when))
+        return PARTITION_PREFIX + start.strftime(PARTITION_TIME_FORMAT)
+
+    def _get_table(self, name):
+        """Returns the table of a partition, built after the token table."""
+        table = self._tables.get(name)
+        if table is None:
+            token_table = token_sql.TokenModel.__table__
+            table = sql.Table(name, sql.MetaData(),
+                              *[column.copy()
+                                for column in token_table.columns])
+            for index in token_table.indexes:
+                sql.Index(index.name.replace('token', name, 1),
+                          *[table.c[column.name]
+                            for column in index.columns])
+            self._tables[name] = table
+        return table
+
+    def _list_partitions(self, refresh=False):
+        """Returns the names of the existing partitions, oldest first."""
+        with self._partitions_lock:
+            if self._partitions is None or refresh:
+                self._partitions = set(
+                    name for name in self.get_engine().table_names()
+                    if PARTITION_NAME_RE.match(name))
+            return sorted(self._partitions)
+
+    def _create_partitions(self, names):
+        """Creates the partitions which do not exist yet.
+
+        :returns: names of the created partitions
+        """
+        if set(names).issubset(self._list_partitions()):
+            return []
+        existing = set(self._list_partitions(refresh=True))
+        created = []
+        for name in names:
+            if name in existing:
+                continue
+            try:
+                self._get_table(name).create(bind=self.get_engine(),
+                                             checkfirst=True)
+                created.append(name)
+            except (sql.OperationalError, sql.ProgrammingError):
+                # NOTE: another process created it in the meantime.
+                LOG.debug(_('Token partition %s already exists.'), name)
+            with self._partitions_lock:
+                self._partitions.add(name)
+        return created
+
+    def _lifetime_partitions(self):
+        """Returns the names of the partitions covering the token lifetime,
+        from now on.
+        """
+        now = timeutils.utcnow()
+        lifetime = datetime.timedelta(seconds=CONF.token.expiration)
+        interval = datetime.timedelta(seconds=CONF.token.partition_interval)
+        names = []
+        when = now
+        while when <= now + lifetime + interval:
+            names.append(self._partition_name(when))
+            when += interval
+        return names
+
+    def _live_partitions(self):
+        """Returns the names of the partitions which may hold unexpired
+        tokens, creating the ones covering the token lifetime.
+        """
+        names = self._lifetime_partitions()
+        self._create_partitions(names)
+        # NOTE: tokens may have been given a longer lifetime than the
+        # current one, keep probing the partitions they were written to.
+        return [name for name in self._list_partitions()
+                if name >= names[0]]
+
+    def _retry_on_dropped_partition(self, fn, *args):
+        """Calls fn, which reads the live partitions, once more with the
+        partitions listed again if one of them was dropped in the meantime
+        by another process.
+        """
+        try:
+            return fn(*args)
+        except (sql.OperationalError, sql.ProgrammingError):
+            LOG.debug(_('Token partitions changed, listing them again.'))
+            self._list_partitions(refresh=True)
+            return fn(*args)
+
+    def _to_dict(self, row):
+        token_ref = token_sql.TokenModel(
+            **dict((column.name, row[column.name])
+                   for column in token_sql.TokenModel.__table__.columns))
+        return token_ref.to_dict()
+
+    def _find_token(self, session, token_id):
+        """Returns the partition and the row of a token, in one query."""
+        queries = []
+        for name in self._live_partitions():
+            table = self._get_table(name)
+            queries.append(sql.select([sql.literal(name).label('partition'),
+                                       table]).where(table.c.id == token_id))
+        row = session.execute(_union(queries)).first()
+        if row is None:
+            raise exception.TokenNotFound(token_id=token_id)
+        return row['partition'], row
+
+    # Public interface
+    def get_token(self, token_id):
+        if token_id is None:
+            raise exception.TokenNotFound(token_id=token_id)
+        session = self.get_session()
+        name, row = self._retry_on_dropped_partition(self._find_token,
+                                                     session, token_id)
+        if not row['valid']:
+            raise exception.TokenNotFound(token_id=token_id)
+        return self._to_dict(row)
+
+    def create_token(self, token_id, data):
+        token_ref = self._new_token_ref(data)
+        name = self._partition_name(token_ref.expires)
+        self._create_partitions([name])
+        values = dict((column.name, getattr(token_ref, column.name))
+                      for column in token_sql.TokenModel.__table__.columns)
+        session = self.get_session()
+        with session.begin():
+            session.execute(self._get_table(name).insert().values(**values))
+        return token_ref.to_dict()
+
+    def delete_token(self, token_id):
+        self._retry_on_dropped_partition(self._delete_token, token_id)
+
+    def _delete_token(self, token_id):
+        session = self.get_session()
+        with session.begin():
+            name, row = self._find_token(session, token_id)
+            if not row['valid']:
+                raise exception.TokenNotFound(token_id=token_id)
+            table = self._get_table(name)
+            seq = sql.next_sequence_value(session,
+                                          token_sql.REVOCATION_SEQUENCE)
+            session.execute(table.update().where(table.c.id == token_id)
+                            .values(valid=False,
+                                    revoked_at=timeutils.utcnow(),
+                                    revocation_seq=seq))
+
+    def delete_tokens(self, user_id, tenant_id=None, trust_id=None,
+                      consumer_id=None):
+        """Deletes all tokens in one session
+
+        The user_id will be ignored if the trust_id is specified. user_id
+        will always be specified.
+        If using a trust, the token's user_id is set to the trustee's user ID
+        or the trustor's user ID, so will use trust_id to query the tokens.
+
+        """
+        self._retry_on_dropped_partition(self._delete_tokens, user_id,
+                                         tenant_id, trust_id, consumer_id)
+
+    def _delete_tokens(self, user_id, tenant_id, trust_id, consumer_id):
+        session = self.get_session()
+        with session.begin():
+            now = timeutils.utcnow()
+            # NOTE: the tokens revoked together share a sequence number.
+            seq = sql.next_sequence_value(session,
+                                          token_sql.REVOCATION_SEQUENCE)
+            for name in self._live_partitions():
+                table = self._get_table(name)
+                query = table.update().values(valid=False, revoked_at=now,
+                                              revocation_seq=seq)
+                query = query.where(table.c.valid == True)  # noqa
+                query = query.where(table.c.expires > now)
+                if trust_id:
+                    query = query.where(table.c.trust_id == trust_id)
+                else:
+                    query = query.where(table.c.user_id == user_id)
+                if tenant_id:
+                    query = query.where(table.c.tenant_id == tenant_id)
+                if consumer_id:
+                    query = query.where(table.c.consumer_id == consumer_id)
+                session.execute(query)
+
+    def list_tokens(self, user_id, tenant_id=None, trust_id=None,
+                    consumer_id=None):
+        return self._retry_on_dropped_partition(self._list_tokens, user_id,
+                                                tenant_id, trust_id,
+                                                consumer_id)
+
+    def _list_tokens(self, user_id, tenant_id, trust_id, consumer_id):
+        now = timeutils.utcnow()
+        queries = []
+        for name in self._live_partitions():
+            table = self._get_table(name)
+            query = sql.select([table.c.id])
+            query = query.where(table.c.valid == True)  # noqa
+            query = query.where(table.c.expires > now)
+            if trust_id:
+                query = query.where(table.c.trust_id == trust_id)
+            else:
+                query = query.where(table.c.user_id == user_id)
+                if consumer_id:
+                    query = query.where(table.c.consumer_id == consumer_id)
+                elif tenant_id:
+                    query = query.where(table.c.tenant_id == tenant_id)
+            queries.append(query)
+        session = self.get_session()
+        return [row['id'] for row in session.execute(_union(queries))]
+
+    def _list_revoked_rows(self, since=None):
+        return self._retry_on_dropped_partition(self._list_revoked_partitions,
+                                                since)
+
+    def _list_revoked_partitions(self, since):
+        now = timeutils.utcnow()
+        queries = []
+        for name in self._live_partitions():
+            table = self._get_table(name)
+            query = sql.select([table.c.id, table.c.expires,
+                                table.c.revoked_at, table.c.revocation_seq])
+            query = query.where(table.c.valid == False)  # noqa
+            query = query.where(table.c.expires > now)
+            if since is not None:
+                query = query.where(table.c.revocation_seq > since)
+            queries.append(query)
+        session = self.get_session()
+        return session.execute(_union(queries)).fetchall()
+
+    def list_revoked_tokens(self):
+        return [{'id': row['id'], 'expires': row['expires']}
+                for row in self._list_revoked_rows()]
+
+    def list_revoked_tokens_since(self, since):
+        rows = sorted(self._list_revoked_rows(since),
+                      key=lambda row: row['revocation_seq'])
+        return [{'id': row['id'],
+                 'expires': row['expires'],
+                 'revoked_at': row['revoked_at'],
+                 'seq': row['revocation_seq']}
+                for row in rows]
+
+    def flush_expired_tokens(self, batch_size=None, progress=None):
+        # NOTE: a partition only holds expired tokens once its interval has
+        # passed, it is dropped as a whole; batch_size does not apply. The
+        # last passed partition is kept for one more interval, as the other
+        # processes may have listed it as live before it passed.
+        interval = datetime.timedelta(seconds=CONF.token.partition_interval)
+        kept = self._partition_name(timeutils.utcnow() - interval)
+        session = self.get_session()
+        flushed = 0
+        for name in self._list_partitions(refresh=True):
+            if name >= kept:
+                break
+            table = self._get_table(name)
+            flushed += session.execute(
+                sql.select([sql.func.count()]).select_from(table)).scalar()
+            table.drop(bind=self.get_engine(), checkfirst=True)
+            with self._partitions_lock:
+                self._partitions.discard(name)
+            if progress is not None:
+                progress(flushed)
+        return flushed
+
+    def create_partitions(self):
+        self._list_partitions(refresh=True)
+        return self._create_partitions(self._lifetime_partitions())
@@ -14,9 +14,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
-
-from keystone.common import cms
 from keystone.common import controller
 from keystone.common import dependency
 from keystone.common import wsgi
@@ -426,19 +423,26 @@ class Auth(controller.V2Controller):
 
     @controller.protected()
     def revocation_list(self, context, auth=None):
-        tokens = self.token_api.list_revoked_tokens()
-
-        for t in tokens:
-            expires = t['expires']
-            if not (expires and isinstance(expires, unicode)):
-                    t['expires'] = timeutils.isotime(expires)
-        data = {'revoked': tokens}
-        json_data = json.dumps(data)
-        signed_text = cms.cms_sign_text(json_data,
-                                        CONF.signing.certfile,
-                                        CONF.signing.keyfile)
-
-        return {'signed': signed_text}
+        """Returns the signed list of revoked tokens.
+
+        With a ``since`` query parameter, only the tokens revoked after that
+        marker are listed, along with the marker to pass as ``since`` on the
+        next request. Markers are revocation sequence numbers, ``0`` lists
+        every revocation.
+
+        """
+        since = context['query_string'].get('since')
+        if since is None:
+            return {'signed': self.token_api.get_signed_revocation_list()}
+
+        try:
+            since = int(since)
+        except ValueError:
+            since = -1
+        if since < 0:
+            raise exception.ValidationError(attribute='since',
+                                            target='query')
+        return {'signed': self.token_api.get_signed_revocations_since(since)}
 
     def endpoints(self, context, token_id):
         """Return a list of endpoints available to the token."""
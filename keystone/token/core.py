@@ -16,8 +16,12 @@
 
 """Main entry point into the Token service."""
 
+import collections
 import copy
 import datetime
+import json
+import threading
+import uuid
 
 from keystone.common import cache
 from keystone.common import cms
@@ -26,6 +30,7 @@ from keystone.common import manager
 from keystone import config
 from keystone import exception
 from keystone.openstack.common import log as logging
+from keystone.openstack.common import loopingcall
 from keystone.openstack.common import timeutils
 
 
@@ -91,6 +96,45 @@ def validate_auth_info(self, user_ref, tenant_ref):
             raise exception.Unauthorized(msg)
 
 
+class NotFoundCache(object):
+    """Remembers, in memory, the ids of the tokens which were not found.
+
+    Entries expire after ``[token] negative_cache_time`` seconds, and the
+    oldest entries are dropped beyond ``[token] negative_cache_size``
+    entries, so that a flood of unknown or invalid token ids is answered
+    without reaching the backend nor growing the memory of the process.
+
+    """
+
+    def __init__(self):
+        self._expires = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, token_id):
+        if CONF.token.negative_cache_time <= 0:
+            return
+        with self._lock:
+            self._expires.pop(token_id, None)
+            self._expires[token_id] = (timeutils.utcnow_ts() +
+                                       CONF.token.negative_cache_time)
+            while len(self._expires) > CONF.token.negative_cache_size:
+                self._expires.popitem(last=False)
+
+    def discard(self, token_id):
+        with self._lock:
+            self._expires.pop(token_id, None)
+
+    def __contains__(self, token_id):
+        with self._lock:
+            expires = self._expires.get(token_id)
+            if expires is None:
+                return False
+            if expires <= timeutils.utcnow_ts():
+                del self._expires[token_id]
+                return False
+            return True
+
+
 @dependency.requires('token_provider_api')
 @dependency.provider('token_api')
 class Manager(manager.Manager):
@@ -103,6 +147,7 @@ class Manager(manager.Manager):
 
     def __init__(self):
         super(Manager, self).__init__(CONF.token.driver)
+        self.not_found = NotFoundCache()
 
     def unique_id(self, token_id):
         """Return a unique ID for a token.
@@ -125,12 +170,19 @@ class Manager(manager.Manager):
 
     def get_token(self, token_id):
         unique_id = self.unique_id(token_id)
-        token_ref = self._get_token(unique_id)
-        # NOTE(morganfainberg): Lift expired checking to the manager, there is
-        # no reason to make the drivers implement this check. With caching,
-        # self._get_token could return an expired token. Make sure we behave
-        # as expected and raise TokenNotFound on those instances.
-        self._assert_valid(token_id, token_ref)
+        if unique_id in self.not_found:
+            raise exception.TokenNotFound(token_id=token_id)
+        try:
+            token_ref = self._get_token(unique_id)
+            # NOTE(morganfainberg): Lift expired checking to the manager,
+            # there is no reason to make the drivers implement this check.
+            # With caching, self._get_token could return an expired token.
+            # Make sure we behave as expected and raise TokenNotFound on
+            # those instances.
+            self._assert_valid(token_id, token_ref)
+        except exception.TokenNotFound:
+            self.not_found.add(unique_id)
+            raise
         return token_ref
 
     @cache.on_arguments(should_cache_fn=SHOULD_CACHE,
@@ -144,6 +196,7 @@ class Manager(manager.Manager):
         data_copy = copy.deepcopy(data)
         data_copy['id'] = unique_id
         ret = self.driver.create_token(unique_id, data_copy)
+        self.not_found.discard(unique_id)
         if SHOULD_CACHE(ret):
             # NOTE(morganfainberg): when doing a cache set, you must pass the
             # same arguments through, the same as invalidate (this includes
@@ -177,6 +230,109 @@ class Manager(manager.Manager):
         # invalidate() because of the way the invalidation method works on
         # determining cache-keys.
         self.list_revoked_tokens.invalidate(self)
+        self.get_revocation_list_version.invalidate(self)
+
+    @cache.on_arguments(should_cache_fn=SHOULD_CACHE,
+                        expiration_time=CONF.token.revocation_cache_time)
+    def get_revocation_list_version(self):
+        """Returns a stamp which changes whenever a token is revoked."""
+        return uuid.uuid4().hex
+
+    def get_signed_revocation_list(self):
+        """Returns the revocation list, signed for the auth_token middleware.
+
+        The signed list is cached along with the revocation version it was
+        built from, and only signed again once the version has changed and at
+        least ``[token] revocation_sign_interval`` seconds have passed since
+        the previous signature.
+
+        """
+        version = self.get_revocation_list_version()
+        signed_ref = self._get_signed_revocation_list()
+        if signed_ref is not None and signed_ref['version'] != version:
+            interval = datetime.timedelta(
+                seconds=CONF.token.revocation_sign_interval)
+            if timeutils.utcnow() - signed_ref['signed_at'] >= interval:
+                signed_ref = None
+
+        if signed_ref is None:
+            signed_ref = self._sign_revocation_list(version)
+            if SHOULD_CACHE(signed_ref):
+                self._get_signed_revocation_list.set(signed_ref, self)
+        return signed_ref['signed']
+
+    @cache.on_arguments(should_cache_fn=SHOULD_CACHE,
+                        expiration_time=CONF.token.revocation_cache_time)
+    def _get_signed_revocation_list(self):
+        # NOTE: the signed list is set by get_signed_revocation_list, so that
+        # it is signed at most once per call when caching is disabled.
+        return None
+
+    def get_signed_revocations_since(self, since):
+        """Returns the tokens revoked after a marker, signed.
+
+        Along with the revoked tokens, the signed document holds the marker
+        to pass as ``since`` to get the following revocations. Markers are
+        revocation sequence numbers rather than times, the clocks of the
+        nodes revoking tokens and the order their revocations are committed
+        in do not agree.
+
+        :param since: revocation sequence number of the last revocation
+                      already known, 0 for all of them
+        """
+        tokens = self._format_revoked_tokens(
+            self.driver.list_revoked_tokens_since(since))
+        if tokens:
+            marker = tokens[-1]['seq']
+        else:
+            marker = since
+        data = {'revoked': tokens, 'next': marker}
+        return cms.cms_sign_text(json.dumps(data),
+                                 CONF.signing.certfile,
+                                 CONF.signing.keyfile)
+
+    def _format_revoked_tokens(self, tokens):
+        tokens = copy.deepcopy(tokens)
+        for t in tokens:
+            expires = t['expires']
+            if not (expires and isinstance(expires, unicode)):
+                t['expires'] = timeutils.isotime(expires)
+            revoked_at = t.get('revoked_at')
+            if revoked_at and not isinstance(revoked_at, basestring):
+                t['revoked_at'] = timeutils.isotime(revoked_at)
+        return tokens
+
+    def _sign_revocation_list(self, version):
+        tokens = self._format_revoked_tokens(self.list_revoked_tokens())
+        data = {'revoked': tokens}
+        signed_text = cms.cms_sign_text(json.dumps(data),
+                                        CONF.signing.certfile,
+                                        CONF.signing.keyfile)
+        return {'version': version,
+                'signed_at': timeutils.utcnow(),
+                'signed': signed_text}
+
+    def start_flush_timer(self, interval):
+        """Flush the expired tokens every interval seconds, in a green thread.
+
+        :returns: the looping call, which may be stopped
+        """
+        timer = loopingcall.FixedIntervalLoopingCall(self._flush_on_interval)
+        timer.start(interval=interval, initial_delay=interval)
+        return timer
+
+    def _flush_on_interval(self):
+        try:
+            flushed = self.driver.flush_expired_tokens()
+        except exception.NotImplemented:
+            LOG.warning(_('The token backend cannot flush expired tokens, '
+                          'the periodic flush is stopped.'))
+            raise loopingcall.LoopingCallDone()
+        except Exception:
+            # NOTE: keep flushing at the next interval.
+            LOG.exception(_('Failed to flush expired tokens.'))
+        else:
+            LOG.info(_('Flushed %d expired tokens.'), flushed)
 
     def _invalidate_individual_token_cache(self, token_id):
         # NOTE(morganfainberg): invalidate takes the exact same arguments as
@@ -309,7 +465,42 @@ class Driver(object):
         """
         raise exception.NotImplemented()
 
-    def flush_expired_tokens(self):
+    def list_revoked_tokens_since(self, since):
+        """Returns the unexpired tokens revoked after a marker.
+
+        Each revocation is given a sequence number, greater than the ones of
+        the revocations visible by then.
+
+        :param since: revocation sequence number of the last revocation
+                      already known, 0 for all of them
+        :returns: list of dicts with the ``id``, ``expires``, ``revoked_at``
+                  and revocation sequence number ``seq`` of the tokens,
+                  in sequence order
+
+        """
+        raise exception.NotImplemented()
+
+    def create_partitions(self):
+        """Create the storage of the tokens expiring within the token
+        lifetime ahead of time.
+
+        Only implemented by the backends partitioning the tokens by expiry.
+
+        :returns: names of the created partitions
+
+        """
+        raise exception.NotImplemented()
+
+    def flush_expired_tokens(self, batch_size=None, progress=None):
         """Archive or delete tokens that have expired.
+
+        :param batch_size: maximum number of tokens deleted at once, when
+                           the backend supports it; defaults to
+                           ``[token] flush_batch_size``, 0 deletes all the
+                           expired tokens at once.
+        :param progress: optional callable, given the number of tokens
+                         flushed so far after each batch.
+        :returns: number of flushed tokens
+
         """
         raise exception.NotImplemented()
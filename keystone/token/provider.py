@@ -129,6 +129,33 @@ class Manager(manager.Manager):
         self._is_valid_token(token)
         return token
 
+    def validate_tokens(self, token_ids):
+        """Validate a batch of tokens of any version.
+
+        The cached token data is looked up in a single round trip to the
+        cache backend, the tokens which are not cached are validated one by
+        one and cached as validate_token does.
+
+        :param token_ids: identities of the tokens
+        :returns: list of token data matching token_ids, None for the tokens
+                  which are not valid
+        """
+        # NOTE(morganfainberg): Ensure we never use the long-form token_id
+        # (PKI) as part of the cache_key.
+        unique_ids = [self.token_api.unique_id(token_id)
+                      for token_id in token_ids]
+        tokens = self._validate_token.get_multi(
+            [(self, unique_id) for unique_id in unique_ids])
+        for i, unique_id in enumerate(unique_ids):
+            try:
+                if tokens[i] is cache.NO_VALUE:
+                    tokens[i] = self._validate_token(unique_id)
+                self._is_valid_token(tokens[i])
+            except (exception.TokenNotFound, exception.Unauthorized,
+                    UnsupportedTokenVersionException):
+                tokens[i] = None
+        return tokens
+
     def check_v2_token(self, token_id, belongs_to=None):
         """Check the validity of the given V2 token.
 
@@ -31,6 +31,7 @@ function usage {
   echo "  -8, --8                  Just run flake8, don't show PEP8 text for each error"
   echo "  -P, --no-pep8            Don't run flake8"
   echo "  -c, --coverage           Generate coverage report"
+  echo "  -b, --benchmark          Just run the quota benchmarks, writing JSON results to quota_benchmark.json"
   echo "  -h, --help               Print this usage message"
   echo ""
   echo "Note: with no options specified, the script will try to run the tests in a virtual environment,"
@@ -52,6 +53,7 @@ function process_option {
     -8|--8) short_flake8=1;;
     -P|--no-pep8) no_flake8=1;;
     -c|--coverage) coverage=1;;
+    -b|--benchmark) just_benchmark=1;;
     -*) testropts="$testropts $1";;
     *) testrargs="$testrargs $1"
   esac
@@ -69,6 +71,7 @@ just_flake8=0
 short_flake8=0
 no_flake8=0
 coverage=0
+just_benchmark=0
 recreate_db=1
 update=0
 
@@ -99,6 +102,12 @@ function run_tests {
       ${wrapper} tools/colorizer.py
 }
 
+function run_benchmark {
+  echo "Running quota benchmarks ..."
+  ${wrapper} python -m keystone.tests._quota_benchmark --output quota_benchmark.json
+  echo "Results written to quota_benchmark.json"
+}
+
 function run_flake8 {
   FLAGS=--show-pep8
   if [ $# -gt 0 ] && [ 'short' == ''$1 ]
@@ -162,6 +171,11 @@ if [ $short_flake8 -eq 1 ]; then
      exit
 fi
 
+if [ $just_benchmark -eq 1 ]; then
+    run_benchmark
+    exit
+fi
+
 
 if [ $recreate_db -eq 1 ]; then
     cleanup_test_db